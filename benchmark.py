@@ -0,0 +1,464 @@
+"""
+Benchmark suite for the recommendation pipeline.
+
+Generates (or reads) a Book-Crossing-shaped dataset, times
+DataPreprocessor.process_all and the fit of every recommender, then measures
+per-query latency of each public recommendation method on a deterministic
+sample of queries. Results are written as JSON; pass a previous result file
+as --baseline to report regressions. --compare-precision also fits the models
+in the other floating-point precision and reports their memory, speed and
+top-10 ranking drift.
+
+Example:
+    python benchmark.py --ratings 100000 --output bench.json
+    python benchmark.py --ratings 100000 --output bench-new.json --baseline bench.json
+    python benchmark.py --ratings 100000 --precision float64 --compare-precision
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import DataPreprocessor
+from content_based import ContentBasedRecommender
+from collaborative_filtering import CollaborativeFilteringRecommender
+from popularity_based import PopularityRecommender
+from demographic_based import DemographicRecommender
+from hybrid_recommender import HybridRecommender
+from instrumentation import collect_fit_stages
+from precision import PRECISIONS, float_dtype, set_precision
+from synthetic_data import generate_dataset, write_dataset
+
+# The guest engine lives with the backend
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'website', 'backend'))
+
+
+def _quiet(verbose):
+    """Silence the recommenders' progress output unless verbose."""
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def time_call(fn, *args, verbose=False, **kwargs):
+    """Call fn and return (seconds, result)."""
+    with _quiet(verbose):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        return time.perf_counter() - started, result
+
+
+def latency_stats(seconds):
+    """Summarise per-query latencies in milliseconds."""
+    ms = np.asarray(seconds) * 1000
+    return {
+        'queries': len(ms),
+        'mean_ms': float(ms.mean()),
+        'median_ms': float(np.median(ms)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'min_ms': float(ms.min()),
+        'max_ms': float(ms.max()),
+    }
+
+
+def environment():
+    """Describe the machine and library versions the benchmark ran with."""
+    import scipy
+    import sklearn
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'scipy': scipy.__version__,
+        'sklearn': sklearn.__version__,
+        'git_commit': commit or None,
+    }
+
+
+def benchmark_fit(paths, max_content_books, verbose=False):
+    """
+    Time preprocessing and the fit of every recommender.
+
+    Returns:
+    --------
+    tuple
+        (fit results dict, dict of fitted models keyed by name)
+    """
+    fit = {}
+    models = {}
+    with collect_fit_stages() as stages:
+        preprocessor = DataPreprocessor(paths['books'], paths['ratings'], paths['users'])
+        fit['process_all'], _ = time_call(preprocessor.process_all, verbose=verbose)
+        books = preprocessor.books_processed
+        models['preprocessor'] = preprocessor
+
+        if len(books) <= max_content_books:
+            content = ContentBasedRecommender(books)
+            fit['content_based'], models['content'] = time_call(content.fit, verbose=verbose)
+        else:
+            print(f"Skipping content-based fit: {len(books)} books exceed --max-content-books "
+                  f"({max_content_books}); its similarity matrix is dense")
+
+        collaborative = CollaborativeFilteringRecommender(preprocessor.ratings_processed, books)
+        fit['collaborative_filtering'], models['collaborative'] = time_call(
+            collaborative.fit, min_user_ratings=10, min_book_ratings=5, verbose=verbose)
+
+        popularity = PopularityRecommender(preprocessor.ratings_processed, books)
+        fit['popularity_based'], models['popularity'] = time_call(popularity.fit, verbose=verbose)
+
+        demographic = DemographicRecommender(preprocessor.ratings_processed, books, preprocessor.users_processed)
+        fit['demographic'], models['demographic'] = time_call(demographic.fit, verbose=verbose)
+
+        hybrid = HybridRecommender(models.get('content'), collaborative, popularity, books)
+        fit['hybrid'], models['hybrid'] = time_call(hybrid.fit, verbose=verbose)
+
+        try:
+            from guest_recommendation import GuestRecommendationEngine
+            fit['guest'], models['guest'] = time_call(
+                GuestRecommendationEngine, preprocessor.ratings_processed, books,
+                preprocessor.users_processed, verbose=verbose)
+        except ImportError as e:
+            print(f"Skipping guest recommendation engine: {e}")
+
+    return {'seconds': fit, 'stages': dict(stages)}, models
+
+
+def sample_queries(models, n_queries, seed):
+    """Pick a deterministic sample of users, books, years and publishers to query."""
+    rng = np.random.default_rng(seed)
+    preprocessor = models['preprocessor']
+    collaborative = models['collaborative']
+
+    def pick(values):
+        values = pd.unique(pd.Series(values).dropna())
+        if len(values) == 0:
+            return []
+        return list(values[rng.choice(len(values), min(n_queries, len(values)), replace=False)])
+
+    books = preprocessor.books_processed
+    isbns = pick(books['ISBN'])
+    sampled = books.set_index('ISBN').loc[isbns]
+    popularity_df = models['popularity'].popularity_df
+    users = pick(collaborative.user_item_matrix.index)
+    return {
+        'isbn': isbns,
+        'title': list(sampled['Book-Title']),
+        'author': list(sampled['Book-Author']),
+        'user': users,
+        'cf_isbn': pick(collaborative.item_user_matrix.index),
+        'year': pick(popularity_df['Year-Of-Publication']),
+        'publisher': pick(popularity_df['Publisher']),
+        'demographic_user': pick(preprocessor.users_processed['User-ID']),
+        'guest': [dict(collaborative.rated_items(user).head(5).astype(int)) for user in users],
+    }
+
+
+def query_methods(models):
+    """(name, query kind, function of one query) for each public recommendation method."""
+    content = models.get('content')
+    collaborative = models['collaborative']
+    popularity = models['popularity']
+    demographic = models['demographic']
+    hybrid = models['hybrid']
+    guest = models.get('guest')
+
+    methods = []
+    if content is not None:
+        methods += [
+            ('content.get_recommendations', 'isbn', lambda q: content.get_recommendations(q)),
+            ('content.get_recommendations_by_title', 'title', lambda q: content.get_recommendations_by_title(q)),
+            ('content.get_recommendations_by_author', 'author', lambda q: content.get_recommendations_by_author(q)),
+            ('content.get_similar_books_hybrid', 'isbn', lambda q: content.get_similar_books_hybrid(q)),
+        ]
+    methods += [
+        ('collaborative.user_based_recommendations', 'user', lambda q: collaborative.user_based_recommendations(q)),
+        ('collaborative.item_based_recommendations', 'user', lambda q: collaborative.item_based_recommendations(q)),
+        ('collaborative.hybrid_recommendations', 'user', lambda q: collaborative.hybrid_recommendations(q)),
+        ('collaborative.get_recommendations_for_book', 'cf_isbn',
+         lambda q: collaborative.get_recommendations_for_book(q)),
+        ('popularity.recommend', None, lambda q: popularity.recommend()),
+        ('popularity.recommend_by_year', 'year', lambda q: popularity.recommend_by_year(q)),
+        ('popularity.recommend_by_publisher', 'publisher', lambda q: popularity.recommend_by_publisher(q)),
+        ('popularity.get_trending_by_decade', None, lambda q: popularity.get_trending_by_decade()),
+        ('demographic.recommend_for_user', 'demographic_user', lambda q: demographic.recommend_for_user(q)),
+        ('hybrid.recommend[user]', 'user', lambda q: hybrid.recommend(user_id=q)),
+    ]
+    if content is not None:
+        methods.append(('hybrid.recommend[isbn]', 'isbn', lambda q: hybrid.recommend(isbn=q)))
+    if guest is not None:
+        methods.append(('guest.get_recommendations_for_guest', 'guest',
+                        lambda q: guest.get_recommendations_for_guest(q)))
+    return methods
+
+
+def batch_methods(models):
+    """(name, query kind, function of a query list) for each batched recommendation method."""
+    content = models.get('content')
+    collaborative = models['collaborative']
+    methods = [
+        ('collaborative.batch_user_based_recommendations', 'user',
+         lambda q: collaborative.batch_user_based_recommendations(q)),
+        ('collaborative.batch_item_based_recommendations', 'user',
+         lambda q: collaborative.batch_item_based_recommendations(q)),
+        ('collaborative.batch_hybrid_recommendations', 'user',
+         lambda q: collaborative.batch_hybrid_recommendations(q)),
+    ]
+    if content is not None:
+        methods.append(('content.get_recommendations_batch', 'isbn', lambda q: content.get_recommendations_batch(q)))
+    return methods
+
+
+def benchmark_queries(models, queries, n_queries, verbose=False):
+    """
+    Measure per-query latency of every recommendation method.
+
+    Returns:
+    --------
+    dict
+        Latency statistics keyed by method name; batch methods report the
+        amortised latency per query of one call with all sampled queries
+    """
+    results = {}
+    for name, kind, fn in query_methods(models):
+        samples = queries[kind] if kind else [None] * n_queries
+        if not samples:
+            continue
+        time_call(fn, samples[0], verbose=verbose)  # warm-up
+        seconds = [time_call(fn, query, verbose=verbose)[0] for query in samples]
+        results[name] = latency_stats(seconds)
+        print(f"{name:50s} median {results[name]['median_ms']:9.3f} ms")
+
+    for name, kind, fn in batch_methods(models):
+        samples = queries[kind]
+        if not samples:
+            continue
+        seconds, _ = time_call(fn, samples, verbose=verbose)
+        results[name] = {
+            'queries': len(samples),
+            'total_ms': seconds * 1000,
+            'per_query_ms': seconds * 1000 / len(samples),
+        }
+        print(f"{name:50s} {results[name]['per_query_ms']:9.3f} ms/query")
+    return results
+
+
+def _nbytes(*arrays):
+    return sum(getattr(array, 'nbytes', 0) for array in arrays if array is not None)
+
+
+def model_bytes(models):
+    """Bytes held by the fitted matrices of each model."""
+    sizes = {}
+    content = models.get('content')
+    if content is not None:
+        tfidf = content.tfidf_matrix
+        sizes['content'] = _nbytes(content.cosine_sim, tfidf.data, tfidf.indices, tfidf.indptr)
+    collaborative = models['collaborative']
+    sizes['collaborative'] = _nbytes(
+        collaborative.user_item_matrix.values, collaborative.user_means.values,
+        getattr(collaborative.user_similarity, 'values', collaborative.user_similarity),
+        getattr(collaborative.item_similarity, 'values', collaborative.item_similarity))
+    sizes['hybrid'] = _nbytes(models['hybrid'].popularity_scores)
+    guest = models.get('guest')
+    if guest is not None:
+        matrix = guest.user_vectors
+        sizes['guest'] = _nbytes(matrix.data, matrix.indices, matrix.indptr)
+    return sizes
+
+
+def ranking_drift(models, other_models, queries, n=10):
+    """
+    Compare the top-n rankings of two fitted model sets on the sampled queries.
+
+    Returns:
+    --------
+    dict
+        Per batched method: mean overlap of the top-n sets and the fraction of
+        queries whose top-n lists are identical, in order
+    """
+    drift = {}
+    other_methods = {name: fn for name, _, fn in batch_methods(other_models)}
+    for name, kind, fn in batch_methods(models):
+        samples = queries[kind]
+        if not samples or name not in other_methods:
+            continue
+        with _quiet(False):
+            results, other_results = fn(samples), other_methods[name](samples)
+        overlaps, identical = [], []
+        for query in samples:
+            top = list(results[query].index[:n])
+            other_top = list(other_results[query].index[:n])
+            if not top and not other_top:
+                continue
+            overlaps.append(len(set(top) & set(other_top)) / max(len(top), len(other_top)))
+            identical.append(top == other_top)
+        if overlaps:
+            drift[name] = {'queries': len(overlaps), f'overlap@{n}': float(np.mean(overlaps)),
+                           'identical': float(np.mean(identical))}
+    return drift
+
+
+def print_precision_comparison(comparison):
+    """Print model memory, fit time, query latency and ranking drift of two precisions."""
+    first, second = comparison['precisions']
+    print(f"\n{'precision comparison':65s} {first:>12s} {second:>12s} {'ratio':>7s}")
+    rows = [(f'bytes.{name}', comparison['model_bytes'][first][name] / 2 ** 20,
+             comparison['model_bytes'][second][name] / 2 ** 20, 'MB')
+            for name in comparison['model_bytes'][first]]
+    rows += [(f'fit.{name}', seconds, comparison['fit_seconds'][second].get(name), 's')
+             for name, seconds in comparison['fit_seconds'][first].items()]
+    for name, stats in comparison['queries'][first].items():
+        other = comparison['queries'][second].get(name, {})
+        rows.append((f'query.{name}', stats.get('median_ms', stats.get('per_query_ms')),
+                     other.get('median_ms', other.get('per_query_ms')), 'ms'))
+    for metric, value, other, unit in rows:
+        if other is None:
+            continue
+        ratio = other / value if value else float('nan')
+        print(f"{metric + ' (' + unit + ')':65s} {value:12.3f} {other:12.3f} {ratio:7.2f}")
+    print(f"\n{'top-10 drift':65s} {'overlap':>12s} {'identical':>12s}")
+    for name, stats in comparison['drift'].items():
+        print(f"{name:65s} {stats['overlap@10']:12.3f} {stats['identical']:12.3f}")
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline run.
+
+    Returns:
+    --------
+    list of tuple
+        (metric, baseline value, new value, ratio) for every metric slower
+        than threshold times its baseline
+    """
+    metrics = {}
+    for label, result in (('baseline', baseline), ('new', results)):
+        for name, seconds in result.get('fit', {}).get('seconds', {}).items():
+            metrics.setdefault(f'fit.{name}', {})[label] = seconds * 1000
+        for name, stats in result.get('queries', {}).items():
+            value = stats.get('median_ms', stats.get('per_query_ms'))
+            metrics.setdefault(f'query.{name}', {})[label] = value
+
+    regressions = []
+    print(f"\n{'metric':60s} {'baseline ms':>12s} {'new ms':>12s} {'ratio':>7s}")
+    for metric, values in metrics.items():
+        if 'baseline' not in values or 'new' not in values or not values['baseline']:
+            continue
+        ratio = values['new'] / values['baseline']
+        flag = '  REGRESSION' if ratio > threshold else ''
+        print(f"{metric:60s} {values['baseline']:12.3f} {values['new']:12.3f} {ratio:7.2f}{flag}")
+        if ratio > threshold:
+            regressions.append((metric, values['baseline'], values['new'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing, model fitting and query latency")
+    parser.add_argument('--data', help="Directory with Books.csv, Ratings.csv and Users.csv "
+                                       "(default: generate a synthetic dataset)")
+    parser.add_argument('--ratings', type=int, default=100000, help="Synthetic ratings to generate")
+    parser.add_argument('--books', type=int, default=None, help="Synthetic books (default: ratings / 4)")
+    parser.add_argument('--users', type=int, default=None, help="Synthetic users (default: ratings / 4)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the data generator and query sample")
+    parser.add_argument('--queries', type=int, default=20, help="Queries sampled per method")
+    parser.add_argument('--max-content-books', type=int, default=30000,
+                        help="Skip the content-based model above this many books")
+    parser.add_argument('--precision', choices=PRECISIONS, default=None,
+                        help="Floating-point precision of the models (default: BOOKBUD_PRECISION or float64)")
+    parser.add_argument('--compare-precision', action='store_true',
+                        help="Also fit the models in the other precision and report memory, speed and drift")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON result file")
+    parser.add_argument('--baseline', help="Previous JSON result file to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="Slowdown ratio against the baseline reported as a regression")
+    parser.add_argument('--verbose', action='store_true', help="Show the recommenders' progress output")
+    args = parser.parse_args(argv)
+    if args.precision:
+        set_precision(args.precision)
+    precision = float_dtype().name
+
+    results = {
+        'created_at': time.time(),
+        'environment': environment(),
+        'config': vars(args),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.data:
+            paths = {name: os.path.join(args.data, f'{name.title()}.csv') for name in ('books', 'ratings', 'users')}
+        else:
+            seconds, (books, ratings, users) = time_call(
+                generate_dataset, args.ratings, n_books=args.books, n_users=args.users, seed=args.seed)
+            paths = write_dataset(tmp, books, ratings, users)
+            results['generate_seconds'] = seconds
+            print(f"Generated {len(books)} books, {len(ratings)} ratings and {len(users)} users in {seconds:.1f}s")
+
+        results['fit'], models = benchmark_fit(paths, args.max_content_books, verbose=args.verbose)
+        if args.compare_precision:
+            other_precision = next(name for name in PRECISIONS if name != precision)
+            set_precision(other_precision)
+            try:
+                other_fit, other_models = benchmark_fit(paths, args.max_content_books, verbose=args.verbose)
+            finally:
+                set_precision(precision)
+    for name, seconds in results['fit']['seconds'].items():
+        print(f"fit {name:46s} {seconds:9.3f} s")
+
+    preprocessor = models['preprocessor']
+    collaborative = models['collaborative']
+    results['precision'] = precision
+    results['data'] = {
+        'books': len(preprocessor.books_df),
+        'ratings': len(preprocessor.ratings_df),
+        'users': len(preprocessor.users_df),
+        'ratings_processed': len(preprocessor.ratings_processed),
+        'cf_users': collaborative.user_item_matrix.shape[0],
+        'cf_books': collaborative.user_item_matrix.shape[1],
+    }
+
+    queries = sample_queries(models, args.queries, args.seed)
+    results['queries'] = benchmark_queries(models, queries, args.queries, verbose=args.verbose)
+
+    if args.compare_precision:
+        print(f"\nQuery latency with {other_precision} models:")
+        comparison = {
+            'precisions': [precision, other_precision],
+            'model_bytes': {precision: model_bytes(models), other_precision: model_bytes(other_models)},
+            'fit_seconds': {precision: results['fit']['seconds'], other_precision: other_fit['seconds']},
+            'queries': {precision: results['queries'],
+                        other_precision: benchmark_queries(other_models, queries, args.queries, verbose=args.verbose)},
+            'drift': ranking_drift(models, other_models, queries),
+        }
+        results['precision_comparison'] = comparison
+        print_precision_comparison(comparison)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"\nWrote results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.threshold:.2f}x")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
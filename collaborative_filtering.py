@@ -1,7 +1,10 @@
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 from scipy.sparse import csr_matrix
+from item_index import top_n_positions, scale_scores
+from precision import as_float, float_dtype
+from similarity import NeighbourStore, block_similarity, normalize_rows, row_means
+from instrumentation import fit_stage, timed_request_stage
 
 class CollaborativeFilteringRecommender:
     """
@@ -9,6 +12,10 @@ class CollaborativeFilteringRecommender:
     Implements both user-based and item-based collaborative filtering.
     """
     
+    # Normalised rating matrix behind each similarity metric (see normalize_matrices)
+    USER_METRICS = {'cosine': 'user_vectors', 'pearson': 'centered_user_vectors'}
+    ITEM_METRICS = {'cosine': 'item_vectors', 'adjusted_cosine': 'centered_item_vectors'}
+    
     def __init__(self, ratings_df, books_df):
         """
         Initialize the collaborative filtering recommender.
@@ -25,10 +32,22 @@ class CollaborativeFilteringRecommender:
         self.books_df = books_df
         self.user_item_matrix = None
         self.item_user_matrix = None
+        self.user_item_sparse = None
+        self.rated_sparse = None
         self.user_similarity = None
         self.item_similarity = None
+        self.abs_item_similarity = None
         self.user_means = None
-        
+        self.item_means = None
+        self.user_vectors = None
+        self.item_vectors = None
+        self.centered_ratings = None
+        self.centered_user_vectors = None
+        self.centered_item_vectors = None
+        self.books_by_isbn = None
+        self._aligned_index = None
+        
+    @fit_stage('pivot')
     def create_matrices(self, min_user_ratings=20, min_book_ratings=10):
         """
         Create item-user and user-item matrices for collaborative filtering.
@@ -61,71 +80,160 @@ class CollaborativeFilteringRecommender:
         
         print(f"Filtered ratings dataset contains {len(filtered_ratings)} ratings")
         
-        # Create the item-user matrix (books in rows, users in columns)
+        # Create the item-user matrix (books in rows, users in columns), in the
+        # model precision from the start so the pivot is never built in float64
         print("Creating item-user matrix with books as rows and users as columns...")
-        self.item_user_matrix = filtered_ratings.pivot(
+        self.item_user_matrix = filtered_ratings.astype({'Book-Rating': float_dtype()}).pivot(
             index='ISBN',
             columns='User-ID',
             values='Book-Rating'
         ).fillna(0)
         
-        # Create the user-item matrix (transpose of item-user matrix)
+        # Create the user-item matrix (transpose of item-user matrix), its sparse
+        # copy and which books each user rated, used by every scoring call
         self.user_item_matrix = self.item_user_matrix.T
+        self.user_item_sparse = csr_matrix(self.user_item_matrix.values)
+        self.rated_sparse = csr_matrix(self.user_item_sparse != 0, dtype=self.user_item_sparse.dtype)
+        self.user_means = self.item_means = None
+        self.user_vectors = self.item_vectors = None
+        self.centered_ratings = self.centered_user_vectors = self.centered_item_vectors = None
+        self._aligned_index = None
+        
+        # Details of the matrix's books (first row per ISBN), indexed by ISBN for lookups
+        books = self.books_df.drop_duplicates(subset=['ISBN'])
+        books = books[books['ISBN'].isin(self.user_item_matrix.columns)]
+        self.books_by_isbn = books.set_index(pd.Index(books['ISBN'].to_numpy()), drop=False)
         
         print(f"Created item-user matrix with shape {self.item_user_matrix.shape}")
         return self
     
-    def compute_user_similarity(self):
-        """Compute user-user similarity matrix."""
-        print("Computing user similarity...")
+    @fit_stage('normalize')
+    def normalize_matrices(self):
+        """
+        Store L2-normalised CSR copies of the rating matrices.
         
-        # Convert to sparse matrix for efficiency
-        user_item_sparse = csr_matrix(self.user_item_matrix.values)
+        user_vectors and item_vectors hold the ratings of each user and of
+        each book; centered_user_vectors and centered_item_vectors hold the
+        ratings minus the user's mean (Pearson correlation between users,
+        adjusted cosine between books). Any similarity is then a plain dot
+        product of stored rows, with no normalisation per call.
         
-        # Compute cosine similarity between users
-        self.user_similarity = cosine_similarity(user_item_sparse)
+        centered_ratings keeps the mean-centred ratings themselves (sparse,
+        not normalised) for the user-based predictions.
+        """
+        if self.user_means is None:
+            self.compute_user_means()
+        ratings = self.user_item_sparse
+        means = self.user_means.reindex(self.user_item_matrix.index).fillna(0).values.astype(ratings.dtype)
+        centered = ratings.copy()
+        centered.data -= np.repeat(means, np.diff(centered.indptr))
+        centered.eliminate_zeros()
+        
+        self.centered_ratings = centered
+        self.user_vectors = normalize_rows(ratings)
+        self.item_vectors = normalize_rows(ratings.T)
+        self.centered_user_vectors = normalize_rows(centered)
+        self.centered_item_vectors = normalize_rows(centered.T)
+        return self
+    
+    def _vectors(self, name):
+        """A normalised rating matrix (see normalize_matrices), built on first use."""
+        if self.user_vectors is None:
+            self.normalize_matrices()
+        return getattr(self, name)
+    
+    @fit_stage('user_similarity')
+    def compute_user_similarity(self, neighbours=None, metric='cosine', shrinkage=0.0, min_support=1):
+        """
+        Compute the user-user similarity matrix.
         
-        # Create DataFrame with user IDs as index and columns
-        self.user_similarity = pd.DataFrame(
-            self.user_similarity,
-            index=self.user_item_matrix.index,
-            columns=self.user_item_matrix.index
-        )
+        Parameters:
+        -----------
+        neighbours : int, optional
+            Keep only the top neighbours of each user in a NeighbourStore;
+            None computes the full similarity DataFrame
+        metric : str
+            'cosine' on the raw ratings or 'pearson' (mean-centred per user)
+        shrinkage : float
+            Shrink each similarity by n / (n + shrinkage), n being the number
+            of books both users rated (0 disables)
+        min_support : int
+            Drop pairs of users with fewer books rated in common
+        """
+        if metric not in self.USER_METRICS:
+            raise ValueError(f"Unknown user similarity metric: {metric} (expected one of {', '.join(self.USER_METRICS)})")
+        print(f"Computing user similarity ({metric})...")
+        
+        user_vectors = self._vectors(self.USER_METRICS[metric])
+        labels = self.user_item_matrix.index
+        # Co-ratings are counted on the raw ratings, whatever the metric
+        options = dict(normalized=True, shrinkage=shrinkage, min_support=min_support,
+                       support=self.user_item_sparse)
+        
+        if neighbours:
+            self.user_similarity = NeighbourStore.from_matrix(user_vectors, neighbours, index=labels, **options)
+        else:
+            # Create DataFrame with user IDs as index and columns, over the
+            # C-ordered array itself (no copy) so row slices stay contiguous
+            self.user_similarity = pd.DataFrame(block_similarity(user_vectors, **options),
+                                                index=labels, columns=labels, copy=False)
         
         print(f"Computed user similarity matrix with shape {self.user_similarity.shape}")
         return self
     
-    def compute_item_similarity(self):
-        """Compute item-item similarity matrix."""
-        print("Computing item similarity...")
-        
-        # Convert to sparse matrix for efficiency
-        item_user_sparse = csr_matrix(self.item_user_matrix.values)
-        
-        # Compute cosine similarity between items
-        self.item_similarity = cosine_similarity(item_user_sparse)
+    @fit_stage('item_similarity')
+    def compute_item_similarity(self, neighbours=None, metric='cosine', shrinkage=0.0, min_support=1):
+        """
+        Compute the item-item similarity matrix.
         
-        # Create DataFrame with ISBNs as index and columns
-        self.item_similarity = pd.DataFrame(
-            self.item_similarity,
-            index=self.item_user_matrix.index,
-            columns=self.item_user_matrix.index
-        )
+        Parameters:
+        -----------
+        neighbours : int, optional
+            Keep only the top neighbours of each item in a NeighbourStore;
+            None computes the full similarity DataFrame
+        metric : str
+            'cosine' on the raw ratings or 'adjusted_cosine' (ratings
+            centred by each user's mean)
+        shrinkage : float
+            Shrink each similarity by n / (n + shrinkage), n being the number
+            of users who rated both books (0 disables)
+        min_support : int
+            Drop pairs of books with fewer users in common
+        """
+        if metric not in self.ITEM_METRICS:
+            raise ValueError(f"Unknown item similarity metric: {metric} (expected one of {', '.join(self.ITEM_METRICS)})")
+        print(f"Computing item similarity ({metric})...")
+        
+        item_vectors = self._vectors(self.ITEM_METRICS[metric])
+        labels = self.item_user_matrix.index
+        # Co-ratings are counted on the raw ratings, whatever the metric
+        options = dict(normalized=True, shrinkage=shrinkage, min_support=min_support,
+                       support=self.user_item_sparse.T)
+        
+        if neighbours:
+            self.item_similarity = NeighbourStore.from_matrix(item_vectors, neighbours, index=labels, **options)
+        else:
+            # Create DataFrame with ISBNs as index and columns, over the C-ordered
+            # array itself (no copy), which sparse products read without copying
+            self.item_similarity = pd.DataFrame(block_similarity(item_vectors, **options),
+                                                index=labels, columns=labels, copy=False)
+        self.abs_item_similarity = self._absolute(self._item_similarity_values())
         
         print(f"Computed item similarity matrix with shape {self.item_similarity.shape}")
         return self
     
+    @fit_stage('user_means')
     def compute_user_means(self):
-        """Compute mean ratings for each user (for user-based CF with normalization)."""
-        # Replace zeros with NaN to compute mean of actual ratings
-        user_item_nonzero = self.user_item_matrix.replace(0, np.nan)
-        
-        # Compute mean rating for each user
-        self.user_means = user_item_nonzero.mean(axis=1)
+        """Compute mean ratings for each user and each book (for mean-centred CF)."""
+        # Means of the actual (non-zero) ratings from the sparse matrix, NaN without any
+        ratings = self.user_item_sparse
+        self.user_means = pd.Series(row_means(ratings), index=self.user_item_matrix.index)
+        self.item_means = pd.Series(row_means(ratings.T), index=self.user_item_matrix.columns)
         
         return self
     
-    def fit(self, min_user_ratings=20, min_book_ratings=10):
+    def fit(self, min_user_ratings=20, min_book_ratings=10, neighbours=None,
+            user_metric='cosine', item_metric='cosine', shrinkage=0.0, min_support=1):
         """
         Fit the collaborative filtering model.
         
@@ -135,11 +243,24 @@ class CollaborativeFilteringRecommender:
             Minimum number of ratings a user must have to be included
         min_book_ratings : int
             Minimum number of ratings a book must have to be included
+        neighbours : int, optional
+            Number of neighbours kept per user and per book (approximate,
+            sparse similarities); None keeps the exact dense matrices
+        user_metric : str
+            User similarity: 'cosine' or 'pearson'
+        item_metric : str
+            Item similarity: 'cosine' or 'adjusted_cosine'
+        shrinkage : float
+            Shrinkage of the similarities towards zero for pairs with few
+            co-ratings, n / (n + shrinkage) (0 disables)
+        min_support : int
+            Minimum number of co-ratings of a similar pair (smaller are pruned)
         """
         return (self.create_matrices(min_user_ratings, min_book_ratings)
-                .compute_user_similarity()
-                .compute_item_similarity()
-                .compute_user_means())
+                .compute_user_means()
+                .normalize_matrices()
+                .compute_user_similarity(neighbours, user_metric, shrinkage, min_support)
+                .compute_item_similarity(neighbours, item_metric, shrinkage, min_support))
     
     def user_based_recommendations(self, user_id, n=10, k=20):
         """
@@ -164,66 +285,11 @@ class CollaborativeFilteringRecommender:
             print(f"User with ID {user_id} not found in the dataset.")
             return pd.DataFrame()
         
-        # Get the user's ratings
-        user_ratings = self.user_item_matrix.loc[user_id]
-        
-        # Get the user's mean rating
-        user_mean = self.user_means.get(user_id, 0)
-        
-        # Get similarity scores for all users
-        user_similarities = self.user_similarity[user_id].drop(user_id)
-        
-        # Get top k similar users
-        similar_users = user_similarities.nlargest(k)
+        row = self.user_item_matrix.index.get_loc(user_id)
+        scores = self.user_based_scores([row], k=k)[0]
         
-        # Initialize dictionary to store predicted ratings
-        predicted_ratings = {}
-        
-        # Get books the user hasn't rated
-        unrated_books = user_ratings[user_ratings == 0].index
-        
-        # Calculate predicted ratings for each unrated book
-        for book in unrated_books:
-            # Get ratings for this book from similar users
-            book_ratings = self.user_item_matrix[book]
-            
-            # Calculate weighted average rating
-            numerator = 0
-            denominator = 0
-            
-            for sim_user, similarity in similar_users.items():
-                # Get the similar user's rating for this book
-                rating = book_ratings.get(sim_user, 0)
-                
-                # Skip if the similar user hasn't rated this book
-                if rating == 0:
-                    continue
-                
-                # Get the similar user's mean rating
-                sim_user_mean = self.user_means.get(sim_user, 0)
-                
-                # Add to weighted average (with normalization)
-                numerator += similarity * (rating - sim_user_mean)
-                denominator += abs(similarity)
-            
-            # Calculate predicted rating if we have data
-            if denominator > 0:
-                predicted_ratings[book] = user_mean + (numerator / denominator)
-        
-        # Sort books by predicted rating
-        sorted_predictions = sorted(predicted_ratings.items(), key=lambda x: x[1], reverse=True)
-        
-        # Get top n recommendations
-        top_recommendations = sorted_predictions[:n]
-        
-        # Get book details for recommendations
-        recommended_books = []
-        for isbn, _ in top_recommendations:
-            book_info = self.books_df[self.books_df['ISBN'] == isbn]
-            if not book_info.empty:
-                recommended_books.append(book_info.iloc[0])
-        
-        return pd.DataFrame(recommended_books)
+        top = top_n_positions(scores, n)
+        return self._book_details(self.user_item_matrix.columns[top])
     
     def item_based_recommendations(self, user_id, n=10):
         """
@@ -246,51 +312,185 @@ class CollaborativeFilteringRecommender:
             print(f"User with ID {user_id} not found in the dataset.")
             return pd.DataFrame()
         
-        # Get the user's ratings
-        user_ratings = self.user_item_matrix.loc[user_id]
+        row = self.user_item_matrix.index.get_loc(user_id)
+        scores = self.item_based_scores([row])[0]
         
-        # Get books the user has rated
-        rated_books = user_ratings[user_ratings > 0]
-        
-        # Get books the user hasn't rated
-        unrated_books = user_ratings[user_ratings == 0].index
+        top = top_n_positions(scores, n)
+        return self._book_details(self.user_item_matrix.columns[top])
+    
+    def _dtype(self):
+        """Floating-point dtype of the fitted rating matrix."""
+        return self.user_item_matrix.values.dtype
+    
+    def _item_similarity_values(self):
+        """The item similarities as an array (dense) or CSR matrix (NeighbourStore)."""
+        if isinstance(self.item_similarity, NeighbourStore):
+            return self.item_similarity.matrix
+        return self.item_similarity.values
+    
+    @staticmethod
+    def _absolute(similarity):
+        """abs() of a similarity array or CSR matrix, or None when no similarity is negative."""
+        values = similarity.data if isinstance(similarity, csr_matrix) else similarity
+        if values.size == 0 or values.min() >= 0:
+            return None
+        return abs(similarity)
+    
+    def _user_rows(self, user_ids):
+        """Map user IDs to rows of the user-item matrix (-1 for unknown users)."""
+        return self.user_item_matrix.index.get_indexer(pd.Index(list(user_ids)))
+    
+    def _batch_result(self, user_ids, rows, scores, n):
+        """Turn a score matrix into {user_id: Series of top-n scores indexed by ISBN}."""
+        isbns = self.user_item_matrix.columns
+        results = {}
+        for user_id, row, user_scores in zip(user_ids, rows, scores):
+            if row < 0:
+                results[user_id] = pd.Series(dtype=float)
+                continue
+            top = top_n_positions(user_scores, n)
+            results[user_id] = pd.Series(user_scores[top], index=isbns[top])
+        return results
+    
+    @timed_request_stage('scoring')
+    def user_based_scores(self, rows, k=20):
+        """
+        Predict ratings of every book for a batch of users with user-based CF.
         
-        # Initialize dictionary to store predicted ratings
-        predicted_ratings = {}
+        Uses the same mean-centred, similarity-weighted prediction as
+        user_based_recommendations, computed for all users with one product
+        of a sparse neighbour-weight matrix and the sparse centred ratings.
         
-        # Calculate predicted ratings for each unrated book
-        for unrated_book in unrated_books:
-            # Initialize variables for weighted average
-            weighted_sum = 0
-            similarity_sum = 0
-            
-            # Calculate similarity-weighted average of the user's ratings
-            for rated_book, rating in rated_books.items():
-                # Get similarity between the rated book and the unrated book
-                similarity = self.item_similarity.loc[rated_book, unrated_book]
-                
-                # Add to weighted sum
-                weighted_sum += similarity * rating
-                similarity_sum += abs(similarity)
+        Parameters:
+        -----------
+        rows : array-like of int
+            Rows of the user-item matrix to score
+        k : int
+            Number of similar users to consider
             
-            # Calculate predicted rating if we have data
-            if similarity_sum > 0:
-                predicted_ratings[unrated_book] = weighted_sum / similarity_sum
+        Returns:
+        --------
+        numpy.ndarray
+            Array of shape (len(rows), n_books) with predicted ratings;
+            NaN for books the user has rated or that no neighbour has rated
+        """
+        rows = np.asarray(rows)
+        ratings = self.user_item_matrix.values
+        n_users = ratings.shape[0]
+        k = min(k, n_users - 1)
+        if len(rows) == 0 or k <= 0:
+            return np.full((len(rows), ratings.shape[1]), np.nan, dtype=ratings.dtype)
+        
+        # Top-k neighbours of each user, excluding the user itself
+        if isinstance(self.user_similarity, NeighbourStore):
+            similarities = self.user_similarity[rows]
+        else:
+            similarities = self.user_similarity.values[rows]
+        similarities[np.arange(len(rows)), rows] = -np.inf
+        neighbours = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        weights = np.take_along_axis(similarities, neighbours, axis=1)
+        weight_matrix = csr_matrix(
+            (weights.ravel(), (np.repeat(np.arange(len(rows)), k), neighbours.ravel())),
+            shape=(len(rows), n_users)
+        )
         
-        # Sort books by predicted rating
-        sorted_predictions = sorted(predicted_ratings.items(), key=lambda x: x[1], reverse=True)
+        numerator = (weight_matrix @ self.centered_ratings).toarray()
+        denominator = (abs(weight_matrix) @ self.rated_sparse).toarray()
         
-        # Get top n recommendations
-        top_recommendations = sorted_predictions[:n]
+        means = self.user_means.reindex(self.user_item_matrix.index).fillna(0).values[rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            predictions = means[:, None] + numerator / denominator
+        predictions[denominator <= 0] = np.nan
+        predictions[self.rated_sparse[rows].nonzero()] = np.nan
+        return predictions
+    
+    @timed_request_stage('scoring')
+    def item_based_scores(self, rows):
+        """
+        Predict ratings of every book for a batch of users with item-based CF.
         
-        # Get book details for recommendations
-        recommended_books = []
-        for isbn, _ in top_recommendations:
-            book_info = self.books_df[self.books_df['ISBN'] == isbn]
-            if not book_info.empty:
-                recommended_books.append(book_info.iloc[0])
+        Uses the same similarity-weighted average as item_based_recommendations,
+        computed for all users with one product against the item similarity matrix.
         
-        return pd.DataFrame(recommended_books)
+        Parameters:
+        -----------
+        rows : array-like of int
+            Rows of the user-item matrix to score
+            
+        Returns:
+        --------
+        numpy.ndarray
+            Array of shape (len(rows), n_books) with predicted ratings;
+            NaN for books the user has rated or that cannot be predicted
+        """
+        rows = np.asarray(rows)
+        user_ratings = self.user_item_sparse[rows]
+        rated = self.rated_sparse[rows]
+        similarity = self._item_similarity_values()
+        # Both stored at fit; the absolute similarities only when some are negative
+        absolute = similarity if self.abs_item_similarity is None else self.abs_item_similarity
+        
+        if isinstance(self.item_similarity, NeighbourStore):
+            # Each book is predicted from its own stored neighbours only
+            numerator = (similarity @ user_ratings.T).T.toarray()
+            denominator = (absolute @ rated.T).T.toarray()
+        else:
+            # Sparse rows times the dense similarities read only the rated books' rows
+            numerator = np.asarray(user_ratings @ similarity)
+            denominator = np.asarray(rated @ absolute)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            predictions = numerator / denominator
+        predictions[denominator <= 0] = np.nan
+        predictions[rated.nonzero()] = np.nan
+        return predictions
+    
+    def batch_user_based_recommendations(self, user_ids, n=10, k=20):
+        """
+        Generate user-based recommendations for many users at once.
+        
+        Parameters:
+        -----------
+        user_ids : list
+            IDs of the users to get recommendations for
+        n : int
+            Number of recommendations per user
+        k : int
+            Number of similar users to consider
+            
+        Returns:
+        --------
+        dict
+            Maps each user ID to a pandas.Series of predicted ratings indexed
+            by ISBN, best first (empty for unknown users)
+        """
+        rows = self._user_rows(user_ids)
+        scores = np.full((len(rows), self.user_item_matrix.shape[1]), np.nan, dtype=self._dtype())
+        known = rows >= 0
+        scores[known] = self.user_based_scores(rows[known], k=k)
+        return self._batch_result(user_ids, rows, scores, n)
+    
+    def batch_item_based_recommendations(self, user_ids, n=10):
+        """
+        Generate item-based recommendations for many users at once.
+        
+        Parameters:
+        -----------
+        user_ids : list
+            IDs of the users to get recommendations for
+        n : int
+            Number of recommendations per user
+            
+        Returns:
+        --------
+        dict
+            Maps each user ID to a pandas.Series of predicted ratings indexed
+            by ISBN, best first (empty for unknown users)
+        """
+        rows = self._user_rows(user_ids)
+        scores = np.full((len(rows), self.user_item_matrix.shape[1]), np.nan, dtype=self._dtype())
+        known = rows >= 0
+        scores[known] = self.item_based_scores(rows[known])
+        return self._batch_result(user_ids, rows, scores, n)
     
     def get_recommendations_for_book(self, book_isbn, n=10):
         """
@@ -313,8 +513,11 @@ class CollaborativeFilteringRecommender:
             print(f"Book with ISBN {book_isbn} not found in the dataset.")
             return pd.DataFrame()
         
-        # Get similarity scores for all books
-        book_similarities = self.item_similarity[book_isbn].drop(book_isbn)
+        # Get similarity scores for all books (only the stored neighbours of a NeighbourStore)
+        if isinstance(self.item_similarity, NeighbourStore):
+            book_similarities = self.item_similarity.loc(book_isbn).drop(book_isbn, errors='ignore')
+        else:
+            book_similarities = self.item_similarity[book_isbn].drop(book_isbn)
         
         # Get top n similar books
         similar_books = book_similarities.nlargest(n)
@@ -328,7 +531,79 @@ class CollaborativeFilteringRecommender:
         
         return pd.DataFrame(recommended_books)
     
-    def hybrid_recommendations(self, user_id, n=10, user_weight=0.5, item_weight=0.5):
+    @timed_request_stage('hydration')
+    def _book_details(self, isbns):
+        """Look up book details for a list of ISBNs, keeping their order."""
+        isbns = pd.Index(isbns)
+        # Books missing from books_df are skipped (reindexing them would turn integer columns into floats)
+        return self.books_by_isbn.reindex(isbns[isbns.isin(self.books_by_isbn.index)])
+    
+    def hybrid_scores(self, rows, user_weight=0.5, item_weight=0.5, content_scores=None,
+                      content_weight=0.0, popularity_scores=None, popularity_weight=0.0, k=20):
+        """
+        Blend user-based, item-based and optional content and popularity scores.
+        
+        Every component is a score vector over the books of the user-item
+        matrix, min-max scaled to [0, 1] per user. The hybrid score is the
+        weighted mean of the components available for each book, so a book
+        predicted by only one component is still ranked.
+        
+        Parameters:
+        -----------
+        rows : array-like of int
+            Rows of the user-item matrix to score
+        user_weight, item_weight : float
+            Weights of the user-based and item-based predictions
+        content_scores : pandas.Series or numpy.ndarray, optional
+            Content scores indexed by ISBN, or an array of shape
+            (len(rows), n_books) aligned with the user-item matrix columns
+        content_weight : float
+            Weight of the content scores
+        popularity_scores : pandas.Series, optional
+            Popularity scores indexed by ISBN (e.g. popularity_df's popularity_score)
+        popularity_weight : float
+            Weight of the popularity scores
+        k : int
+            Number of similar users for the user-based component
+            
+        Returns:
+        --------
+        numpy.ndarray
+            Array of shape (len(rows), n_books); NaN for books the user has
+            rated or that no component scores
+        """
+        rows = np.asarray(rows)
+        isbns = self.user_item_matrix.columns
+        n_books = len(isbns)
+        components = []
+        if user_weight:
+            components.append((user_weight, self.user_based_scores(rows, k=k)))
+        if item_weight:
+            components.append((item_weight, self.item_based_scores(rows)))
+        for weight, scores in ((content_weight, content_scores), (popularity_weight, popularity_scores)):
+            if not weight or scores is None:
+                continue
+            if isinstance(scores, pd.Series):
+                scores = scores.groupby(level=0).max().reindex(isbns).values
+            scores = np.broadcast_to(as_float(scores), (len(rows), n_books))
+            components.append((weight, scores))
+        
+        weighted_sum = np.zeros((len(rows), n_books), dtype=self._dtype())
+        weight_sum = np.zeros((len(rows), n_books), dtype=self._dtype())
+        for weight, scores in components:
+            available = ~np.isnan(scores)
+            weighted_sum += weight * np.where(available, scale_scores(scores), 0.0)
+            weight_sum += weight * available
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            hybrid = weighted_sum / weight_sum
+        hybrid[weight_sum <= 0] = np.nan
+        hybrid[self.rated_sparse[rows].nonzero()] = np.nan
+        return hybrid
+    
+    def hybrid_recommendations(self, user_id, n=10, user_weight=0.5, item_weight=0.5,
+                               content_scores=None, content_weight=0.0,
+                               popularity_scores=None, popularity_weight=0.0):
         """
         Generate hybrid recommendations using both user-based and item-based CF.
         
@@ -342,46 +617,111 @@ class CollaborativeFilteringRecommender:
             Weight to give to user-based recommendations (0-1)
         item_weight : float
             Weight to give to item-based recommendations (0-1)
+        content_scores : pandas.Series, optional
+            Content similarity scores indexed by ISBN to blend in
+        content_weight : float
+            Weight to give to content_scores
+        popularity_scores : pandas.Series, optional
+            Popularity scores indexed by ISBN to blend in
+        popularity_weight : float
+            Weight to give to popularity_scores
             
         Returns:
         --------
         pandas.DataFrame
             DataFrame containing the recommended books
         """
-        # Get recommendations from both methods
-        user_recs = self.user_based_recommendations(user_id, n=n*2)
-        item_recs = self.item_based_recommendations(user_id, n=n*2)
-        
-        if user_recs.empty and item_recs.empty:
+        # Check if the user exists in our dataset
+        if user_id not in self.user_item_matrix.index:
+            print(f"User with ID {user_id} not found in the dataset.")
             return pd.DataFrame()
-        elif user_recs.empty:
-            return item_recs.head(n)
-        elif item_recs.empty:
-            return user_recs.head(n)
         
-        # Combine the recommendations
-        user_recs['method'] = 'user'
-        item_recs['method'] = 'item'
+        row = self.user_item_matrix.index.get_loc(user_id)
+        scores = self.hybrid_scores(
+            [row], user_weight=user_weight, item_weight=item_weight,
+            content_scores=content_scores, content_weight=content_weight,
+            popularity_scores=popularity_scores, popularity_weight=popularity_weight
+        )[0]
         
-        # Concatenate the dataframes
-        all_recs = pd.concat([user_recs, item_recs])
-        
-        # Remove duplicates, keeping the one with the highest weight
-        def get_weight(row):
-            if row['method'] == 'user':
-                return user_weight
-            else:
-                return item_weight
+        top = top_n_positions(scores, n)
+        return self._book_details(self.user_item_matrix.columns[top])
+    
+    def batch_hybrid_recommendations(self, user_ids, n=10, **weights):
+        """
+        Generate hybrid recommendations for many users at once.
         
-        all_recs['weight'] = all_recs.apply(get_weight, axis=1)
+        Parameters:
+        -----------
+        user_ids : list
+            IDs of the users to get recommendations for
+        n : int
+            Number of recommendations per user
+        **weights
+            Component weights and scores, as accepted by hybrid_scores
+            
+        Returns:
+        --------
+        dict
+            Maps each user ID to a pandas.Series of hybrid scores indexed by
+            ISBN, best first (empty for unknown users)
+        """
+        rows = self._user_rows(user_ids)
+        scores = np.full((len(rows), self.user_item_matrix.shape[1]), np.nan, dtype=self._dtype())
+        known = rows >= 0
+        scores[known] = self.hybrid_scores(rows[known], **weights)
+        return self._batch_result(user_ids, rows, scores, n)
+    
+    def _item_positions(self, item_index):
+        """Positions of the user-item matrix columns in an ItemIndex (cached per index)."""
+        cached = self._aligned_index
+        if cached is None or cached[0] is not item_index:
+            cached = (item_index, item_index.positions(self.user_item_matrix.columns))
+            self._aligned_index = cached
+        return cached[1]
+    
+    def rated_items(self, user_id):
+        """
+        Get the books a user has rated.
         
-        # Sort by weight and remove duplicates
-        all_recs = all_recs.sort_values('weight', ascending=False)
-        all_recs = all_recs.drop_duplicates(subset=['ISBN'])
+        Parameters:
+        -----------
+        user_id : int or str
+            ID of the user
+            
+        Returns:
+        --------
+        pandas.Series
+            The user's ratings indexed by ISBN, highest first (empty for unknown users)
+        """
+        if user_id not in self.user_item_matrix.index:
+            return pd.Series(dtype=float)
+        ratings = self.user_item_matrix.loc[user_id]
+        return ratings[ratings != 0].sort_values(ascending=False, kind='stable')
+    
+    def score_vector(self, user_id, item_index, user_weight=0.5, item_weight=0.5):
+        """
+        Hybrid CF scores of one user, aligned to a shared ItemIndex.
         
-        # Return top n recommendations
-        return all_recs.head(n).drop(['method', 'weight'], axis=1)
-
+        Parameters:
+        -----------
+        user_id : int or str
+            ID of the user to score books for
+        item_index : ItemIndex
+            Item index the returned vector is aligned to
+        user_weight, item_weight : float
+            Weights of the user-based and item-based predictions
+            
+        Returns:
+        --------
+        numpy.ndarray
+            Scores of length len(item_index); NaN for books the user has rated,
+            books outside the user-item matrix, and for unknown users
+        """
+        rows = self._user_rows([user_id])
+        if rows[0] < 0:
+            return np.full(len(item_index), np.nan)
+        scores = self.hybrid_scores(rows, user_weight=user_weight, item_weight=item_weight)
+        return item_index.scatter(scores[0], self._item_positions(item_index))
 
 if __name__ == "__main__":
     # Example usage
@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from instrumentation import fit_stage, timed_request_stage
+from precision import float_dtype
+from similarity import NeighbourStore, block_similarity
 
 class ContentBasedRecommender:
     """
@@ -23,8 +25,9 @@ class ContentBasedRecommender:
         self.tfidf_matrix = None
         self.cosine_sim = None
         self.indices = None
+        self._aligned_index = None
         
-    def fit(self, content_column='content'):
+    def fit(self, content_column='content', neighbours=None):
         """
         Fit the recommender model using TF-IDF vectorization.
         
@@ -32,6 +35,9 @@ class ContentBasedRecommender:
         -----------
         content_column : str
             Name of the column containing the text content to use for recommendations
+        neighbours : int, optional
+            Keep only the top neighbours of each book in a NeighbourStore;
+            None computes the full dense similarity matrix
         """
         # Check if content column exists, if not create it
         if content_column not in self.books_df.columns:
@@ -43,21 +49,28 @@ class ContentBasedRecommender:
             content_column = 'content'
         
         # Create TF-IDF vectorizer
-        tfidf = TfidfVectorizer(stop_words='english')
+        tfidf = TfidfVectorizer(stop_words='english', dtype=float_dtype())
         
         # Fit and transform the content strings
-        self.tfidf_matrix = tfidf.fit_transform(self.books_df[content_column])
+        with fit_stage('tfidf'):
+            self.tfidf_matrix = tfidf.fit_transform(self.books_df[content_column])
         
-        # Calculate cosine similarity
-        self.cosine_sim = cosine_similarity(self.tfidf_matrix, self.tfidf_matrix)
+        # Calculate cosine similarity (TF-IDF rows are already L2-normalised)
+        with fit_stage('content_similarity'):
+            if neighbours:
+                self.cosine_sim = NeighbourStore.from_matrix(self.tfidf_matrix, neighbours, normalized=True)
+            else:
+                self.cosine_sim = block_similarity(self.tfidf_matrix, normalized=True)
         
         # Create a Series with ISBN as index and position as value
         # Reset the DataFrame index to ensure indices match the tfidf_matrix
         self.books_df = self.books_df.reset_index(drop=True)
         self.indices = pd.Series(self.books_df.index, index=self.books_df['ISBN'])
+        self._aligned_index = None
         
         return self
     
+    @timed_request_stage('scoring')
     def get_recommendations(self, book_isbn, n=10):
         """
         Get book recommendations based on similarity to the given book.
@@ -102,6 +115,89 @@ class ContentBasedRecommender:
         # Return the books
         return self.books_df.iloc[valid_indices]
     
+    @timed_request_stage('scoring')
+    def get_recommendations_batch(self, book_isbns, n=10):
+        """
+        Get recommendations for many books at once.
+        
+        Similarity rows for all query books are gathered with one fancy-index
+        operation and reduced to the top n with argpartition. The query book
+        itself is always excluded.
+        
+        Parameters:
+        -----------
+        book_isbns : list of str
+            ISBNs of the books to get recommendations for
+        n : int
+            Number of recommendations per book
+            
+        Returns:
+        --------
+        dict
+            Maps each ISBN to a pandas.Series of similarity scores indexed by
+            the recommended ISBNs, most similar first (empty for unknown ISBNs)
+        """
+        book_isbns = list(book_isbns)
+        indices = self.indices[~self.indices.index.duplicated()]
+        positions = indices.index.get_indexer(book_isbns)
+        known = np.flatnonzero(positions >= 0)
+        results = {isbn: pd.Series(dtype=float) for isbn in book_isbns}
+        if len(known) == 0:
+            return results
+        
+        idx = indices.values[positions[known]]
+        similarities = np.array(self.cosine_sim[idx])
+        similarities[np.arange(len(idx)), idx] = -np.inf
+        
+        n = min(n, similarities.shape[1] - 1)
+        if n <= 0:
+            return results
+        top = np.sort(np.argpartition(-similarities, n - 1, axis=1)[:, :n], axis=1)
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        
+        isbns = self.books_df['ISBN'].values
+        for query, book_positions, scores in zip(known, top, top_scores):
+            results[book_isbns[query]] = pd.Series(scores, index=isbns[book_positions])
+        return results
+    
+    def _item_positions(self, item_index):
+        """Positions of the similarity matrix rows in an ItemIndex (cached per index)."""
+        cached = self._aligned_index
+        if cached is None or cached[0] is not item_index:
+            cached = (item_index, item_index.positions(self.books_df['ISBN']))
+            self._aligned_index = cached
+        return cached[1]
+    
+    @timed_request_stage('scoring')
+    def score_vector(self, book_isbns, item_index):
+        """
+        Mean similarity of every book to a set of books, aligned to a shared ItemIndex.
+        
+        Parameters:
+        -----------
+        book_isbns : list of str
+            ISBNs of the books to compare against (unknown ISBNs are ignored)
+        item_index : ItemIndex
+            Item index the returned vector is aligned to
+            
+        Returns:
+        --------
+        numpy.ndarray
+            Scores of length len(item_index); NaN for books outside the model
+            (or everywhere if none of the ISBNs is known)
+        """
+        indices = self.indices[~self.indices.index.duplicated()]
+        positions = indices.index.get_indexer(list(book_isbns))
+        if not (positions >= 0).any():
+            return np.full(len(item_index), np.nan)
+        
+        idx = indices.values[positions[positions >= 0]]
+        similarities = np.asarray(self.cosine_sim[idx]).mean(axis=0)
+        return item_index.scatter(similarities, self._item_positions(item_index))
+    
     def get_recommendations_by_title(self, title, n=10):
         """
         Get book recommendations based on a book title.
@@ -3,6 +3,106 @@ import numpy as np
 import re
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from instrumentation import fit_stage
+
+# Common spellings of the same country in Users.csv locations, mapped to one name
+COUNTRY_ALIASES = {
+    'us': 'usa', 'u.s.a': 'usa', 'u.s': 'usa', 'united states': 'usa', 'united states of america': 'usa',
+    'america': 'usa',
+    'uk': 'united kingdom', 'u.k': 'united kingdom', 'great britain': 'united kingdom',
+    'england': 'united kingdom', 'scotland': 'united kingdom', 'wales': 'united kingdom',
+    'northern ireland': 'united kingdom',
+    'deutschland': 'germany', 'españa': 'spain', 'espana': 'spain', 'catalunya': 'spain',
+    'italia': 'italy', 'holland': 'netherlands', 'the netherlands': 'netherlands',
+    'brasil': 'brazil', 'méxico': 'mexico', 'suisse': 'switzerland', 'schweiz': 'switzerland',
+    'österreich': 'austria', 'belgique': 'belgium', 'nederland': 'netherlands',
+    'republic of korea': 'south korea', 'korea': 'south korea',
+    '': 'Unknown', 'n/a': 'Unknown', '-': 'Unknown', 'none': 'Unknown', 'unknown': 'Unknown',
+}
+
+
+def _categorical(codes, values, clean, missing=None):
+    """
+    Categorical of values[codes], cleaning each distinct value once.
+
+    Parameters:
+    -----------
+    codes : numpy.ndarray
+        Positions in values of each output row
+    values : pandas.Series
+        Raw values (strings or missing)
+    clean : callable
+        Cleans a Series of distinct values; values equal once cleaned merge
+    missing : str, optional
+        Value of the rows whose raw value is missing (missing if None)
+
+    Returns:
+    --------
+    pandas.Categorical
+    """
+    value_codes, categories = pd.factorize(values)
+    # Missing raw values have code -1, the appended last row
+    cleaned = pd.concat([clean(pd.Series(categories, dtype=object)), pd.Series([missing], dtype=object)],
+                        ignore_index=True)
+    clean_codes, clean_categories = pd.factorize(cleaned)
+    return pd.Categorical.from_codes(clean_codes[value_codes[codes]], categories=clean_categories)
+
+
+def normalize_countries(countries):
+    """
+    Normalise country names: lower-cased, stripped of surrounding quotes and
+    dots, and mapped to one spelling with COUNTRY_ALIASES.
+
+    Parameters:
+    -----------
+    countries : pandas.Series
+        Country names (strings)
+
+    Returns:
+    --------
+    pandas.Series
+        Normalised names ('Unknown' for empty and placeholder values)
+    """
+    countries = countries.str.lower().str.strip(' ."\'')
+    return countries.map(lambda country: COUNTRY_ALIASES.get(country, country))
+
+
+def parse_locations(locations):
+    """
+    Split "city, state, country" locations into categorical columns.
+
+    Each distinct location is split once (Users.csv repeats them a lot) and
+    each distinct city, state and country is cleaned once, with vectorised
+    string operations. Locations with two parts are read as "city, country"
+    and locations with one part as the country, as before. Countries are
+    lower-cased, stripped of surrounding quotes and dots and normalised with
+    COUNTRY_ALIASES; missing ones are 'Unknown'.
+
+    Parameters:
+    -----------
+    locations : pandas.Series
+        Location strings
+
+    Returns:
+    --------
+    pandas.DataFrame
+        City, State and Country columns (categorical), aligned to locations
+    """
+    codes, uniques = pd.factorize(locations)
+    parts = pd.Series(np.asarray(uniques, dtype=object)).str.split(',', n=3, expand=True)
+    parts = parts.reindex(columns=range(3))
+    # Missing locations (code -1) point to an extra row of missing parts
+    parts.loc[len(parts)] = None
+    codes = np.where(codes >= 0, codes, len(parts) - 1)
+
+    # Empty and placeholder cities and states are missing
+    place = lambda values: values.str.strip().mask(lambda names: names.isin(['', 'n/a']))
+    return pd.DataFrame({
+        'City': _categorical(codes, parts[0], place),
+        'State': _categorical(codes, parts[1].where(parts[2].notna()), place),
+        'Country': _categorical(codes, parts[2].fillna(parts[1]).fillna(parts[0]), normalize_countries, 'Unknown'),
+    }, index=locations.index)
+
 
 class DataPreprocessor:
     def __init__(self, books_path, ratings_path, users_path):
@@ -35,6 +135,7 @@ class DataPreprocessor:
         # Combined data
         self.books_with_ratings = None
         
+    @fit_stage('load')
     def load_data(self):
         """Load the dataset files into pandas dataframes."""
         print("Loading data...")
@@ -132,6 +233,7 @@ class DataPreprocessor:
         print(f"Loaded {len(self.books_df)} books, {len(self.ratings_df)} ratings, and {len(self.users_df)} users.")
         return self
     
+    @fit_stage('clean_books')
     def clean_books_data(self):
         """Clean and preprocess the books dataframe."""
         print("Cleaning books data...")
@@ -198,6 +300,7 @@ class DataPreprocessor:
         print(f"Cleaned books data. {len(self.books_processed)} books after cleaning.")
         return self
     
+    @fit_stage('clean_ratings')
     def clean_ratings_data(self, min_book_ratings=10, min_user_ratings=10):
         """
         Clean and preprocess the ratings dataframe.
@@ -239,6 +342,7 @@ class DataPreprocessor:
         print(f"Cleaned ratings data. {len(self.ratings_processed)} ratings after cleaning.")
         return self
     
+    @fit_stage('clean_users')
     def clean_users_data(self):
         """Clean and preprocess the users dataframe."""
         print("Cleaning users data...")
@@ -255,23 +359,14 @@ class DataPreprocessor:
             ((self.users_processed['Age'] >= 5) & (self.users_processed['Age'] <= 100))
         ]
         
-        # Extract country from location
-        def extract_country(location):
-            if pd.isna(location):
-                return 'Unknown'
-            parts = location.split(',')
-            if len(parts) >= 3:
-                return parts[2].strip()
-            elif len(parts) == 2:
-                return parts[1].strip()
-            else:
-                return parts[0].strip()
-        
-        self.users_processed['Country'] = self.users_processed['Location'].apply(extract_country)
+        # Split the location into city, state and normalised country
+        locations = parse_locations(self.users_processed['Location'])
+        self.users_processed[['City', 'State', 'Country']] = locations
         
         print(f"Cleaned users data. {len(self.users_processed)} users after cleaning.")
         return self
     
+    @fit_stage('merge')
     def merge_data(self):
         """Merge the processed dataframes."""
         print("Merging data...")
@@ -0,0 +1,256 @@
+import pandas as pd
+import numpy as np
+from instrumentation import fit_stage, timed_request_stage
+from data_preprocessing import normalize_countries
+
+# Age buckets of the segments: [lower, upper) bounds and their labels
+AGE_BINS = [0, 18, 25, 35, 45, 55, 65, np.inf]
+AGE_LABELS = ['<18', '18-24', '25-34', '35-44', '45-54', '55-64', '65+']
+
+# Label of the "any country" / "any age" level of the segment hierarchy
+ANY = 'all'
+
+
+def age_bucket(ages):
+    """
+    Age bucket label of each age.
+
+    Parameters:
+    -----------
+    ages : array-like
+        Ages in years (NaN for unknown)
+
+    Returns:
+    --------
+    pandas.Series
+        Bucket labels (see AGE_LABELS), ANY for unknown ages
+    """
+    buckets = pd.cut(pd.Series(ages, dtype=float), AGE_BINS, right=False, labels=AGE_LABELS)
+    return buckets.astype(object).fillna(ANY)
+
+
+def country_key(countries):
+    """
+    Lookup key of each country: normalised as by parse_locations, ANY when unknown.
+
+    Parameters:
+    -----------
+    countries : array-like
+        Country names (e.g. the Country column of DataPreprocessor.users_processed)
+
+    Returns:
+    --------
+    pandas.Series
+        Country keys
+    """
+    keys = normalize_countries(pd.Series(countries, dtype=object).fillna('').astype(str))
+    return keys.mask(keys == 'Unknown', ANY)
+
+
+class DemographicRecommender:
+    """
+    Segment-level popularity recommender for new and anonymous users.
+    Precomputes the most popular books of every (country, age bucket)
+    segment of Users.csv, so a user is served with one table lookup.
+    Segments with too few ratings back off to the user's country, then to
+    their age bucket, then to all users.
+    """
+
+    def __init__(self, ratings_df, books_df, users_df):
+        """
+        Initialize the demographic recommender.
+
+        Parameters:
+        -----------
+        ratings_df : pandas.DataFrame
+            DataFrame containing user ratings with columns: User-ID, ISBN, Book-Rating
+        books_df : pandas.DataFrame
+            DataFrame containing book information with at least the columns:
+            ISBN, Book-Title, Book-Author
+        users_df : pandas.DataFrame
+            DataFrame containing user information with the columns:
+            User-ID, Country, Age
+        """
+        self.ratings_df = ratings_df
+        self.books_df = books_df
+        self.users_df = users_df
+        self.segments = None
+        self.segment_keys = None
+        self.top_books = None
+        self.scores = None
+        self.books = None
+        self.user_segments = None
+
+    @fit_stage('demographic')
+    def fit(self, n=50, min_ratings=5, min_segment_ratings=100):
+        """
+        Precompute the top books of every segment.
+
+        Parameters:
+        -----------
+        n : int
+            Number of books stored per segment
+        min_ratings : int
+            Ratings a book needs within a segment to be ranked there
+        min_segment_ratings : int
+            Ratings a segment needs to get its own ranking; smaller
+            segments back off to a coarser one
+        """
+        print("Calculating demographic segment popularity...")
+
+        users = pd.DataFrame({
+            'User-ID': self.users_df['User-ID'].to_numpy(),
+            'country': country_key(self.users_df['Country'].to_numpy()).to_numpy(),
+            'age': age_bucket(self.users_df['Age'].to_numpy()).to_numpy(),
+        }).drop_duplicates(subset=['User-ID'])
+        ratings = self.ratings_df[['User-ID', 'ISBN', 'Book-Rating']].merge(users, on='User-ID', how='left')
+        ratings = ratings[ratings['ISBN'].isin(self.books_df['ISBN'])]
+        ratings = ratings.assign(country=ratings['country'].fillna(ANY), age=ratings['age'].fillna(ANY))
+
+        # Book statistics at every level of the hierarchy: (country, age),
+        # (country, any age), (any country, age) and (any country, any age)
+        levels = []
+        for country, age in ((True, True), (True, False), (False, True), (False, False)):
+            level = ratings.assign(country=ratings['country'] if country else ANY,
+                                   age=ratings['age'] if age else ANY)
+            levels.append(level.groupby(['country', 'age', 'ISBN'])['Book-Rating'].agg(['count', 'mean']))
+        stats = pd.concat(levels).reset_index()
+        # Users of unknown country or age fall into an ANY group of a finer level
+        # too; the coarser level's group covers all users and wins
+        stats = stats[~stats.duplicated(subset=['country', 'age', 'ISBN'], keep='last')]
+
+        # Keep segments with enough ratings (the global segment always stays)
+        segment_ratings = stats.groupby(['country', 'age'])['count'].transform('sum')
+        is_global = (stats['country'] == ANY) & (stats['age'] == ANY)
+        stats = stats[(segment_ratings >= min_segment_ratings) | is_global]
+
+        # Weighted rating within each segment, as in PopularityRecommender
+        stats = stats[stats['count'] >= min_ratings]
+        segment_mean = stats.groupby(['country', 'age'])['mean'].transform('mean')
+        stats = stats.assign(score=(stats['count'] / (stats['count'] + min_ratings) * stats['mean'])
+                             + (min_ratings / (stats['count'] + min_ratings) * segment_mean))
+
+        # Top n of each segment, as rows of a padded (segments x n) table of book positions
+        stats = stats.sort_values(['country', 'age', 'score'], ascending=[True, True, False])
+        stats = stats[stats.groupby(['country', 'age']).cumcount() < n]
+        segment_codes, segments = pd.factorize(pd.MultiIndex.from_frame(stats[['country', 'age']]))
+        book_codes, isbns = pd.factorize(stats['ISBN'])
+        ranks = stats.groupby(segment_codes).cumcount().to_numpy()
+
+        self.top_books = np.full((len(segments), n), -1, dtype=np.int32)
+        self.top_books[segment_codes, ranks] = book_codes
+        self.scores = np.full((len(segments), n), np.nan)
+        self.scores[segment_codes, ranks] = stats['mean'].to_numpy()
+        self.segments = {segment: row for row, segment in enumerate(segments)}
+        self.segment_keys = list(segments)
+
+        books = self.books_df.drop_duplicates(subset=['ISBN'])
+        self.books = books.iloc[pd.Index(books['ISBN']).get_indexer(isbns)].reset_index(drop=True)
+
+        # Segment of every known user, resolved through the backoff once
+        self.user_segments = pd.Series(self._segment_rows(users['country'], users['age']),
+                                       index=users['User-ID'].to_numpy())
+
+        print(f"Calculated popularity of {len(segments)} demographic segments.")
+        return self
+
+    def _segment_rows(self, countries, ages):
+        """Rows of the most specific fitted segments for arrays of country and age bucket keys."""
+        segments = pd.MultiIndex.from_tuples(self.segment_keys, names=['country', 'age'])
+        countries = np.asarray(countries, dtype=object)
+        ages = np.asarray(ages, dtype=object)
+        rows = np.full(len(countries), -1, dtype=np.int32)
+        for country, age in ((countries, ages), (countries, ANY), (ANY, ages), (ANY, ANY)):
+            keys = pd.MultiIndex.from_arrays([np.broadcast_to(country, rows.shape), np.broadcast_to(age, rows.shape)])
+            rows = np.where(rows >= 0, rows, segments.get_indexer(keys))
+        return rows
+
+    def _segment_row(self, country, age):
+        """Row of the most specific fitted segment for a country and age bucket key."""
+        for key in ((country, age), (country, ANY), (ANY, age), (ANY, ANY)):
+            row = self.segments.get(key)
+            if row is not None:
+                return row
+        return -1
+
+    def segment(self, country=None, age=None):
+        """
+        Segment that serves a country and age, after backoff.
+
+        Parameters:
+        -----------
+        country : str, optional
+            Country name (None if unknown)
+        age : float, optional
+            Age in years (None if unknown)
+
+        Returns:
+        --------
+        tuple
+            (country key, age bucket) of the segment
+        """
+        return self.segment_keys[self._segment_row(country_key([country])[0], age_bucket([age])[0])]
+
+    @timed_request_stage('lookup')
+    def _lookup(self, row, n):
+        """Book positions and mean segment ratings of the top n books of a segment row."""
+        positions = self.top_books[row, :n]
+        known = positions >= 0
+        return positions[known], self.scores[row, :n][known]
+
+    def _recommend_row(self, row, n):
+        """Top n books of a segment row, with their mean rating within the segment."""
+        if row < 0:
+            return pd.DataFrame()
+
+        positions, ratings = self._lookup(row, n)
+        return self.books.iloc[positions].assign(rating_mean=ratings)
+
+    def recommend(self, country=None, age=None, n=10):
+        """
+        Get the most popular books of a country and age segment.
+
+        Parameters:
+        -----------
+        country : str, optional
+            Country name (None if unknown)
+        age : float, optional
+            Age in years (None if unknown)
+        n : int
+            Number of recommendations to return (at most the n given to fit)
+
+        Returns:
+        --------
+        pandas.DataFrame
+            DataFrame containing the recommended books, with their mean
+            rating within the segment as rating_mean
+        """
+        if self.segments is None:
+            print("Error: You must call fit() before recommend().")
+            return pd.DataFrame()
+        return self._recommend_row(self._segment_row(country_key([country])[0], age_bucket([age])[0]), n)
+
+    def known_user(self, user_id):
+        """Whether the user is listed in Users.csv."""
+        return self.user_segments is not None and user_id in self.user_segments.index
+
+    def recommend_for_user(self, user_id, n=10):
+        """
+        Get the most popular books of a user's segment.
+
+        Parameters:
+        -----------
+        user_id : int
+            ID of a user of Users.csv
+        n : int
+            Number of recommendations to return
+
+        Returns:
+        --------
+        pandas.DataFrame
+            DataFrame containing the recommended books (empty for unknown users)
+        """
+        if not self.known_user(user_id):
+            print(f"User with ID {user_id} not found in the users data.")
+            return pd.DataFrame()
+        return self._recommend_row(int(self.user_segments.loc[user_id]), n)
@@ -0,0 +1,465 @@
+"""
+Offline evaluation of recommendation quality against speed.
+
+Splits ratings_processed into train and test sets (random per-user holdout or
+leave-last-out), fits each engine on the train ratings and ranks books for
+the test users with every recommendation method. Test users are partitioned
+across a process pool; each worker scores its partition and returns the
+top-k item positions and timings, and precision@k, recall@k, NDCG@k and
+catalogue coverage are computed for all users at once with array operations.
+
+Engines are alternative model configurations (e.g. exact and approximate
+similarity) evaluated side by side on the same split.
+
+Example:
+    python evaluation.py --ratings 200000 --split random --k 10 --output eval.json
+    python evaluation.py --data . --split leave-last-out --users 2000 --workers 4
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_preprocessing import DataPreprocessor
+from content_based import ContentBasedRecommender
+from collaborative_filtering import CollaborativeFilteringRecommender
+from popularity_based import PopularityRecommender
+from hybrid_recommender import HybridRecommender
+from item_index import top_n_positions
+from synthetic_data import generate_dataset, write_dataset
+
+# Model configurations evaluated side by side: keyword arguments of
+# CollaborativeFilteringRecommender.fit for each engine ('neighbours' is
+# also passed to ContentBasedRecommender.fit)
+ENGINES = {
+    'exact': {},
+    'approximate': {'neighbours': 50},
+    'centered': {'user_metric': 'pearson', 'item_metric': 'adjusted_cosine'},
+    'shrunk': {'user_metric': 'pearson', 'shrinkage': 10, 'min_support': 2},
+    'shrunk_approximate': {'neighbours': 50, 'user_metric': 'pearson', 'shrinkage': 10, 'min_support': 2},
+}
+
+# Recommendation methods and whether they score users in batches
+METHODS = {
+    'popularity': False,
+    'user': True,
+    'item': True,
+    'cf_hybrid': True,
+    'content': False,
+    'hybrid': False,
+}
+
+# Models and item index of the current worker process
+_worker_models = None
+
+
+def random_split(ratings, test_fraction=0.2, seed=0, min_ratings=2):
+    """
+    Hold out a random fraction of each user's ratings.
+
+    Parameters:
+    -----------
+    ratings : pandas.DataFrame
+        Ratings with columns User-ID, ISBN and Book-Rating
+    test_fraction : float
+        Fraction of each user's ratings held out (at least one per user)
+    seed : int
+        Random seed
+    min_ratings : int
+        Users with fewer ratings are kept entirely in the train set
+
+    Returns:
+    --------
+    tuple of pandas.DataFrame
+        (train, test)
+    """
+    rng = np.random.default_rng(seed)
+    shuffled = ratings.iloc[rng.permutation(len(ratings))]
+    users = shuffled.groupby('User-ID', sort=False)['ISBN']
+    counts = users.transform('size').to_numpy()
+    n_test = np.clip(np.round(counts * test_fraction), 1, counts - 1)
+    held_out = (users.cumcount().to_numpy() < n_test) & (counts >= min_ratings)
+    return shuffled[~held_out].sort_index(), shuffled[held_out].sort_index()
+
+
+def leave_last_out(ratings, n_last=1, min_ratings=2):
+    """
+    Hold out each user's last ratings.
+
+    Book-Crossing has no timestamps, so the order of the ratings log is used
+    as the order in which ratings were given.
+
+    Parameters:
+    -----------
+    ratings : pandas.DataFrame
+        Ratings with columns User-ID, ISBN and Book-Rating, in log order
+    n_last : int
+        Number of ratings held out per user
+    min_ratings : int
+        Users with fewer ratings are kept entirely in the train set
+
+    Returns:
+    --------
+    tuple of pandas.DataFrame
+        (train, test)
+    """
+    users = ratings.groupby('User-ID', sort=False)['ISBN']
+    counts = users.transform('size').to_numpy()
+    held_out = (users.cumcount(ascending=False).to_numpy() < np.minimum(n_last, counts - 1)) & (counts >= min_ratings)
+    return ratings[~held_out], ratings[held_out]
+
+
+SPLITS = {
+    'random': random_split,
+    'leave-last-out': leave_last_out,
+}
+
+
+def ranking_metrics(recommended, test_users, test_items, k, n_items):
+    """
+    Compute ranking metrics for all users at once.
+
+    Parameters:
+    -----------
+    recommended : numpy.ndarray
+        int array of shape (n_users, k) with recommended item positions,
+        best first, -1 padded
+    test_users : numpy.ndarray
+        Row (0 to n_users - 1) of each relevant test item
+    test_items : numpy.ndarray
+        Item position of each relevant test item
+    k : int
+        Cut-off of the metrics
+    n_items : int
+        Size of the catalogue, for coverage
+
+    Returns:
+    --------
+    dict
+        Mean precision@k, recall@k, NDCG@k and hit rate over users, and the
+        fraction of the catalogue recommended to anyone (coverage)
+    """
+    recommended = recommended[:, :k]
+    n_users = len(recommended)
+    relevant_keys = np.unique(test_users.astype(np.int64) * n_items + test_items)
+    keys = np.arange(n_users, dtype=np.int64)[:, None] * n_items + recommended
+    positions = np.minimum(np.searchsorted(relevant_keys, keys), max(len(relevant_keys) - 1, 0))
+    hits = (recommended >= 0) & (len(relevant_keys) > 0) & (relevant_keys[positions] == keys)
+
+    n_relevant = np.bincount(test_users, minlength=n_users)
+    n_hits = hits.sum(axis=1)
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (hits * discounts).sum(axis=1)
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])[np.minimum(n_relevant, k)]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recall = np.where(n_relevant > 0, n_hits / n_relevant, 0.0)
+        ndcg = np.where(ideal > 0, dcg / ideal, 0.0)
+
+    recommended_items = np.unique(recommended[recommended >= 0])
+    return {
+        f'precision@{k}': float((n_hits / k).mean()) if n_users else 0.0,
+        f'recall@{k}': float(recall.mean()) if n_users else 0.0,
+        f'ndcg@{k}': float(ndcg.mean()) if n_users else 0.0,
+        f'hit_rate@{k}': float((n_hits > 0).mean()) if n_users else 0.0,
+        'coverage': len(recommended_items) / n_items if n_items else 0.0,
+    }
+
+
+def fit_models(train, books, engine_options, max_content_books=30000):
+    """
+    Fit the recommenders of one engine on the train ratings.
+
+    Returns:
+    --------
+    dict
+        Fitted models keyed by 'collaborative', 'popularity', 'content'
+        (None when skipped) and 'hybrid'
+    """
+    content = None
+    if len(books) <= max_content_books:
+        content = ContentBasedRecommender(books).fit(neighbours=engine_options.get('neighbours'))
+    else:
+        print(f"Skipping content-based model: {len(books)} books exceed --max-content-books")
+
+    collaborative = CollaborativeFilteringRecommender(train, books)
+    collaborative.fit(**dict({'min_user_ratings': 10, 'min_book_ratings': 5}, **engine_options))
+    popularity = PopularityRecommender(train, books).fit()
+    hybrid = HybridRecommender(content, collaborative, popularity, books).fit()
+    return {'collaborative': collaborative, 'popularity': popularity, 'content': content, 'hybrid': hybrid}
+
+
+def available_methods(models, methods):
+    """Methods that can run with the fitted models."""
+    return [m for m in methods if m != 'content' or models['content'] is not None]
+
+
+def recommend_partition(models, method, users, train_items, k, batch_size=64):
+    """
+    Rank books for one partition of users.
+
+    Parameters:
+    -----------
+    models : dict
+        Models returned by fit_models
+    method : str
+        One of METHODS
+    users : list
+        User IDs to rank books for
+    train_items : list of numpy.ndarray
+        Item positions each user rated in the train set (excluded)
+    k : int
+        Number of books to rank per user
+    batch_size : int
+        Users scored per call of the batched methods
+
+    Returns:
+    --------
+    tuple
+        (int array of shape (len(users), k) with item positions, -1 padded;
+        list of per-user latencies in seconds)
+    """
+    hybrid = models['hybrid']
+    collaborative = models['collaborative']
+    item_index = hybrid.item_index
+    recommended = np.full((len(users), k), -1, dtype=np.int64)
+    latencies = []
+
+    if METHODS[method]:
+        batch = {
+            'user': collaborative.batch_user_based_recommendations,
+            'item': collaborative.batch_item_based_recommendations,
+            'cf_hybrid': collaborative.batch_hybrid_recommendations,
+        }[method]
+        for start in range(0, len(users), batch_size):
+            chunk = users[start:start + batch_size]
+            started = time.perf_counter()
+            results = batch(chunk, n=k)
+            seconds = time.perf_counter() - started
+            latencies += [seconds / len(chunk)] * len(chunk)
+            for row, user in enumerate(chunk, start):
+                positions = item_index.positions(results[user].index)
+                recommended[row, :len(positions)] = positions
+        return recommended, latencies
+
+    for row, user in enumerate(users):
+        started = time.perf_counter()
+        if method == 'popularity':
+            scores = hybrid.popularity_scores.copy()
+        elif method == 'content':
+            scores = hybrid.score(user_id=user, weights={'collaborative': 0, 'content': 1, 'popularity': 0})
+        else:
+            scores = hybrid.score(user_id=user)
+        scores[train_items[row]] = np.nan
+        top = top_n_positions(scores, k)
+        latencies.append(time.perf_counter() - started)
+        recommended[row, :len(top)] = top
+    return recommended, latencies
+
+
+def _init_worker(models_path):
+    """Load the fitted models once per worker process."""
+    global _worker_models
+    with open(models_path, 'rb') as f:
+        _worker_models = pickle.load(f)
+
+
+def _recommend_partition_in_worker(method, users, train_items, k, batch_size):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return recommend_partition(_worker_models, method, users, train_items, k, batch_size)
+
+
+def evaluate_engine(models, methods, users, train_items, test_users, test_items, k,
+                    workers=1, batch_size=64, partition_size=256):
+    """
+    Evaluate every method of one engine on the test users.
+
+    Parameters:
+    -----------
+    models : dict
+        Models returned by fit_models
+    methods : list of str
+        Methods to evaluate
+    users : list
+        Test user IDs
+    train_items : list of numpy.ndarray
+        Item positions each test user rated in the train set
+    test_users, test_items : numpy.ndarray
+        Relevant test ratings as (row in users, item position) pairs
+    k : int
+        Cut-off of the metrics
+    workers : int
+        Worker processes (1 scores in this process)
+    batch_size : int
+        Users scored per call of the batched methods
+    partition_size : int
+        Users per task sent to a worker
+
+    Returns:
+    --------
+    dict
+        Metrics and latency statistics keyed by method
+    """
+    n_items = len(models['hybrid'].item_index)
+    partitions = [(users[i:i + partition_size], train_items[i:i + partition_size])
+                  for i in range(0, len(users), partition_size)]
+
+    with contextlib.ExitStack() as stack:
+        if workers > 1:
+            tmp = stack.enter_context(tempfile.TemporaryDirectory())
+            models_path = os.path.join(tmp, 'models.pkl')
+            with open(models_path, 'wb') as f:
+                pickle.dump(models, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pool = stack.enter_context(ProcessPoolExecutor(workers, initializer=_init_worker,
+                                                           initargs=(models_path,)))
+        results = {}
+        for method in methods:
+            started = time.perf_counter()
+            if workers > 1:
+                futures = [pool.submit(_recommend_partition_in_worker, method, part_users, part_items,
+                                       k, batch_size) for part_users, part_items in partitions]
+                scored = [future.result() for future in futures]
+            else:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    scored = [recommend_partition(models, method, part_users, part_items, k, batch_size)
+                              for part_users, part_items in partitions]
+            wall_seconds = time.perf_counter() - started
+
+            recommended = np.concatenate([r[0] for r in scored]) if scored else np.empty((0, k), np.int64)
+            latencies = np.array([seconds for r in scored for seconds in r[1]]) * 1000
+            results[method] = ranking_metrics(recommended, test_users, test_items, k, n_items)
+            results[method].update({
+                'users': len(users),
+                'latency_mean_ms': float(latencies.mean()) if len(latencies) else None,
+                'latency_p95_ms': float(np.percentile(latencies, 95)) if len(latencies) else None,
+                'wall_seconds': wall_seconds,
+            })
+    return results
+
+
+def prepare_test_set(train, test, item_index, n_users=None, min_relevant_rating=1, seed=0):
+    """
+    Select the test users and encode their train and relevant test items.
+
+    Returns:
+    --------
+    tuple
+        (users, train item positions per user, test user rows, test item positions)
+    """
+    relevant = test[test['Book-Rating'] >= min_relevant_rating]
+    users = pd.unique(relevant['User-ID'])
+    if n_users and len(users) > n_users:
+        users = np.sort(np.random.default_rng(seed).choice(users, n_users, replace=False))
+    user_rows = pd.Index(users)
+
+    relevant = relevant[relevant['User-ID'].isin(user_rows)]
+    test_users = user_rows.get_indexer(relevant['User-ID'])
+    test_items = item_index.positions(relevant['ISBN'])
+    known = test_items >= 0
+    test_users, test_items = test_users[known], test_items[known]
+
+    seen = train[train['User-ID'].isin(user_rows)]
+    seen_rows = user_rows.get_indexer(seen['User-ID'])
+    seen_items = item_index.positions(seen['ISBN'])
+    order = np.argsort(seen_rows, kind='stable')
+    bounds = np.searchsorted(seen_rows[order], np.arange(len(users) + 1))
+    train_items = [seen_items[order[bounds[i]:bounds[i + 1]]] for i in range(len(users))]
+    train_items = [items[items >= 0] for items in train_items]
+    return list(users), train_items, test_users, test_items
+
+
+def print_results(results, k):
+    width = max([len('engine')] + [len(engine) for engine in results])
+    print(f"\n{'engine':{width}s} {'method':12s} {'prec@k':>8s} {'recall@k':>9s} {'ndcg@k':>8s} "
+          f"{'coverage':>9s} {'mean ms':>9s} {'p95 ms':>9s}")
+    for engine, engine_results in results.items():
+        for method, m in engine_results['methods'].items():
+            print(f"{engine:{width}s} {method:12s} {m[f'precision@{k}']:8.4f} {m[f'recall@{k}']:9.4f} "
+                  f"{m[f'ndcg@{k}']:8.4f} {m['coverage']:9.4f} {m['latency_mean_ms']:9.3f} {m['latency_p95_ms']:9.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate recommendation quality and latency offline")
+    parser.add_argument('--data', help="Directory with Books.csv, Ratings.csv and Users.csv "
+                                       "(default: generate a synthetic dataset)")
+    parser.add_argument('--ratings', type=int, default=100000, help="Synthetic ratings to generate")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the data generator, split and user sample")
+    parser.add_argument('--split', choices=list(SPLITS), default='random', help="Train/test split")
+    parser.add_argument('--test-fraction', type=float, default=0.2, help="Held-out fraction (random split)")
+    parser.add_argument('--n-last', type=int, default=1, help="Held-out ratings per user (leave-last-out)")
+    parser.add_argument('--min-relevant-rating', type=int, default=1,
+                        help="Held-out ratings at least this high count as relevant")
+    parser.add_argument('--k', type=int, default=10, help="Cut-off of the ranking metrics")
+    parser.add_argument('--users', type=int, default=1000, help="Test users sampled (0 for all)")
+    parser.add_argument('--engines', default=','.join(ENGINES), help="Comma-separated engines to evaluate")
+    parser.add_argument('--methods', default=','.join(METHODS), help="Comma-separated methods to evaluate")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--batch-size', type=int, default=64, help="Users per call of the batched methods")
+    parser.add_argument('--max-content-books', type=int, default=30000,
+                        help="Skip the content-based model above this many books")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    engines = args.engines.split(',')
+    methods = args.methods.split(',')
+    for name in engines:
+        if name not in ENGINES:
+            parser.error(f"Unknown engine: {name} (expected one of {', '.join(ENGINES)})")
+    for name in methods:
+        if name not in METHODS:
+            parser.error(f"Unknown method: {name} (expected one of {', '.join(METHODS)})")
+    workers = args.workers or os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.data:
+            paths = {name: os.path.join(args.data, f'{name.title()}.csv') for name in ('books', 'ratings', 'users')}
+        else:
+            paths = write_dataset(tmp, *generate_dataset(args.ratings, seed=args.seed))
+        preprocessor = DataPreprocessor(paths['books'], paths['ratings'], paths['users'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            preprocessor.process_all()
+
+    books = preprocessor.books_processed
+    if args.split == 'random':
+        train, test = random_split(preprocessor.ratings_processed, args.test_fraction, seed=args.seed)
+    else:
+        train, test = leave_last_out(preprocessor.ratings_processed, args.n_last)
+    print(f"Split {len(preprocessor.ratings_processed)} ratings into {len(train)} train and {len(test)} test")
+
+    output = {
+        'created_at': time.time(),
+        'config': vars(args),
+        'data': {'books': len(books), 'train_ratings': len(train), 'test_ratings': len(test)},
+        'engines': {},
+    }
+    for engine in engines:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            models = fit_models(train, books, ENGINES[engine], args.max_content_books)
+        fit_seconds = time.perf_counter() - started
+        print(f"Fitted engine {engine} in {fit_seconds:.1f}s")
+
+        users, train_items, test_users, test_items = prepare_test_set(
+            train, test, models['hybrid'].item_index, args.users, args.min_relevant_rating, args.seed)
+        results = evaluate_engine(models, available_methods(models, methods), users, train_items,
+                                  test_users, test_items, args.k, workers=workers, batch_size=args.batch_size)
+        output['engines'][engine] = {'fit_seconds': fit_seconds, 'methods': results}
+
+    print_results(output['engines'], args.k)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2, default=str)
+        print(f"\nWrote results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import pandas as pd
+import numpy as np
+from item_index import ItemIndex, top_n_positions, scale_scores
+from precision import float_dtype
+from instrumentation import fit_stage, request_stage
+
+class HybridRecommender:
+    """
+    Hybrid recommendation system for books.
+    Fuses content-based, collaborative filtering and popularity scores over a
+    shared ItemIndex in a single scoring pass.
+    """
+
+    DEFAULT_WEIGHTS = {'collaborative': 0.5, 'content': 0.3, 'popularity': 0.2}
+
+    def __init__(self, content_recommender, collaborative_recommender, popularity_recommender,
+                 books_df, weights=None, seed_books=5):
+        """
+        Initialize the hybrid recommender with fitted component recommenders.
+
+        Parameters:
+        -----------
+        content_recommender : ContentBasedRecommender or None
+            Fitted content-based recommender
+        collaborative_recommender : CollaborativeFilteringRecommender or None
+            Fitted collaborative filtering recommender
+        popularity_recommender : PopularityRecommender or None
+            Fitted popularity-based recommender
+        books_df : pandas.DataFrame
+            DataFrame containing book information; defines the item index
+        weights : dict, optional
+            Default component weights, keyed by 'collaborative', 'content'
+            and 'popularity'
+        seed_books : int
+            Number of a user's highest-rated books used as content seeds
+        """
+        self.content_recommender = content_recommender
+        self.collaborative_recommender = collaborative_recommender
+        self.popularity_recommender = popularity_recommender
+        self.books_df = books_df.drop_duplicates(subset=['ISBN']).reset_index(drop=True)
+        self.weights = dict(self.DEFAULT_WEIGHTS, **(weights or {}))
+        self.seed_books = seed_books
+        self.item_index = None
+        self.popularity_scores = None
+
+    @fit_stage('item_index')
+    def fit(self):
+        """Build the shared item index and the static popularity vector."""
+        self.item_index = ItemIndex.from_books(self.books_df)
+        if self.popularity_recommender is not None:
+            self.popularity_scores = scale_scores(
+                self.popularity_recommender.score_vector(self.item_index)).astype(float_dtype())
+
+        print(f"Built hybrid item index over {len(self.item_index)} books.")
+        return self
+
+    def score(self, user_id=None, isbns=None, weights=None):
+        """
+        Compute fused scores for every book in the item index.
+
+        Each component is min-max scaled to [0, 1]; the hybrid score of a book
+        is the weighted mean of the components that score it.
+
+        Parameters:
+        -----------
+        user_id : int or str, optional
+            User to personalise for (collaborative component and content seeds)
+        isbns : list of str, optional
+            Books to find similar books for (content seeds); defaults to the
+            user's highest-rated books
+        weights : dict, optional
+            Component weights overriding the defaults
+
+        Returns:
+        --------
+        numpy.ndarray
+            Scores of length len(item_index); NaN for the seed books, books the
+            user has rated, and books no component scores
+        """
+        weights = dict(self.weights, **(weights or {}))
+        rated = pd.Series(dtype=float)
+        if user_id is not None and self.collaborative_recommender is not None:
+            rated = self.collaborative_recommender.rated_items(user_id)
+        seeds = list(isbns) if isbns else list(rated.index[:self.seed_books])
+
+        components = []
+        if weights['collaborative'] and user_id is not None and self.collaborative_recommender is not None:
+            components.append((weights['collaborative'],
+                               self.collaborative_recommender.score_vector(user_id, self.item_index)))
+        if weights['content'] and seeds and self.content_recommender is not None:
+            components.append((weights['content'], self.content_recommender.score_vector(seeds, self.item_index)))
+        if weights['popularity'] and self.popularity_scores is not None:
+            components.append((weights['popularity'], self.popularity_scores))
+
+        # Accumulate in the precision of the fitted components
+        dtype = np.result_type(*[scores for _, scores in components]) if components else float_dtype()
+        weighted_sum = np.zeros(len(self.item_index), dtype=dtype)
+        weight_sum = np.zeros(len(self.item_index), dtype=dtype)
+        for weight, scores in components:
+            available = ~np.isnan(scores)
+            weighted_sum += weight * np.where(available, scale_scores(scores), 0.0)
+            weight_sum += weight * available
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            hybrid = weighted_sum / weight_sum
+        hybrid[weight_sum <= 0] = np.nan
+
+        excluded = self.item_index.positions(seeds + list(rated.index))
+        hybrid[excluded[excluded >= 0]] = np.nan
+        return hybrid
+
+    def recommend(self, user_id=None, isbn=None, n=10, weights=None):
+        """
+        Get hybrid recommendations for a user, a book, or both.
+
+        Parameters:
+        -----------
+        user_id : int or str, optional
+            ID of the user to get recommendations for
+        isbn : str, optional
+            ISBN of a book to get similar books for
+        n : int
+            Number of recommendations to return
+        weights : dict, optional
+            Component weights overriding the defaults
+
+        Returns:
+        --------
+        pandas.DataFrame
+            DataFrame containing the recommended books with a hybrid_score column
+        """
+        scores = self.score(user_id=user_id, isbns=[isbn] if isbn else None, weights=weights)
+        top = top_n_positions(scores, n)
+        with request_stage('hydration'):
+            recommendations = self.books_df.iloc[top].copy()
+            recommendations['hybrid_score'] = scores[top]
+        return recommendations
+
+
+if __name__ == "__main__":
+    # Example usage
+    from data_preprocessing import DataPreprocessor
+    from content_based import ContentBasedRecommender
+    from collaborative_filtering import CollaborativeFilteringRecommender
+    from popularity_based import PopularityRecommender
+
+    # Load and preprocess data
+    preprocessor = DataPreprocessor(
+        books_path="../Books.csv",
+        ratings_path="../Ratings.csv",
+        users_path="../Users.csv"
+    )
+    preprocessor.load_data().clean_books_data().clean_ratings_data().clean_users_data().merge_data()
+
+    content = ContentBasedRecommender(preprocessor.books_processed).fit()
+    collaborative = CollaborativeFilteringRecommender(preprocessor.ratings_processed, preprocessor.books_processed)
+    collaborative.fit(min_user_ratings=10, min_book_ratings=5)
+    popularity = PopularityRecommender(preprocessor.ratings_processed, preprocessor.books_processed).fit()
+
+    recommender = HybridRecommender(content, collaborative, popularity, preprocessor.books_processed).fit()
+
+    # Get hybrid recommendations for a user
+    test_user = collaborative.user_item_matrix.index[0]
+    recommendations = recommender.recommend(user_id=test_user, n=5)
+    print(f"Hybrid recommendations for user {test_user}:")
+    print(recommendations[['Book-Title', 'Book-Author', 'hybrid_score']])
@@ -0,0 +1,290 @@
+import pandas as pd
+import numpy as np
+from scipy.sparse import csr_matrix
+from item_index import top_n_positions
+from instrumentation import fit_stage, timed_request_stage
+from precision import float_dtype
+from similarity import NeighbourStore
+
+# Weightings of the item-user interaction matrix before the item similarities
+WEIGHTINGS = ('bm25', 'tfidf', 'none')
+
+
+def _idf(matrix):
+    """Inverse document frequency of each column (user) of an item-user matrix."""
+    user_counts = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    return np.log(matrix.shape[0]) - np.log1p(user_counts)
+
+
+def _float_copy(matrix):
+    """CSR copy of a matrix, keeping float32/float64 input as is and the model precision otherwise."""
+    return csr_matrix(matrix, dtype=matrix.dtype if matrix.dtype.kind == 'f' else float_dtype(), copy=True)
+
+
+def bm25_weight(matrix, k1=1.2, b=0.75):
+    """
+    Okapi BM25 weighting of an item-user interaction matrix.
+
+    Interactions of users who interacted with many books weigh less (IDF),
+    and the interactions of very popular books are saturated (length norm).
+
+    Parameters:
+    -----------
+    matrix : scipy.sparse matrix
+        Interactions with books as rows and users as columns
+    k1 : float
+        Saturation of repeated interactions
+    b : float
+        Strength of the book popularity normalisation (0-1)
+
+    Returns:
+    --------
+    scipy.sparse.csr_matrix
+        Weighted copy of the matrix, in its dtype
+    """
+    matrix = _float_copy(matrix)
+    lengths = np.asarray(matrix.sum(axis=1)).ravel()
+    length_norm = (1 - b) + b * lengths / max(lengths.mean(), 1e-12)
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    weights = matrix.data * (k1 + 1) / (k1 * length_norm[rows] + matrix.data) * _idf(matrix)[matrix.indices]
+    matrix.data = weights.astype(matrix.dtype, copy=False)
+    return matrix
+
+
+def tfidf_weight(matrix):
+    """TF-IDF weighting of an item-user interaction matrix (see bm25_weight)."""
+    matrix = _float_copy(matrix)
+    matrix.data = (np.sqrt(matrix.data) * _idf(matrix)[matrix.indices]).astype(matrix.dtype, copy=False)
+    return matrix
+
+
+class ImplicitFeedbackRecommender:
+    """
+    Item-item recommender on implicit feedback.
+    Uses every interaction of the full rating log as a binary signal,
+    including the implicit (zero) ratings that clean_ratings_data drops, so
+    users without explicit ratings can be served as well.
+    """
+
+    def __init__(self, ratings_df, books_df):
+        """
+        Initialize the implicit feedback recommender.
+
+        Parameters:
+        -----------
+        ratings_df : pandas.DataFrame
+            Full interaction log with at least the columns User-ID and ISBN
+            (e.g. DataPreprocessor.ratings_df, before cleaning)
+        books_df : pandas.DataFrame
+            DataFrame containing book information with at least the columns:
+            ISBN, Book-Title, Book-Author
+        """
+        self.ratings_df = ratings_df
+        self.books_df = books_df
+        self.user_item_matrix = None
+        self.user_index = None
+        self.isbns = None
+        self.books_by_isbn = None
+        self.item_similarity = None
+
+    @fit_stage('implicit_matrix')
+    def create_matrix(self, min_user_interactions=1, min_book_interactions=2):
+        """
+        Create the sparse binary user-item interaction matrix.
+
+        Parameters:
+        -----------
+        min_user_interactions : int
+            Minimum number of interactions a user must have to be included
+        min_book_interactions : int
+            Minimum number of interactions a book must have to be included
+        """
+        print("Creating implicit interaction matrix...")
+
+        # One interaction per user and catalogue book, whatever the rating
+        interactions = self.ratings_df[['User-ID', 'ISBN']].dropna().drop_duplicates()
+        interactions = interactions[interactions['ISBN'].isin(self.books_df['ISBN'])]
+
+        book_counts = interactions['ISBN'].value_counts()
+        interactions = interactions[interactions['ISBN'].isin(book_counts.index[book_counts >= min_book_interactions])]
+        user_counts = interactions['User-ID'].value_counts()
+        interactions = interactions[interactions['User-ID'].isin(user_counts.index[user_counts >= min_user_interactions])]
+
+        user_codes, users = pd.factorize(interactions['User-ID'], sort=True)
+        isbn_codes, isbns = pd.factorize(interactions['ISBN'], sort=True)
+        self.user_item_matrix = csr_matrix(
+            (np.ones(len(interactions), dtype=float_dtype()), (user_codes, isbn_codes)),
+            shape=(len(users), len(isbns))
+        )
+        self.user_index = pd.Index(users)
+        self.isbns = pd.Index(isbns)
+
+        # Details of the matrix's books (first row per ISBN), indexed by ISBN for lookups
+        books = self.books_df.drop_duplicates(subset=['ISBN'])
+        books = books[books['ISBN'].isin(self.isbns)]
+        self.books_by_isbn = books.set_index(pd.Index(books['ISBN'].to_numpy()), drop=False)
+
+        print(f"Created implicit interaction matrix with {self.user_item_matrix.nnz} interactions "
+              f"of {len(users)} users on {len(isbns)} books")
+        return self
+
+    @fit_stage('implicit_similarity')
+    def compute_item_similarity(self, weighting='bm25', neighbours=50, k1=1.2, b=0.75):
+        """
+        Compute the top neighbours of every book from the weighted interactions.
+
+        Parameters:
+        -----------
+        weighting : str
+            'bm25', 'tfidf' or 'none'
+        neighbours : int
+            Number of neighbours kept per book
+        k1, b : float
+            BM25 parameters (see bm25_weight)
+        """
+        if weighting not in WEIGHTINGS:
+            raise ValueError(f"Unknown weighting: {weighting} (expected one of {', '.join(WEIGHTINGS)})")
+        print(f"Computing implicit item similarity ({weighting})...")
+
+        item_users = csr_matrix(self.user_item_matrix.T)
+        if weighting == 'bm25':
+            item_users = bm25_weight(item_users, k1=k1, b=b)
+        elif weighting == 'tfidf':
+            item_users = tfidf_weight(item_users)
+
+        # Block-wise on the similarity thread pool, reduced to the top neighbours per book
+        self.item_similarity = NeighbourStore.from_matrix(item_users, neighbours, index=self.isbns, keep_self=False)
+
+        print(f"Computed implicit item similarity with {self.item_similarity.matrix.nnz} neighbour pairs")
+        return self
+
+    def fit(self, min_user_interactions=1, min_book_interactions=2, weighting='bm25', neighbours=50):
+        """
+        Fit the implicit feedback model.
+
+        Parameters:
+        -----------
+        min_user_interactions : int
+            Minimum number of interactions a user must have to be included
+        min_book_interactions : int
+            Minimum number of interactions a book must have to be included
+        weighting : str
+            Weighting of the interactions: 'bm25', 'tfidf' or 'none'
+        neighbours : int
+            Number of neighbours kept per book
+        """
+        return (self.create_matrix(min_user_interactions, min_book_interactions)
+                .compute_item_similarity(weighting, neighbours))
+
+    def known_user(self, user_id):
+        """Whether the user has interactions in the model."""
+        return self.user_index is not None and user_id in self.user_index
+
+    @timed_request_stage('scoring')
+    def _top_n(self, interactions, n):
+        """
+        Top-n scores for each row of a sparse interaction matrix.
+
+        A book scores the summed similarity of its neighbours among the row's
+        books; books already in the row are never returned.
+
+        Returns:
+        --------
+        list of pandas.Series
+            Scores indexed by ISBN, best first, one per row
+        """
+        interactions = csr_matrix(interactions)
+        scores = csr_matrix(interactions @ self.item_similarity.matrix)
+        results = []
+        for row in range(scores.shape[0]):
+            start, stop = scores.indptr[row], scores.indptr[row + 1]
+            columns, values = scores.indices[start:stop], scores.data[start:stop].copy()
+            seen = interactions.indices[interactions.indptr[row]:interactions.indptr[row + 1]]
+            values[np.isin(columns, seen) | (values <= 0)] = np.nan
+            top = top_n_positions(values, n)
+            results.append(pd.Series(values[top], index=self.isbns[columns[top]]))
+        return results
+
+    def batch_recommend(self, user_ids, n=10):
+        """
+        Generate recommendations for many users at once.
+
+        Parameters:
+        -----------
+        user_ids : list
+            IDs of the users to get recommendations for
+        n : int
+            Number of recommendations per user
+
+        Returns:
+        --------
+        dict
+            Maps each user ID to a pandas.Series of scores indexed by ISBN,
+            best first (empty for unknown users)
+        """
+        user_ids = list(user_ids)
+        rows = self.user_index.get_indexer(pd.Index(user_ids))
+        known = rows >= 0
+        results = {user_id: pd.Series(dtype=float) for user_id in user_ids}
+        if known.any():
+            scored = self._top_n(self.user_item_matrix[rows[known]], n)
+            for user_id, scores in zip(np.asarray(user_ids, dtype=object)[known], scored):
+                results[user_id] = scores
+        return results
+
+    def recommend(self, user_id, n=10):
+        """
+        Get recommendations for a user from their interactions.
+
+        Parameters:
+        -----------
+        user_id : int or str
+            ID of the user to get recommendations for
+        n : int
+            Number of recommendations to return
+
+        Returns:
+        --------
+        pandas.DataFrame
+            DataFrame containing the recommended books
+        """
+        if not self.known_user(user_id):
+            print(f"User with ID {user_id} has no implicit interactions.")
+            return pd.DataFrame()
+
+        scores = self.batch_recommend([user_id], n=n)[user_id]
+        return self._book_details(scores.index)
+
+    def recommend_for_items(self, book_isbns, n=10):
+        """
+        Get recommendations for a set of books, e.g. those a new user interacted with.
+
+        Parameters:
+        -----------
+        book_isbns : list of str
+            ISBNs of the books (unknown ISBNs are ignored)
+        n : int
+            Number of recommendations to return
+
+        Returns:
+        --------
+        pandas.DataFrame
+            DataFrame containing the recommended books (empty if no ISBN is known)
+        """
+        positions = self.isbns.get_indexer(pd.Index(list(book_isbns)))
+        positions = np.unique(positions[positions >= 0])
+        if len(positions) == 0:
+            return pd.DataFrame()
+
+        interactions = csr_matrix(
+            (np.ones(len(positions), dtype=self.user_item_matrix.dtype), (np.zeros(len(positions), dtype=int), positions)),
+            shape=(1, len(self.isbns))
+        )
+        return self._book_details(self._top_n(interactions, n)[0].index)
+
+    @timed_request_stage('hydration')
+    def _book_details(self, isbns):
+        """Look up book details for a list of ISBNs, keeping their order."""
+        isbns = pd.Index(isbns)
+        # Books missing from books_df are skipped (reindexing them would turn integer columns into floats)
+        return self.books_by_isbn.reindex(isbns[isbns.isin(self.books_by_isbn.index)])
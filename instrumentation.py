@@ -0,0 +1,362 @@
+"""
+Timing instrumentation for the recommendation pipeline.
+
+Fit stages (loading, cleaning, pivoting, similarity, TF-IDF, ...) are always
+timed; they run rarely and take seconds. Per-request stages (lookup, scoring,
+top-N, hydration, serialisation) are only timed for requests selected by
+sampling, so the unsampled hot path costs one context variable lookup.
+
+Observations go into Prometheus-style histograms, gauges and counters in a
+module-level registry, rendered by render_prometheus() in the text exposition format.
+"""
+import bisect
+import contextvars
+import functools
+import math
+import os
+import random
+import threading
+import time
+
+# Histogram bucket upper bounds, in seconds
+REQUEST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        """Record one observation for the given label values."""
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.labelnames + ('le',), labels + (_format_value(bound),))
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_text} {count}')
+        return lines
+
+
+class Gauge:
+    """Gauge with optional labels; values are replaced on every set."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, *labels):
+        """Set the gauge for the given label values (None removes the series)."""
+        with self._lock:
+            if value is None:
+                self._values.pop(labels, None)
+            else:
+                self._values[labels] = value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels. Totals kept elsewhere (e.g. the
+    response cache's) are read at render time from collect(), a callable
+    returning a dictionary of label value tuples to totals.
+    """
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount, *labels):
+        """Add a non-negative amount to the counter for the given label values."""
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        if self.collect is not None:
+            values = sorted(self.collect().items())
+        else:
+            with self._lock:
+                values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    """Named collection of metrics, rendered together."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        """Return the histogram called name, creating it if needed."""
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Return the gauge called name, creating it if needed."""
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def counter(self, name, documentation, labelnames=(), collect=None):
+        """Return the counter called name, creating it if needed."""
+        return self._get_or_create(Counter, name, documentation, labelnames, collect)
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+FIT_STAGE_SECONDS = REGISTRY.histogram(
+    'bookbud_fit_stage_seconds', 'Duration of model fitting stages', ('stage',), FIT_BUCKETS)
+REQUEST_STAGE_SECONDS = REGISTRY.histogram(
+    'bookbud_request_stage_seconds', 'Duration of request processing stages (sampled requests only)', ('stage',))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'bookbud_request_seconds', 'Duration of HTTP requests', ('endpoint', 'status'))
+
+
+class _NullTimer:
+    """Timer used when a stage is not being measured."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ('observe', 'stage', 'started')
+
+    def __init__(self, observe, stage):
+        self.observe = observe
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+# Fit stage durations collected by collect_fit_stages() in the current context
+_fit_collector = contextvars.ContextVar('bookbud_fit_collector', default=None)
+
+
+def _observe_fit_stage(stage, seconds):
+    collected = _fit_collector.get()
+    if collected is not None:
+        collected[stage] = collected.get(stage, 0.0) + seconds
+    else:
+        FIT_STAGE_SECONDS.observe(seconds, stage)
+
+
+class collect_fit_stages:
+    """
+    Context manager collecting fit stage durations into a dictionary
+    instead of the registry, so that they can travel with a model bundle
+    built in another process and be recorded with observe_fit_stages().
+    """
+
+    def __enter__(self):
+        self.stages = {}
+        self._token = _fit_collector.set(self.stages)
+        return self.stages
+
+    def __exit__(self, *exc_info):
+        _fit_collector.reset(self._token)
+        return False
+
+
+def observe_fit_stages(stages):
+    """Record fit stage durations collected by collect_fit_stages()."""
+    for stage, seconds in (stages or {}).items():
+        FIT_STAGE_SECONDS.observe(seconds, stage)
+
+
+def fit_stage(stage):
+    """
+    Time a model fitting stage.
+
+    Usable as a context manager (``with fit_stage('tfidf'):``) or as a
+    decorator (``@fit_stage('pivot')``).
+    """
+    return _FitStage(stage)
+
+
+class _FitStage:
+    __slots__ = ('stage', '_timer')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self._timer = _StageTimer(_observe_fit_stage, self.stage)
+        return self._timer.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._timer.__exit__(*exc_info)
+
+    def __call__(self, fn):
+        stage = self.stage
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _StageTimer(_observe_fit_stage, stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+# Whether the request being handled in the current context is profiled
+_profiling = contextvars.ContextVar('bookbud_profiling', default=False)
+
+# Fraction of requests whose stages are timed (BOOKBUD_PROFILE_SAMPLE_RATE)
+_sample_rate = float(os.environ.get('BOOKBUD_PROFILE_SAMPLE_RATE', 0))
+
+
+def set_sample_rate(rate):
+    """Set the fraction of requests profiled per stage (0 disables, 1 profiles all)."""
+    global _sample_rate
+    _sample_rate = min(max(float(rate), 0.0), 1.0)
+
+
+def get_sample_rate():
+    return _sample_rate
+
+
+def start_request_profile():
+    """
+    Decide whether the current request is profiled.
+
+    Returns:
+    --------
+    contextvars.Token
+        Token to pass to end_request_profile()
+    """
+    return _profiling.set(_sample_rate > 0 and random.random() < _sample_rate)
+
+
+def end_request_profile(token):
+    _profiling.reset(token)
+
+
+def _observe_request_stage(stage, seconds):
+    REQUEST_STAGE_SECONDS.observe(seconds, stage)
+
+
+def request_stage(stage):
+    """
+    Time a per-request stage if the current request is sampled.
+
+    Returns a context manager; unsampled requests get a shared no-op one.
+    """
+    if _profiling.get():
+        return _StageTimer(_observe_request_stage, stage)
+    return _NULL_TIMER
+
+
+def timed_request_stage(stage):
+    """Decorator timing a function as a per-request stage of sampled requests."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _profiling.get():
+                return fn(*args, **kwargs)
+            with _StageTimer(_observe_request_stage, stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def process_memory_bytes():
+    """Resident set size of the current process in bytes (peak RSS where unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def render_prometheus():
+    """Render all registered metrics in the Prometheus text format."""
+    return REGISTRY.render()
@@ -0,0 +1,97 @@
+import warnings
+import pandas as pd
+import numpy as np
+from instrumentation import timed_request_stage
+from precision import as_float
+
+
+@timed_request_stage('top_n')
+def top_n_positions(scores, n):
+    """
+    Return positions of the n largest non-NaN scores, best first.
+
+    Ties are kept in position order, as a stable full sort would.
+
+    Parameters:
+    -----------
+    scores : numpy.ndarray
+        1-D array of scores (NaN for items that must not be returned)
+    n : int
+        Number of positions to return
+
+    Returns:
+    --------
+    numpy.ndarray
+        Positions into scores, ordered by descending score
+    """
+    valid = np.flatnonzero(~np.isnan(scores))
+    if len(valid) > n:
+        threshold = scores[valid[np.argpartition(-scores[valid], n - 1)[n - 1]]]
+        above = valid[scores[valid] > threshold]
+        tied = valid[scores[valid] == threshold][:n - len(above)]
+        valid = np.sort(np.concatenate([above, tied]))
+    return valid[np.argsort(-scores[valid], kind='stable')]
+
+
+def scale_scores(scores):
+    """Min-max scale scores to [0, 1] along the last axis, ignoring NaNs."""
+    scores = as_float(scores)
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low = np.nanmin(scores, axis=-1, keepdims=True)
+        high = np.nanmax(scores, axis=-1, keepdims=True)
+    span = np.where(high > low, high - low, 1.0)
+    return (scores - low) / span
+
+
+class ItemIndex:
+    """
+    Unified ISBN <-> position index shared by all recommenders.
+    Lets each recommender express its scores as a vector over the same items,
+    so that they can be blended with plain array arithmetic.
+    """
+
+    def __init__(self, isbns):
+        """
+        Initialize the item index.
+
+        Parameters:
+        -----------
+        isbns : iterable of str
+            ISBNs in index order (duplicates are dropped, keeping the first)
+        """
+        self.isbns = pd.Index(pd.unique(np.asarray(list(isbns), dtype=object)))
+
+    @classmethod
+    def from_books(cls, books_df):
+        """Create an index over the books of a books DataFrame, in row order."""
+        return cls(books_df['ISBN'])
+
+    def __len__(self):
+        return len(self.isbns)
+
+    def positions(self, isbns):
+        """Map ISBNs to index positions (-1 for ISBNs not in the index)."""
+        return self.isbns.get_indexer(pd.Index(isbns))
+
+    def scatter(self, values, positions):
+        """
+        Place values into a vector over the index.
+
+        Parameters:
+        -----------
+        values : numpy.ndarray
+            Values whose last axis corresponds to positions
+        positions : numpy.ndarray
+            Index position of each value (-1 to drop the value)
+
+        Returns:
+        --------
+        numpy.ndarray
+            Array with the last axis of length len(self); NaN where no value was given
+        """
+        values = as_float(values)
+        aligned = np.full(values.shape[:-1] + (len(self),), np.nan, dtype=values.dtype)
+        keep = positions >= 0
+        aligned[..., positions[keep]] = values[..., keep]
+        return aligned
@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from instrumentation import fit_stage
 
 class PopularityRecommender:
     """
@@ -23,6 +24,7 @@ class PopularityRecommender:
         self.books_df = books_df
         self.popularity_df = None
         
+    @fit_stage('popularity')
     def fit(self, min_ratings=10):
         """
         Calculate popularity metrics for all books.
@@ -95,6 +97,29 @@ class PopularityRecommender:
         # Return top n recommendations
         return sorted_df.head(n)
     
+    def score_vector(self, item_index, criteria='popularity_score'):
+        """
+        Popularity scores aligned to a shared ItemIndex.
+        
+        Parameters:
+        -----------
+        item_index : ItemIndex
+            Item index the returned vector is aligned to
+        criteria : str
+            Column to score by: 'popularity_score', 'rating_count', or 'rating_mean'
+            
+        Returns:
+        --------
+        numpy.ndarray
+            Scores of length len(item_index); NaN for books without popularity metrics
+        """
+        if self.popularity_df is None:
+            print("Error: You must call fit() before score_vector().")
+            return np.full(len(item_index), np.nan)
+        
+        scores = self.popularity_df.groupby('ISBN')[criteria].max()
+        return item_index.scatter(scores.values, item_index.positions(scores.index))
+    
     def recommend_by_year(self, year, n=10, criteria='popularity_score'):
         """
         Get the most popular books for a specific publication year.
@@ -0,0 +1,45 @@
+"""
+Floating-point precision of the fitted models.
+
+BOOKBUD_PRECISION ('float64' by default, or 'float32') sets the dtype of the
+rating pivots, user means, TF-IDF and similarity matrices built at fit time.
+Scoring follows the dtype of the fitted matrices, so a model keeps the
+precision it was fitted with (also after being pickled and reloaded).
+"""
+import os
+
+import numpy as np
+
+PRECISIONS = ('float32', 'float64')
+
+_dtype = None
+
+
+def set_precision(name):
+    """
+    Set the precision of models fitted from now on.
+
+    Parameters:
+    -----------
+    name : str
+        'float32' or 'float64'
+    """
+    global _dtype
+    if str(name) not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {name} (expected one of {', '.join(PRECISIONS)})")
+    _dtype = np.dtype(str(name))
+
+
+def float_dtype():
+    """The numpy dtype models are fitted with."""
+    if _dtype is None:
+        set_precision(os.environ.get('BOOKBUD_PRECISION', 'float64'))
+    return _dtype
+
+
+def as_float(values):
+    """values as a floating-point array, keeping float32/float64 input as is."""
+    values = np.asarray(values)
+    if values.dtype.kind != 'f':
+        values = values.astype(float_dtype())
+    return values
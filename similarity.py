@@ -0,0 +1,276 @@
+"""
+Parallel block-wise cosine similarity.
+
+The rows of a sparse matrix are L2-normalised once, split into row blocks
+and each block is multiplied with the transposed matrix on a thread (or
+process) pool. Blocks are either written into a dense similarity matrix
+(exact) or reduced to their top-K entries per row as soon as they are
+computed, so peak memory is bounded by the block size rather than by the
+full n x n product. Top-K results are kept in a NeighbourStore. Float32
+input stays float32 throughout.
+
+Each block can also be weighted by its co-rating counts (one binary sparse
+product): similarities are shrunk by n / (n + shrinkage) and pairs with
+fewer than min_support co-ratings are dropped.
+
+BOOKBUD_SIMILARITY_WORKERS (default: CPU count) and
+BOOKBUD_SIMILARITY_BLOCK_SIZE (default 1024 rows) set the defaults.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, diags
+
+from precision import float_dtype
+
+DEFAULT_WORKERS = int(os.environ.get('BOOKBUD_SIMILARITY_WORKERS', 0)) or os.cpu_count() or 1
+DEFAULT_BLOCK_SIZE = int(os.environ.get('BOOKBUD_SIMILARITY_BLOCK_SIZE', 1024))
+
+
+def _as_float_csr(matrix):
+    """matrix as CSR, keeping float32/float64 values (other dtypes use the model precision)."""
+    matrix = csr_matrix(matrix)
+    return matrix if matrix.dtype.kind == 'f' else matrix.astype(float_dtype())
+
+
+def normalize_rows(matrix):
+    """
+    Scale the rows of a matrix to unit L2 norm (rows of zeros stay zero).
+
+    Returns:
+    --------
+    scipy.sparse.csr_matrix
+        The normalised matrix, so that cosine similarity is a dot product
+    """
+    matrix = _as_float_csr(matrix)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    with np.errstate(divide='ignore'):
+        scale = np.where(norms > 0, 1.0 / norms, 0.0)
+    return csr_matrix(diags(scale) @ matrix)
+
+
+def row_means(matrix):
+    """
+    Mean of the stored entries of each row of a sparse matrix.
+
+    Returns:
+    --------
+    numpy.ndarray
+        Row means (NaN for rows without stored entries), in the matrix's precision
+    """
+    matrix = _as_float_csr(matrix)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.asarray(matrix.sum(axis=1)).ravel() / matrix.getnnz(axis=1)
+    return means.astype(matrix.dtype)
+
+
+def _binary(matrix, dtype):
+    """The non-zero pattern of matrix as a CSR matrix of ones."""
+    matrix = csr_matrix(matrix, copy=True)
+    matrix.eliminate_zeros()
+    matrix.data = np.ones(len(matrix.data), dtype=dtype)
+    return matrix
+
+
+def _block_product(operands, start, stop):
+    """Sparse similarities of rows[start:stop] with every row, weighted by co-rating support."""
+    rows, columns_t, support = operands
+    similarities = rows[start:stop] @ columns_t
+    if support is None:
+        return similarities
+
+    binary, binary_t, shrinkage, min_support = support
+    weights = csr_matrix(binary[start:stop] @ binary_t)
+    counts = weights.data
+    weights.data = np.where(counts >= min_support, counts / (counts + shrinkage), 0).astype(counts.dtype)
+    similarities = csr_matrix(similarities.multiply(weights))
+    similarities.eliminate_zeros()
+    return similarities
+
+
+def _top_k_block(similarities, start, k, keep_self):
+    """
+    Reduce a sparse block of similarities to the top k entries of each row.
+
+    Only the stored (non-zero) similarities are ranked, so the work and
+    memory are proportional to the block's non-zeros, not to its width.
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        (row counts, column indices, values) of the kept entries, in CSR
+        order (columns are not sorted within a row)
+    """
+    similarities = csr_matrix(similarities)
+    n_rows = similarities.shape[0]
+    indptr = similarities.indptr
+    row_ids = np.repeat(np.arange(n_rows), np.diff(indptr))
+    columns = similarities.indices
+    values = similarities.data
+    is_self = columns == row_ids + start
+    keep = (values != 0) & ~is_self
+
+    # Rows with more than k neighbours keep their k largest: one partial
+    # sort per row, linear in the row's non-zeros
+    for row in np.flatnonzero(np.bincount(row_ids[keep], minlength=n_rows) > k):
+        segment = np.flatnonzero(keep[indptr[row]:indptr[row + 1]]) + indptr[row]
+        keep[segment[np.argpartition(-values[segment], k - 1)[k:]]] = False
+
+    if keep_self:
+        keep |= is_self & (values != 0)
+    return np.bincount(row_ids[keep], minlength=n_rows), columns[keep], values[keep]
+
+
+def _dense_block(operands, start, stop, out):
+    """Write the dense similarities of rows[start:stop] into out[start:stop]."""
+    _block_product(operands, start, stop).toarray(out=out[start:stop])
+
+
+# Block product operands of the current worker process (process executor)
+_worker_operands = None
+
+
+def _init_worker(operands):
+    global _worker_operands
+    _worker_operands = operands
+
+
+def _dense_block_in_worker(start, stop):
+    return _block_product(_worker_operands, start, stop).toarray()
+
+
+def _top_k_block_in_worker(start, stop, k, keep_self):
+    return _top_k_block(_block_product(_worker_operands, start, stop), start, k, keep_self)
+
+
+def block_similarity(matrix, k=None, block_size=None, workers=None, executor='thread',
+                     keep_self=True, normalized=False, shrinkage=0.0, min_support=1, support=None):
+    """
+    Cosine similarity between all rows of a matrix, computed block by block in parallel.
+
+    Parameters:
+    -----------
+    matrix : scipy.sparse matrix or numpy.ndarray
+        Matrix whose rows are compared
+    k : int, optional
+        Number of neighbours kept per row (besides the row itself); None
+        computes the exact, dense similarity matrix
+    block_size : int, optional
+        Rows per block (defaults to BOOKBUD_SIMILARITY_BLOCK_SIZE)
+    workers : int, optional
+        Pool size (defaults to BOOKBUD_SIMILARITY_WORKERS or the CPU count)
+    executor : str
+        'thread' (sparse products and BLAS release the GIL) or 'process'
+    keep_self : bool
+        Whether top-K rows also keep each row's similarity with itself
+    normalized : bool
+        Whether the rows are already L2-normalised
+    shrinkage : float
+        Shrink each similarity by n / (n + shrinkage), n being the number
+        of co-rated columns of the pair (0 disables)
+    min_support : int
+        Drop pairs with fewer co-rated columns
+    support : scipy.sparse matrix, optional
+        Matrix whose non-zero pattern defines the co-ratings (defaults to
+        matrix, e.g. pass the raw ratings for mean-centred rows)
+
+    Returns:
+    --------
+    numpy.ndarray or scipy.sparse.csr_matrix
+        Dense (n, n) similarities when k is None, otherwise a sparse matrix
+        with at most k (+1 with keep_self) non-zero entries per row
+    """
+    rows = _as_float_csr(matrix) if normalized else normalize_rows(matrix)
+    columns_t = csr_matrix(rows.T)
+    operands = (rows, columns_t, None)
+    if shrinkage or min_support > 1:
+        binary = _binary(matrix if support is None else support, rows.dtype)
+        operands = (rows, columns_t, (binary, csr_matrix(binary.T), shrinkage, min_support))
+    n = rows.shape[0]
+    block_size = block_size or DEFAULT_BLOCK_SIZE
+    workers = max(1, min(workers or DEFAULT_WORKERS, -(-n // block_size)))
+    starts = list(range(0, n, block_size))
+    stops = [min(start + block_size, n) for start in starts]
+
+    if executor not in ('thread', 'process'):
+        raise ValueError(f"Unknown executor: {executor}")
+    if executor == 'process' and workers > 1:
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(operands,))
+    else:
+        pool = ThreadPoolExecutor(workers)
+
+    with pool:
+        if k is None:
+            similarities = np.empty((n, n), dtype=rows.dtype)
+            if isinstance(pool, ThreadPoolExecutor):
+                # Threads write their blocks in place
+                list(pool.map(lambda start, stop: _dense_block(operands, start, stop, similarities),
+                              starts, stops))
+            else:
+                for start, stop, block in zip(starts, stops, pool.map(_dense_block_in_worker, starts, stops)):
+                    similarities[start:stop] = block
+            return similarities
+
+        if isinstance(pool, ThreadPoolExecutor):
+            blocks = pool.map(lambda start, stop: _top_k_block(
+                _block_product(operands, start, stop), start, k, keep_self), starts, stops)
+        else:
+            blocks = pool.map(_top_k_block_in_worker, starts, stops, [k] * len(starts), [keep_self] * len(starts))
+        counts, columns, values = zip(*blocks) if starts else ((), (), ())
+    if not starts:
+        return csr_matrix((n, n), dtype=rows.dtype)
+    indptr = np.concatenate([[0], np.cumsum(np.concatenate(counts))])
+    similarities = csr_matrix((np.concatenate(values), np.concatenate(columns), indptr), shape=(n, n))
+    similarities.sort_indices()
+    return similarities
+
+
+class NeighbourStore:
+    """
+    Top-K neighbours of every row of a similarity matrix, stored sparsely.
+
+    Positional row access (store[rows]) returns dense similarity rows with
+    zeros outside the stored neighbours, so it can stand in for a dense
+    similarity array; loc(label) returns one row's neighbours by label.
+    """
+
+    def __init__(self, matrix, index=None):
+        """
+        Parameters:
+        -----------
+        matrix : scipy.sparse.csr_matrix
+            (n, n) matrix of the kept similarities (see block_similarity)
+        index : pandas.Index, optional
+            Labels of the rows and columns
+        """
+        self.matrix = csr_matrix(matrix)
+        self.index = pd.Index(index) if index is not None else pd.RangeIndex(self.matrix.shape[0])
+
+    @classmethod
+    def from_matrix(cls, matrix, k, index=None, **kwargs):
+        """Compute the top-k neighbours of every row of matrix (see block_similarity)."""
+        return cls(block_similarity(matrix, k=k, **kwargs), index)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def nbytes(self):
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __getitem__(self, rows):
+        """Dense similarity rows (1-D for a single position)."""
+        if np.ndim(rows) == 0:
+            return self.matrix[int(rows)].toarray().ravel()
+        return self.matrix[np.asarray(rows)].toarray()
+
+    def loc(self, label):
+        """Neighbours of the row labelled label, as similarities indexed by label."""
+        row = self.matrix[self.index.get_loc(label)]
+        return pd.Series(row.data, index=self.index[row.indices])
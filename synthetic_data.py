@@ -0,0 +1,271 @@
+"""
+Deterministic synthetic data generator shaped like the Book-Crossing dataset.
+
+Writes Books.csv, Ratings.csv and Users.csv with the same columns as the
+real files. User activity and book popularity follow power laws, about 62%
+of ratings are implicit (0) as in Book-Crossing, and explicit ratings depend
+on a latent book quality and user bias so collaborative filtering has a
+signal to find. The same arguments and seed always produce the same files.
+
+Example:
+    python synthetic_data.py --ratings 1000000 --output data/synthetic
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+# Share of each rating value 0-10 (0 is an implicit rating), after Book-Crossing
+RATING_SHARES = np.array([0.62, 0.002, 0.0025, 0.005, 0.007, 0.035, 0.03, 0.063, 0.089, 0.07, 0.0765])
+
+LOCATIONS = [
+    ('usa', ['new york, new york', 'seattle, washington', 'chicago, illinois', 'austin, texas',
+             'portland, oregon', 'boston, massachusetts', 'san diego, california', 'denver, colorado']),
+    ('canada', ['toronto, ontario', 'vancouver, british columbia', 'montreal, quebec', 'calgary, alberta']),
+    ('united kingdom', ['london, england', 'manchester, england', 'edinburgh, scotland']),
+    ('germany', ['berlin, berlin', 'munich, bayern', 'hamburg, hamburg']),
+    ('spain', ['madrid, madrid', 'barcelona, catalunya']),
+    ('australia', ['sydney, new south wales', 'melbourne, victoria']),
+    ('france', ['paris, ile de france', 'lyon, rhone']),
+    ('italy', ['rome, lazio', 'milan, lombardia']),
+    ('portugal', ['lisbon, lisboa', 'porto, porto']),
+    ('netherlands', ['amsterdam, noord holland']),
+]
+# Relative number of users per country in LOCATIONS
+COUNTRY_SHARES = np.array([0.56, 0.15, 0.07, 0.06, 0.04, 0.04, 0.03, 0.02, 0.02, 0.01])
+
+SYLLABLES = ['ka', 'ri', 'mo', 'ten', 'la', 'vor', 'shi', 'an', 'del', 'is', 'ro', 'mi', 'nar', 'est',
+             'ul', 'be', 'tha', 'gon', 'pe', 'ly', 'cor', 'win', 'sa', 'dre', 'fel', 'or', 'quin', 'zu']
+
+
+def power_law_weights(n, exponent, rng):
+    """Probability of each of n items under a power law, assigned to items in random order."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    weights = weights[rng.permutation(n)]
+    return weights / weights.sum()
+
+
+def isbn10(numbers):
+    """Turn 9-digit numbers into ISBN-10 strings with a valid check digit."""
+    numbers = np.asarray(numbers, dtype=np.int64)
+    digits = (numbers[:, None] // 10 ** np.arange(8, -1, -1)) % 10
+    check = (digits * np.arange(10, 1, -1)).sum(axis=1) % 11
+    check = (11 - check) % 11
+    check_chars = np.where(check == 10, 'X', check.astype(str))
+    return np.char.add(np.char.zfill(numbers.astype(str), 9), check_chars)
+
+
+def _vocabulary(n_words, rng):
+    """Pseudo-words built from syllables, used for titles, authors and publishers."""
+    words = set()
+    while len(words) < n_words:
+        length = rng.integers(2, 4)
+        words.add(''.join(rng.choice(SYLLABLES, length)))
+    return np.array(sorted(words))
+
+
+def generate_books(n_books, rng):
+    """
+    Generate the books table.
+
+    Parameters:
+    -----------
+    n_books : int
+        Number of books
+    rng : numpy.random.Generator
+        Random number generator
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Books with the columns of Books.csv
+    """
+    vocabulary = _vocabulary(min(4000, max(200, n_books // 10)), rng)
+    word_weights = power_law_weights(len(vocabulary), 1.0, rng)
+
+    n_words = rng.integers(2, 6, n_books)
+    words = vocabulary[rng.choice(len(vocabulary), n_words.sum(), p=word_weights)]
+    bounds = np.concatenate([[0], np.cumsum(n_words)])
+    titles = [' '.join(words[bounds[i]:bounds[i + 1]]).title() for i in range(n_books)]
+
+    n_authors = max(1, n_books // 3)
+    authors = np.char.add(np.char.add(vocabulary[rng.integers(0, len(vocabulary), n_authors)], ' '),
+                          vocabulary[rng.integers(0, len(vocabulary), n_authors)])
+    authors = np.char.title(authors)
+    n_publishers = max(1, n_books // 50)
+    publishers = np.char.add(np.char.title(vocabulary[rng.integers(0, len(vocabulary), n_publishers)]), ' Press')
+
+    # Publication years skewed towards the late 1990s, with some unknown (0) years
+    years = np.clip(np.round(2004 - rng.exponential(9, n_books)), 1900, 2004).astype(int)
+    years[rng.random(n_books) < 0.01] = 0
+
+    isbns = isbn10(rng.choice(10 ** 9, n_books, replace=False))
+    image = 'http://images.amazon.com/images/P/'
+    return pd.DataFrame({
+        'ISBN': isbns,
+        'Book-Title': titles,
+        'Book-Author': authors[rng.choice(n_authors, n_books, p=power_law_weights(n_authors, 0.8, rng))],
+        'Year-Of-Publication': years,
+        'Publisher': publishers[rng.choice(n_publishers, n_books, p=power_law_weights(n_publishers, 1.1, rng))],
+        'Image-URL-S': np.char.add(np.char.add(image, isbns), '.01.THUMBZZZ.jpg'),
+        'Image-URL-M': np.char.add(np.char.add(image, isbns), '.01.MZZZZZZZ.jpg'),
+        'Image-URL-L': np.char.add(np.char.add(image, isbns), '.01.LZZZZZZZ.jpg'),
+    })
+
+
+def generate_users(n_users, rng):
+    """
+    Generate the users table.
+
+    Parameters:
+    -----------
+    n_users : int
+        Number of users
+    rng : numpy.random.Generator
+        Random number generator
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Users with the columns of Users.csv
+    """
+    countries = rng.choice(len(LOCATIONS), n_users, p=COUNTRY_SHARES / COUNTRY_SHARES.sum())
+    locations = []
+    for country in countries:
+        name, cities = LOCATIONS[country]
+        locations.append(f"{cities[rng.integers(len(cities))]}, {name}")
+    locations = np.array(locations, dtype=object)
+    # Book-Crossing locations are often incomplete
+    missing_state = rng.random(n_users) < 0.05
+    locations[missing_state] = [f"{loc.split(',')[0]}, , {loc.split(',')[2].strip()}" for loc in locations[missing_state]]
+    locations[rng.random(n_users) < 0.02] = 'n/a, n/a, n/a'
+
+    # About 40% of ages are missing, and a few are implausible
+    ages = np.clip(np.round(rng.normal(35, 13, n_users)), 5, 99)
+    outliers = rng.random(n_users) < 0.01
+    ages[outliers] = rng.choice([0, 1, 103, 119, 200, 244], outliers.sum())
+    ages[rng.random(n_users) < 0.4] = np.nan
+
+    return pd.DataFrame({'User-ID': np.arange(1, n_users + 1), 'Location': locations, 'Age': ages})
+
+
+def generate_ratings(n_ratings, books, users, rng, book_exponent=0.9, user_exponent=1.0):
+    """
+    Generate the ratings table.
+
+    Parameters:
+    -----------
+    n_ratings : int
+        Number of distinct (user, book) ratings
+    books, users : pandas.DataFrame
+        Tables from generate_books and generate_users
+    rng : numpy.random.Generator
+        Random number generator
+    book_exponent, user_exponent : float
+        Power-law exponents of book popularity and user activity
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Ratings with the columns of Ratings.csv
+    """
+    n_books, n_users = len(books), len(users)
+    n_ratings = min(n_ratings, n_books * n_users)
+    book_weights = power_law_weights(n_books, book_exponent, rng)
+    user_weights = power_law_weights(n_users, user_exponent, rng)
+
+    # Draw pairs until there are enough distinct ones, keeping the first draw of each
+    pairs = np.empty(0, dtype=np.int64)
+    while len(pairs) < n_ratings:
+        draw = int((n_ratings - len(pairs)) * 1.2) + 16
+        new = (rng.choice(n_users, draw, p=user_weights).astype(np.int64) * n_books +
+               rng.choice(n_books, draw, p=book_weights))
+        pairs = np.concatenate([pairs, new])
+        _, first = np.unique(pairs, return_index=True)
+        pairs = pairs[np.sort(first)]
+    pairs = pairs[:n_ratings]
+    user_rows, book_rows = pairs // n_books, pairs % n_books
+
+    # Explicit ratings follow book quality and user bias; most ratings are implicit (0)
+    quality = rng.normal(0, 1, n_books)
+    bias = rng.normal(0, 0.7, n_users)
+    explicit_shares = RATING_SHARES[1:] / RATING_SHARES[1:].sum()
+    explicit_mean = (np.arange(1, 11) * explicit_shares).sum()
+    scores = explicit_mean + 1.4 * quality[book_rows] + bias[user_rows] + rng.normal(0, 1.2, n_ratings)
+    ratings = np.clip(np.round(scores), 1, 10).astype(int)
+    ratings[rng.random(n_ratings) < RATING_SHARES[0]] = 0
+
+    return pd.DataFrame({
+        'User-ID': users['User-ID'].values[user_rows],
+        'ISBN': books['ISBN'].values[book_rows],
+        'Book-Rating': ratings,
+    })
+
+
+def generate_dataset(n_ratings, n_books=None, n_users=None, seed=0):
+    """
+    Generate a complete Book-Crossing-shaped dataset.
+
+    Parameters:
+    -----------
+    n_ratings : int
+        Number of ratings (10k to 10M is a sensible range)
+    n_books : int, optional
+        Number of books (defaults to n_ratings / 4, as in Book-Crossing)
+    n_users : int, optional
+        Number of users (defaults to n_ratings / 4, as in Book-Crossing)
+    seed : int
+        Random seed
+
+    Returns:
+    --------
+    tuple of pandas.DataFrame
+        (books, ratings, users)
+    """
+    rng = np.random.default_rng(seed)
+    n_books = n_books or max(100, n_ratings // 4)
+    n_users = n_users or max(100, n_ratings // 4)
+    books = generate_books(n_books, rng)
+    users = generate_users(n_users, rng)
+    ratings = generate_ratings(n_ratings, books, users, rng)
+    return books, ratings, users
+
+
+def write_dataset(output_dir, books, ratings, users):
+    """
+    Write a dataset as Books.csv, Ratings.csv and Users.csv.
+
+    Returns:
+    --------
+    dict
+        Paths of the written files, keyed by 'books', 'ratings' and 'users'
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {
+        'books': os.path.join(output_dir, 'Books.csv'),
+        'ratings': os.path.join(output_dir, 'Ratings.csv'),
+        'users': os.path.join(output_dir, 'Users.csv'),
+    }
+    books.to_csv(paths['books'], index=False, encoding='latin-1')
+    ratings.to_csv(paths['ratings'], index=False, encoding='latin-1')
+    users.to_csv(paths['users'], index=False, encoding='latin-1')
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic Book-Crossing-shaped dataset")
+    parser.add_argument('--ratings', type=int, default=100000, help="Number of ratings")
+    parser.add_argument('--books', type=int, default=None, help="Number of books (default: ratings / 4)")
+    parser.add_argument('--users', type=int, default=None, help="Number of users (default: ratings / 4)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--output', required=True, help="Output directory")
+    args = parser.parse_args(argv)
+
+    books, ratings, users = generate_dataset(args.ratings, n_books=args.books, n_users=args.users, seed=args.seed)
+    write_dataset(args.output, books, ratings, users)
+    print(f"Wrote {len(books)} books, {len(ratings)} ratings and {len(users)} users to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
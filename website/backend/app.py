@@ -1,46 +1,29 @@
-from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-import pandas as pd
-import numpy as np
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+import asyncio
+import json
 import os
+import pickle
+from multiprocessing.reduction import ForkingPickler
 import sys
-import uvicorn
-from pydantic import BaseModel
+import time
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any, Union
 
-# Add multiple possible paths to find the recommendation modules
-possible_paths = [
-    os.path.dirname(os.path.abspath(__file__)),  # Current directory
-    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),  # Root project directory
-    '/app',  # Railway app directory
-    '/app/website/backend',  # Railway backend directory
-    '.',  # Current working directory
-]
-
-for path in possible_paths:
-    if path not in sys.path:
-        sys.path.append(path)
-        print(f"Added {path} to sys.path")
-
-# Print current sys.path for debugging
-print(f"sys.path: {sys.path}")
-
-# Print current directory contents for debugging
-print(f"Current directory contents: {os.listdir(os.path.dirname(os.path.abspath(__file__)))}")
-
-# Import recommendation system modules
-try:
-    from data_preprocessing import DataPreprocessor
-    from content_based import ContentBasedRecommender
-    from collaborative_filtering import CollaborativeFilteringRecommender
-    from popularity_based import PopularityRecommender
-    print("Successfully imported all recommendation modules")
-except ImportError as e:
-    print(f"Import error: {e}")
-    # Try to find the modules in the current directory
-    module_files = [f for f in os.listdir(os.path.dirname(os.path.abspath(__file__))) if f.endswith('.py')]
-    print(f"Python files in current directory: {module_files}")
+# The recommendation modules live in the project root (/app on Railway)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+# Only lightweight modules are imported here so the server binds and answers health
+# checks right away; pandas, scikit-learn and the recommenders are imported when the
+# models are built (in the build process) or loaded
+from model_manager import ModelBundle, ModelManager, ModelNotReady
+from response_cache import ResponseCache
+from executors import ExecutorLayer, ExecutorOverloaded
+from coalescing import SingleFlight, MicroBatcher
+import instrumentation
 
 app = FastAPI(title="Book Bud API", description="API for Book Bud Recommendation System")
 
@@ -53,40 +36,57 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# Hardcoded paths for Railway deployment
-# Use absolute paths to the /app directory where the files are actually located
-BOOKS_PATH = "/app/Books.csv"
-RATINGS_PATH = "/app/Ratings.csv"
-USERS_PATH = "/app/Users.csv"
-
-print(f"Using hardcoded paths for CSV files:")
-print(f"BOOKS_PATH: {BOOKS_PATH}")
-print(f"RATINGS_PATH: {RATINGS_PATH}")
-print(f"USERS_PATH: {USERS_PATH}")
-
-# Debug: List root directory contents
-try:
-    print(f"Root directory contents: {os.listdir('/')}")
-except Exception as e:
-    print(f"Error listing root directory: {e}")
-
-# Debug: List /app directory contents
-try:
-    print(f"/app directory contents: {os.listdir('/app')}")
-except Exception as e:
-    print(f"Error listing /app directory: {e}")
-
-print(f"Using data files from: {BOOKS_PATH}")
-
-# Initialize data and models
-preprocessor = None
-content_recommender = None
-collaborative_recommender = None
-popularity_recommender = None
-guest_recommender = None
-
-# Models initialization flag
-models_initialized = False
+# Dataset location: the /app directory on Railway, overridable with BOOKBUD_DATA_DIR (e.g. for load tests)
+DATA_DIR = os.environ.get("BOOKBUD_DATA_DIR", "/app")
+BOOKS_PATH = os.path.join(DATA_DIR, "Books.csv")
+RATINGS_PATH = os.path.join(DATA_DIR, "Ratings.csv")
+USERS_PATH = os.path.join(DATA_DIR, "Users.csv")
+
+# Thread/process pools that keep blocking model work off the event loop
+executors = ExecutorLayer.from_env()
+
+# Encoded responses keyed by endpoint parameters and model, dropped from memory whenever models are reloaded
+response_cache = ResponseCache.from_env(run_blocking=executors.run_thread)
+
+# Owner of the fitted models; handlers read the current bundle once per request (serving_bundle)
+# and pass it to the functions that build the response
+model_manager = ModelManager.from_env(BOOKS_PATH, RATINGS_PATH, USERS_PATH,
+                                      run_background=executors.run_background)
+
+# Precomputed top-N recommendations (BOOKBUD_RECOMMENDATION_STORE), used while they match the served models
+recommendation_store = None
+if os.environ.get("BOOKBUD_RECOMMENDATION_STORE"):
+    from recommendation_store import RecommendationStore
+    recommendation_store = RecommendationStore.from_env()
+
+# Concurrent identical computations share one in-flight result
+single_flight = SingleFlight()
+
+# Seconds to collect concurrent content-based ISBN queries into one batch (0 disables micro-batching)
+MICRO_BATCH_WINDOW = float(os.environ.get("BOOKBUD_MICRO_BATCH_WINDOW_MS", 2)) / 1000
+MICRO_BATCH_SIZE = int(os.environ.get("BOOKBUD_MICRO_BATCH_SIZE", 64))
+
+# Seconds between background model rebuilds (0 disables periodic rebuilds)
+REBUILD_INTERVAL = float(os.environ.get("BOOKBUD_REBUILD_INTERVAL", 0))
+
+def _on_bundle_swap(bundle):
+    response_cache.invalidate()
+    executors.reset_process_pool()
+
+model_manager.add_listener(_on_bundle_swap)
+
+def _inherited_bundle():
+    return model_manager.current
+
+def _reduce_bundle(bundle):
+    # Process-lane workers fork from the serving process after every swap and already hold the
+    # current bundle, so it is sent to them by reference; an older bundle still captured by an
+    # in-flight request is sent whole
+    if bundle is model_manager.current:
+        return _inherited_bundle, ()
+    return bundle.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+
+ForkingPickler.register(ModelBundle, _reduce_bundle)
 
 # Pydantic models for request/response
 class BookResponse(BaseModel):
@@ -113,50 +113,32 @@ class GuestRatingRequest(BaseModel):
     ratings: List[GuestRatingItem]
     limit: int = 10
 
+# Maximum number of queries accepted by one batch request
+MAX_BATCH_QUERIES = 10000
+
+# Number of queries scored per matrix operation (and per streamed chunk)
+BATCH_CHUNK_SIZE = int(os.environ.get("BOOKBUD_BATCH_CHUNK_SIZE", 256))
+
+class CollaborativeBatchRequest(BaseModel):
+    user_ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES)
+    method: str = Field("user", pattern="^(user|item|hybrid)$")
+    limit: int = Field(10, ge=1, le=50)
+
+class ContentBatchRequest(BaseModel):
+    isbns: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_QUERIES)
+    limit: int = Field(10, ge=1, le=50)
+
 # Function to initialize models in the background
 def initialize_models_background():
-    import asyncio
     asyncio.create_task(_initialize_models())
 
 async def _initialize_models():
-    global preprocessor, content_recommender, collaborative_recommender, popularity_recommender, guest_recommender, models_initialized
-    
-    try:
-        print("Loading and preprocessing data in background...")
-        preprocessor = DataPreprocessor(BOOKS_PATH, RATINGS_PATH, USERS_PATH)
-        preprocessor.load_data().clean_books_data().clean_ratings_data().clean_users_data().merge_data()
-        
-        print("Initializing recommendation models...")
-        # Initialize content-based recommender
-        content_recommender = ContentBasedRecommender(preprocessor.books_processed)
-        content_recommender.fit()
-        
-        # Initialize collaborative filtering recommender
-        collaborative_recommender = CollaborativeFilteringRecommender(
-            preprocessor.ratings_processed, preprocessor.books_processed
-        )
-        collaborative_recommender.fit(min_user_ratings=10, min_book_ratings=5)
-        
-        # Initialize popularity-based recommender
-        popularity_recommender = PopularityRecommender(preprocessor.ratings_processed, preprocessor.books_processed)
-        
-        # Import and initialize the guest recommendation engine
-        try:
-            from guest_recommendation import GuestRecommendationEngine
-            guest_recommender = GuestRecommendationEngine(
-                preprocessor.ratings_processed, 
-                preprocessor.books_processed,
-                preprocessor.users_processed
-            )
-            print("Guest recommendation engine initialized successfully!")
-        except Exception as e:
-            print(f"Error initializing guest recommendation engine: {e}")
-            guest_recommender = None
-        
-        models_initialized = True
+    # Reuse a saved bundle when available; otherwise build one in a child process
+    if await model_manager.refresh(from_disk=True) is not None:
         print("All models initialized successfully!")
-    except Exception as e:
-        print(f"Error initializing models: {str(e)}")
+    
+    if REBUILD_INTERVAL > 0:
+        await model_manager.run_periodic(REBUILD_INTERVAL)
 
 @app.on_event("startup")
 async def startup_event():
@@ -165,21 +147,181 @@ async def startup_event():
     initialize_models_background()
     print("Model initialization started in background")
 
-def convert_to_response(df):
-    """Convert DataFrame to list of BookResponse objects"""
-    books = []
-    for _, row in df.iterrows():
-        book = {
-            "ISBN": row.get("ISBN", ""),
-            "Title": row.get("Book-Title", "Unknown Title"),
-            "Author": row.get("Book-Author", "Unknown Author"),
-            "Year": int(row.get("Year-Of-Publication", 0)) if pd.notna(row.get("Year-Of-Publication", None)) else None,
-            "Publisher": row.get("Publisher", None),
-            "ImageURL": row.get("Image-URL-L", None),
-            "Rating": float(row.get("rating_mean", 0)) if pd.notna(row.get("rating_mean", None)) else None
-        }
-        books.append(book)
-    return books
+@app.on_event("shutdown")
+async def shutdown_event():
+    executors.shutdown()
+
+@app.exception_handler(ExecutorOverloaded)
+async def executor_overloaded_handler(request: Request, exc: ExecutorOverloaded):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(ModelNotReady)
+async def model_not_ready_handler(request: Request, exc: ModelNotReady):
+    retry_after = max(1, min(int(exc.eta_seconds or 5), 60))
+    return JSONResponse(status_code=503, content={
+        "detail": str(exc), "model": exc.model, "eta_seconds": exc.eta_seconds
+    }, headers={"Retry-After": str(retry_after)})
+
+def serving_bundle(model):
+    """The current model bundle if it can serve the given model, otherwise raise ModelNotReady"""
+    bundle = model_manager.current
+    if bundle is None or not bundle.is_ready(model):
+        raise ModelNotReady(model, model_manager.eta(model))
+    return bundle
+
+def _popularity_fallback_body(bundle, limit):
+    return bundle.book_store.render(bundle.popularity_recommender.recommend(n=limit))
+
+async def popularity_fallback(bundle, model, limit):
+    """Popular books, served (uncached) while a personalised model is still loading"""
+    body = await executors.run("popular-books", _popularity_fallback_body, bundle, limit)
+    return Response(content=body, media_type="application/json",
+                    headers={"X-BookBud-Fallback": "popularity", "X-BookBud-Loading": model})
+
+# Request bodies are built by module-level functions that take the request's bundle as
+# their first argument, so that any endpoint can be moved to the process lane
+
+def json_body_response(body):
+    """Wrap an encoded JSON body in a response"""
+    return Response(content=body, media_type="application/json")
+
+def ndjson_lines(key_name, queries, results, book_store):
+    """Encode batch results as one NDJSON line per query"""
+    lines = []
+    for query in queries:
+        recommendations = book_store.render_isbns(results[query].index)
+        lines.append(b'{"' + key_name.encode() + b'":' + json.dumps(query).encode("utf-8") +
+                     b',"recommendations":' + recommendations + b'}\n')
+    return b"".join(lines)
+
+async def stream_batches(endpoint, build_chunk, bundle, queries, *args):
+    """Score queries chunk by chunk on the executor, yielding each chunk when ready"""
+    for start in range(0, len(queries), BATCH_CHUNK_SIZE):
+        yield await executors.run(endpoint, build_chunk, bundle, queries[start:start + BATCH_CHUNK_SIZE], *args)
+
+def stored_response(bundle, method, key, limit):
+    """Serve precomputed recommendations from the recommendation store, or None on a miss"""
+    if recommendation_store is None or not recommendation_store.matches(bundle):
+        return None
+    with instrumentation.request_stage("lookup"):
+        isbns = recommendation_store.lookup(method, key, limit)
+    if isbns is None:
+        return None
+    return json_body_response(bundle.book_store.render_isbns(isbns))
+
+async def build_cached(endpoint, params, build, *args, on_built=None):
+    """Build a response body on the executor (or by awaiting build if it is async) and cache it"""
+    started = time.perf_counter()
+    if asyncio.iscoroutinefunction(build):
+        body = await build(*args)
+    else:
+        body = await executors.run(endpoint, build, *args)
+    if on_built is not None:
+        on_built(time.perf_counter() - started)
+    return await response_cache.put_async(endpoint, params, body)
+
+async def cached_response(request, endpoint, params, build, *args, on_built=None):
+    """Serve a cached response body, answering 304 when the client already has it"""
+    with instrumentation.request_stage("lookup"):
+        cached = await response_cache.get_async(endpoint, params)
+    if cached is None:
+        # Concurrent misses for the same response wait on a single build
+        key = (endpoint, tuple(sorted(params.items())))
+        cached = await single_flight.do(key, build_cached, endpoint, params, build, *args, on_built=on_built)
+    if cached.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers={"ETag": cached.etag})
+    return Response(content=cached.body, media_type="application/json", headers={"ETag": cached.etag})
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time every request and decide whether its stages are profiled"""
+    token = instrumentation.start_request_profile()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        instrumentation.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, str(status_code))
+        instrumentation.end_request_profile(token)
+
+MODEL_ITEMS = instrumentation.REGISTRY.gauge(
+    "bookbud_model_items", "Number of items along each dimension of the fitted models", ("model", "dimension"))
+MODEL_BYTES = instrumentation.REGISTRY.gauge(
+    "bookbud_model_bytes", "Memory held by the main arrays of the fitted models", ("model",))
+PROCESS_MEMORY = instrumentation.REGISTRY.gauge(
+    "bookbud_process_resident_memory_bytes", "Resident memory of the API process")
+LAST_FIT_STAGE = instrumentation.REGISTRY.gauge(
+    "bookbud_last_fit_stage_seconds", "Duration of each fit stage of the served model bundle", ("stage",))
+CACHE_BYTES = instrumentation.REGISTRY.gauge(
+    "bookbud_response_cache_bytes", "Size of the in-memory response cache")
+
+def _nbytes(*arrays):
+    return sum(getattr(array, "nbytes", 0) for array in arrays if array is not None)
+
+def _cache_event_totals():
+    stats = response_cache.stats()
+    return {(event,): stats[event] for event in ("hits", "disk_hits", "misses", "evictions", "expirations")}
+
+# Read from the response cache's own totals at every scrape
+CACHE_EVENTS = instrumentation.REGISTRY.counter(
+    "bookbud_response_cache_events_total", "Response cache events since startup", ("event",),
+    collect=_cache_event_totals)
+
+def update_model_gauges(bundle):
+    """Refresh the model size, memory and cache size gauges before a scrape"""
+    PROCESS_MEMORY.set(instrumentation.process_memory_bytes())
+    CACHE_BYTES.set(response_cache.stats()["bytes"])
+    if bundle is None:
+        return
+    
+    content = bundle.content_recommender
+    if content is not None and content.cosine_sim is not None:
+        MODEL_ITEMS.set(content.cosine_sim.shape[0], "content_based", "books")
+        MODEL_ITEMS.set(content.tfidf_matrix.shape[1], "content_based", "terms")
+        tfidf = content.tfidf_matrix
+        MODEL_BYTES.set(_nbytes(content.cosine_sim, tfidf.data, tfidf.indices, tfidf.indptr), "content_based")
+    
+    collaborative = bundle.collaborative_recommender
+    if collaborative is not None and collaborative.user_item_matrix is not None:
+        users, books = collaborative.user_item_matrix.shape
+        MODEL_ITEMS.set(users, "collaborative_filtering", "users")
+        MODEL_ITEMS.set(books, "collaborative_filtering", "books")
+        MODEL_BYTES.set(_nbytes(
+            collaborative.user_item_matrix.values,
+            getattr(collaborative.user_similarity, "values", collaborative.user_similarity),
+            getattr(collaborative.item_similarity, "values", collaborative.item_similarity),
+        ), "collaborative_filtering")
+    
+    implicit = bundle.implicit_recommender
+    if implicit is not None and implicit.item_similarity is not None:
+        users, books = implicit.user_item_matrix.shape
+        MODEL_ITEMS.set(users, "implicit", "users")
+        MODEL_ITEMS.set(books, "implicit", "books")
+        interactions = implicit.user_item_matrix
+        MODEL_BYTES.set(_nbytes(interactions.data, interactions.indices, interactions.indptr)
+                        + implicit.item_similarity.nbytes, "implicit")
+    
+    demographic = bundle.demographic_recommender
+    if demographic is not None and demographic.top_books is not None:
+        MODEL_ITEMS.set(len(demographic.segment_keys), "demographic", "segments")
+        MODEL_BYTES.set(_nbytes(demographic.top_books, demographic.scores), "demographic")
+    
+    popularity = bundle.popularity_recommender
+    if popularity is not None and popularity.popularity_df is not None:
+        MODEL_ITEMS.set(len(popularity.popularity_df), "popularity_based", "books")
+    
+    for stage, seconds in (bundle.fit_stages or {}).items():
+        LAST_FIT_STAGE.set(seconds, stage)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: request and fit stage histograms, model sizes and memory"""
+    update_model_gauges(model_manager.current)
+    return PlainTextResponse(instrumentation.render_prometheus(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def root():
@@ -189,40 +331,62 @@ async def root():
 async def status():
     # Always return ready for Railway health checks
     # This ensures the deployment doesn't fail during initialization
+    bundle = model_manager.current
+    readiness = model_manager.readiness()
     return {
         "status": "ready",
-        "models_initialized": models_initialized,
-        "models": {
-            "content_based": content_recommender is not None,
-            "collaborative_filtering": collaborative_recommender is not None,
-            "popularity_based": popularity_recommender is not None
-        }
+        "models_initialized": readiness["state"] == "ready",
+        "models": {model: info["ready"] for model, info in readiness["models"].items()},
+        "readiness": readiness,
+        "model_version": bundle.version if bundle is not None else None,
+        "models_built_at": bundle.built_at if bundle is not None else None,
+        "last_build_error": model_manager.last_error,
+        "recommendation_store": recommendation_store.stats() if recommendation_store is not None else None,
+        "response_cache": response_cache.stats(),
+        "coalescing": {
+            "single_flight": single_flight.stats(),
+            "content_micro_batches": content_batcher.stats()
+        },
+        "queued_requests": executors.stats()
     }
 
+def _popular_books_body(bundle, limit, criteria):
+    return bundle.book_store.render(bundle.popularity_recommender.recommend(n=limit, criteria=criteria))
+
 @app.get("/popular-books", response_model=List[Dict[str, Any]])
 async def get_popular_books(
+    request: Request,
     limit: int = Query(10, ge=1, le=50),
     criteria: str = Query("popularity_score", regex="^(popularity_score|rating_count|rating_mean)$")
 ):
-    if not models_initialized:
-        # Return empty list instead of error when models are initializing
-        return []
+    bundle = serving_bundle("popularity_based")
     
-    recommendations = popularity_recommender.recommend(n=limit, criteria=criteria)
-    return convert_to_response(recommendations)
+    return await cached_response(
+        request, "popular-books", {"model": bundle.built_at, "limit": limit, "criteria": criteria},
+        _popular_books_body, bundle, limit, criteria
+    )
+
+def _popular_by_year_body(bundle, year, limit, criteria):
+    recommendations = bundle.popularity_recommender.recommend_by_year(year, n=limit, criteria=criteria)
+    return bundle.book_store.render(recommendations)
 
 @app.get("/popular-by-year", response_model=List[Dict[str, Any]])
 async def get_popular_by_year(
+    request: Request,
     year: int = Query(..., ge=1800, le=2025),
     limit: int = Query(10, ge=1, le=50),
     criteria: str = Query("popularity_score", regex="^(popularity_score|rating_count|rating_mean)$")
 ):
-    if not models_initialized:
-        # Return empty list instead of error when models are initializing
-        return []
+    bundle = serving_bundle("popularity_based")
     
-    recommendations = popularity_recommender.recommend_by_year(year, n=limit, criteria=criteria)
-    return convert_to_response(recommendations)
+    return await cached_response(
+        request, "popular-by-year", {"model": bundle.built_at, "year": year, "limit": limit, "criteria": criteria},
+        _popular_by_year_body, bundle, year, limit, criteria
+    )
+
+def _popular_by_publisher_body(bundle, publisher, limit, criteria):
+    recommendations = bundle.popularity_recommender.recommend_by_publisher(publisher, n=limit, criteria=criteria)
+    return bundle.book_store.render(recommendations)
 
 @app.get("/popular-by-publisher", response_model=List[Dict[str, Any]])
 async def get_popular_by_publisher(
@@ -230,131 +394,327 @@ async def get_popular_by_publisher(
     limit: int = Query(10, ge=1, le=50),
     criteria: str = Query("popularity_score", regex="^(popularity_score|rating_count|rating_mean)$")
 ):
-    if not models_initialized:
-        # Return empty list instead of error when models are initializing
-        return []
+    bundle = serving_bundle("popularity_based")
     
-    recommendations = popularity_recommender.recommend_by_publisher(publisher, n=limit, criteria=criteria)
-    return convert_to_response(recommendations)
+    body = await executors.run("popular-by-publisher", _popular_by_publisher_body, bundle, publisher, limit, criteria)
+    return json_body_response(body)
+
+def _content_based_body(bundle, title, isbn, author, limit):
+    if isbn:
+        recommendations = bundle.content_recommender.get_recommendations(isbn, n=limit)
+    elif title:
+        recommendations = bundle.content_recommender.get_recommendations_by_title(title, n=limit)
+    else:
+        recommendations = bundle.content_recommender.get_recommendations_by_author(author, n=limit)
+    return bundle.book_store.render(recommendations)
+
+def _content_isbn_batch_body(bundle, queries):
+    """Render content-based recommendations for a micro-batch of (isbn, limit) queries"""
+    isbns = list(dict.fromkeys(isbn for isbn, _ in queries))
+    results = bundle.content_recommender.get_recommendations_batch(isbns, n=max(limit for _, limit in queries))
+    return [bundle.book_store.render_isbns(results[isbn].index[:limit]) for isbn, limit in queries]
+
+async def _run_content_isbn_batch(queries):
+    # Queries are (bundle, isbn, limit); a batch collected across a bundle swap is
+    # scored with one executor call per bundle
+    groups = {}
+    for position, (bundle, isbn, limit) in enumerate(queries):
+        groups.setdefault(id(bundle), (bundle, []))[1].append(position)
+    bodies = [None] * len(queries)
+    for bundle, positions in groups.values():
+        rendered = await executors.run("content-based", _content_isbn_batch_body, bundle,
+                                       [queries[position][1:] for position in positions])
+        for position, body in zip(positions, rendered):
+            bodies[position] = body
+    return bodies
+
+# ISBN queries arriving within MICRO_BATCH_WINDOW are scored with one similarity gather
+content_batcher = MicroBatcher(_run_content_isbn_batch, window=MICRO_BATCH_WINDOW, max_batch=MICRO_BATCH_SIZE)
+
+async def _content_isbn_body(bundle, isbn, limit):
+    return await content_batcher.submit((bundle, isbn, limit))
 
 @app.get("/content-based", response_model=List[Dict[str, Any]])
 async def get_content_based_recommendations(
+    request: Request,
     title: Optional[str] = None,
     isbn: Optional[str] = None,
     author: Optional[str] = None,
     limit: int = Query(10, ge=1, le=50)
 ):
-    if not models_initialized:
-        # Return empty list instead of error when models are initializing
-        return []
+    bundle = serving_bundle("popularity_based")
     
     if not any([title, isbn, author]):
         raise HTTPException(status_code=400, detail="At least one of title, isbn, or author must be provided")
     
-    if isbn:
-        recommendations = content_recommender.get_recommendations(isbn, n=limit)
-    elif title:
-        recommendations = content_recommender.get_recommendations_by_title(title, n=limit)
-    elif author:
-        recommendations = content_recommender.get_recommendations_by_author(author, n=limit)
+    if not bundle.is_ready("content_based"):
+        return await popularity_fallback(bundle, "content_based", limit)
     
-    if recommendations.empty:
-        return []
+    if isbn:
+        stored = stored_response(bundle, "content", isbn, limit)
+        if stored is not None:
+            return stored
     
-    return convert_to_response(recommendations)
+    on_built = None
+    if isbn and recommendation_store is not None:
+        on_built = lambda seconds: recommendation_store.record_live("content", seconds)
+    if isbn and MICRO_BATCH_WINDOW > 0:
+        build, args = _content_isbn_body, (bundle, isbn, limit)
+    else:
+        build, args = _content_based_body, (bundle, title, isbn, author, limit)
+    return await cached_response(
+        request, "content-based",
+        {"model": bundle.built_at, "title": title, "isbn": isbn, "author": author, "limit": limit},
+        build, *args, on_built=on_built
+    )
+
+def _collaborative_body(bundle, user_id, method, limit):
+    if method == "user":
+        recommendations = bundle.collaborative_recommender.user_based_recommendations(user_id, n=limit)
+    elif method == "item":
+        recommendations = bundle.collaborative_recommender.item_based_recommendations(user_id, n=limit)
+    else:
+        recommendations = bundle.collaborative_recommender.hybrid_recommendations(user_id, n=limit)
+    implicit = bundle.implicit_recommender
+    if recommendations.empty and implicit is not None and implicit.known_user(user_id):
+        # Users without enough explicit ratings are served from their implicit interactions
+        recommendations = implicit.recommend(user_id, n=limit)
+    demographic = bundle.demographic_recommender
+    if recommendations.empty and demographic is not None and demographic.known_user(user_id):
+        # Users without any known interaction get the popular books of their country and age
+        recommendations = demographic.recommend_for_user(user_id, n=limit)
+    return bundle.book_store.render(recommendations)
 
 @app.get("/collaborative-filtering", response_model=List[Dict[str, Any]])
 async def get_collaborative_recommendations(
+    request: Request,
     user_id: int = Query(...),
-    method: str = Query("user", regex="^(user|item)$"),
+    method: str = Query("user", regex="^(user|item|hybrid)$"),
     limit: int = Query(10, ge=1, le=50)
 ):
-    if not models_initialized:
-        # Return empty list instead of error when models are initializing
-        return []
+    bundle = serving_bundle("popularity_based")
+    if not bundle.is_ready("collaborative_filtering"):
+        return await popularity_fallback(bundle, "collaborative_filtering", limit)
     
+    stored = stored_response(bundle, method, user_id, limit)
+    if stored is not None:
+        return stored
+    
+    on_built = None
+    if recommendation_store is not None:
+        on_built = lambda seconds: recommendation_store.record_live(method, seconds)
     try:
-        if method == "user":
-            recommendations = collaborative_recommender.user_based_recommendations(user_id, n=limit)
-        else:
-            recommendations = collaborative_recommender.item_based_recommendations(user_id, n=limit)
-        
-        if recommendations.empty:
-            return []
-        
-        return convert_to_response(recommendations)
+        return await cached_response(
+            request, "collaborative-filtering",
+            {"model": bundle.built_at, "user_id": user_id, "method": method, "limit": limit},
+            _collaborative_body, bundle, user_id, method, limit, on_built=on_built
+        )
+    except ExecutorOverloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Error generating recommendations: {str(e)}")
 
-@app.get("/search-books", response_model=List[Dict[str, Any]])
-async def search_books(
-    query: str = Query(..., min_length=1),
-    limit: int = Query(20, ge=1, le=100)
+def _implicit_body(bundle, user_id, limit):
+    return bundle.book_store.render(bundle.implicit_recommender.recommend(user_id, n=limit))
+
+@app.get("/implicit-feedback", response_model=List[Dict[str, Any]])
+async def get_implicit_feedback_recommendations(
+    request: Request,
+    user_id: int = Query(...),
+    limit: int = Query(10, ge=1, le=50)
+):
+    bundle = serving_bundle("popularity_based")
+    if not bundle.is_ready("implicit"):
+        return await popularity_fallback(bundle, "implicit", limit)
+    
+    try:
+        return await cached_response(
+            request, "implicit-feedback", {"model": bundle.built_at, "user_id": user_id, "limit": limit},
+            _implicit_body, bundle, user_id, limit
+        )
+    except ExecutorOverloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Error generating recommendations: {str(e)}")
+
+def _demographic_body(bundle, user_id, country, age, limit):
+    if user_id is not None:
+        recommendations = bundle.demographic_recommender.recommend_for_user(user_id, n=limit)
+    else:
+        recommendations = bundle.demographic_recommender.recommend(country, age, n=limit)
+    return bundle.book_store.render(recommendations)
+
+@app.get("/demographic", response_model=List[Dict[str, Any]])
+async def get_demographic_recommendations(
+    request: Request,
+    user_id: Optional[int] = None,
+    country: Optional[str] = None,
+    age: Optional[int] = Query(None, ge=0, le=120),
+    limit: int = Query(10, ge=1, le=50)
+):
+    bundle = serving_bundle("demographic")
+    
+    try:
+        return await cached_response(
+            request, "demographic",
+            {"model": bundle.built_at, "user_id": user_id, "country": country, "age": age, "limit": limit},
+            _demographic_body, bundle, user_id, country, age, limit
+        )
+    except ExecutorOverloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=404, detail=f"Error generating recommendations: {str(e)}")
+
+def _collaborative_batch_body(bundle, user_ids, method, limit):
+    if method == "user":
+        results = bundle.collaborative_recommender.batch_user_based_recommendations(user_ids, n=limit)
+    elif method == "item":
+        results = bundle.collaborative_recommender.batch_item_based_recommendations(user_ids, n=limit)
+    else:
+        results = bundle.collaborative_recommender.batch_hybrid_recommendations(user_ids, n=limit)
+    return ndjson_lines("user_id", user_ids, results, bundle.book_store)
+
+@app.post("/collaborative-filtering/batch")
+async def get_collaborative_recommendations_batch(request: CollaborativeBatchRequest):
+    """Stream collaborative filtering recommendations for many users as NDJSON"""
+    # Batch clients retry on 503 until the model is ready
+    bundle = serving_bundle("collaborative_filtering")
+    
+    return StreamingResponse(
+        stream_batches("collaborative-filtering-batch", _collaborative_batch_body, bundle,
+                       request.user_ids, request.method, request.limit),
+        media_type="application/x-ndjson"
+    )
+
+def _content_batch_body(bundle, isbns, limit):
+    results = bundle.content_recommender.get_recommendations_batch(isbns, n=limit)
+    return ndjson_lines("isbn", isbns, results, bundle.book_store)
+
+@app.post("/content-based/batch")
+async def get_content_based_recommendations_batch(request: ContentBatchRequest):
+    """Stream content-based recommendations for many ISBNs as NDJSON"""
+    # Batch clients retry on 503 until the model is ready
+    bundle = serving_bundle("content_based")
+    
+    return StreamingResponse(
+        stream_batches("content-based-batch", _content_batch_body, bundle, request.isbns, request.limit),
+        media_type="application/x-ndjson"
+    )
+
+def _hybrid_body(bundle, user_id, isbn, limit, weights):
+    recommendations = bundle.hybrid_recommender.recommend(user_id=user_id, isbn=isbn, n=limit, weights=weights)
+    return bundle.book_store.render(recommendations)
+
+@app.get("/hybrid", response_model=List[Dict[str, Any]])
+async def get_hybrid_recommendations(
+    user_id: Optional[int] = None,
+    isbn: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=50),
+    collaborative_weight: Optional[float] = Query(None, ge=0),
+    content_weight: Optional[float] = Query(None, ge=0),
+    popularity_weight: Optional[float] = Query(None, ge=0)
 ):
-    if not models_initialized:
-        # Return empty list instead of error when models are initializing
-        return []
+    bundle = serving_bundle("popularity_based")
+    if user_id is None and not isbn:
+        raise HTTPException(status_code=400, detail="At least one of user_id or isbn must be provided")
+    
+    if not bundle.is_ready("hybrid"):
+        return await popularity_fallback(bundle, "hybrid", limit)
     
+    weights = {name: weight for name, weight in (
+        ("collaborative", collaborative_weight),
+        ("content", content_weight),
+        ("popularity", popularity_weight),
+    ) if weight is not None}
+    body = await executors.run("hybrid", _hybrid_body, bundle, user_id, isbn, limit, weights)
+    return json_body_response(body)
+
+
+def _search_books_body(bundle, query, limit):
+    books = bundle.preprocessor.books_processed
     # Search in titles, authors, and publishers
     query = query.lower()
-    results = preprocessor.books_processed[
-        preprocessor.books_processed['Book-Title'].str.lower().str.contains(query) |
-        preprocessor.books_processed['Book-Author'].str.lower().str.contains(query) |
-        preprocessor.books_processed['Publisher'].str.lower().str.contains(query)
+    results = books[
+        books['Book-Title'].str.lower().str.contains(query) |
+        books['Book-Author'].str.lower().str.contains(query) |
+        books['Publisher'].str.lower().str.contains(query)
     ]
-    
-    return convert_to_response(results.head(limit))
+    return bundle.book_store.render(results.head(limit))
 
-@app.get("/eda-stats")
-async def get_eda_stats():
-    if not models_initialized:
-        # Return empty list instead of error when models are initializing
-        return []
+@app.get("/search-books", response_model=List[Dict[str, Any]])
+async def search_books(
+    query: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100)
+):
+    bundle = serving_bundle("search")
     
-    # Return basic statistics about the dataset
+    body = await executors.run("search-books", _search_books_body, bundle, query, limit)
+    return json_body_response(body)
+
+def compute_eda_stats(bundle):
+    """Compute basic statistics about the dataset"""
+    preprocessor = bundle.preprocessor
+    books = preprocessor.books_processed
+    ratings = preprocessor.ratings_processed
+    years = books["Year-Of-Publication"]
     return {
-        "total_books": len(preprocessor.books_processed),
+        "total_books": len(books),
         "total_users": len(preprocessor.users_processed),
-        "total_ratings": len(preprocessor.ratings_processed),
-        "avg_rating": float(preprocessor.ratings_processed["Book-Rating"].mean()),
-        "rating_distribution": preprocessor.ratings_processed["Book-Rating"].value_counts().to_dict(),
+        "total_ratings": len(ratings),
+        "avg_rating": float(ratings["Book-Rating"].mean()),
+        "rating_distribution": {str(k): int(v) for k, v in ratings["Book-Rating"].value_counts().items()},
         "publication_years": {
-            "min": int(preprocessor.books_processed["Year-Of-Publication"].min()),
-            "max": int(preprocessor.books_processed["Year-Of-Publication"].max()),
-            "most_common": int(preprocessor.books_processed["Year-Of-Publication"].value_counts().index[0])
+            "min": int(years.min()),
+            "max": int(years.max()),
+            "most_common": int(years.value_counts().index[0])
         },
-        "top_authors": preprocessor.books_processed["Book-Author"].value_counts().head(10).to_dict(),
-        "top_publishers": preprocessor.books_processed["Publisher"].value_counts().head(10).to_dict()
+        "top_authors": {str(k): int(v) for k, v in books["Book-Author"].value_counts().head(10).items()},
+        "top_publishers": {str(k): int(v) for k, v in books["Publisher"].value_counts().head(10).items()}
     }
 
+def _eda_stats_body(bundle):
+    return json.dumps(compute_eda_stats(bundle), ensure_ascii=False).encode("utf-8")
+
+@app.get("/eda-stats")
+async def get_eda_stats(request: Request):
+    bundle = serving_bundle("popularity_based")
+    
+    return await cached_response(
+        request, "eda-stats", {"model": bundle.built_at},
+        _eda_stats_body, bundle
+    )
+
+def _guest_body(bundle, ratings_dict, limit):
+    recommendations = bundle.guest_recommender.get_recommendations_for_guest(ratings_dict, n=limit)
+    return bundle.book_store.render(recommendations)
+
 @app.post("/guest-recommendations", response_model=List[Dict[str, Any]])
 async def get_guest_recommendations(request: GuestRatingRequest):
-    if not models_initialized:
-        # Return empty list instead of error when models are initializing
-        return []
-    
-    if not guest_recommender:
-        raise HTTPException(status_code=503, detail="Guest recommendation engine is not available")
+    bundle = serving_bundle("popularity_based")
     
     if not request.ratings or len(request.ratings) < 3:
         raise HTTPException(status_code=400, detail="Please provide at least 3 book ratings for better recommendations")
     
+    if not bundle.is_ready("guest"):
+        return await popularity_fallback(bundle, "guest", request.limit)
+    
+    if not bundle.guest_recommender:
+        raise HTTPException(status_code=503, detail="Guest recommendation engine is not available")
+    
+    # Convert the ratings list to a dictionary
+    ratings_dict = {item.isbn: item.rating for item in request.ratings}
+    
     try:
-        # Convert the ratings list to a dictionary
-        ratings_dict = {item.isbn: item.rating for item in request.ratings}
-        
-        # Get recommendations
-        recommendations = guest_recommender.get_recommendations_for_guest(
-            ratings_dict,
-            n=request.limit
+        # Identical concurrent payloads share one computation
+        key = ("guest-recommendations", bundle.built_at, request.limit, tuple(sorted(ratings_dict.items())))
+        body = await single_flight.do(
+            key, executors.run, "guest-recommendations", _guest_body, bundle, ratings_dict, request.limit
         )
-        
-        if recommendations.empty:
-            return []
-        
-        return convert_to_response(recommendations)
+    except ExecutorOverloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating recommendations: {str(e)}")
+    return json_body_response(body)
 
 @app.get("/eda-image/{image_name}")
 async def get_eda_image(image_name: str):
@@ -376,4 +736,5 @@ async def get_eda_image(image_name: str):
     raise HTTPException(status_code=404, detail=f"Image {image_name} not found")
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,167 @@
+import json
+import numpy as np
+import pandas as pd
+from instrumentation import fit_stage, timed_request_stage
+
+
+def _json_value(value):
+    """Encode a scalar metadata value as JSON, mapping missing and non-finite values to null."""
+    if value is None or (isinstance(value, float) and not np.isfinite(value)):
+        return 'null'
+    return json.dumps(value, ensure_ascii=False)
+
+
+def encode_book_fragments(books_df):
+    """
+    Encode the static part of the book response object for every row.
+
+    Each fragment is an unterminated JSON object (everything except the
+    per-response "Rating" field and the closing brace), so that a response can
+    be assembled by concatenating fragments without touching pandas.
+
+    Parameters:
+    -----------
+    books_df : pandas.DataFrame
+        DataFrame containing book information with the columns:
+        ISBN, Book-Title, Book-Author, Year-Of-Publication, Publisher, Image-URL-L
+
+    Returns:
+    --------
+    list of bytes
+        One fragment per row of books_df, in row order
+    """
+    n_rows = len(books_df)
+
+    def column(name, default):
+        if name in books_df.columns:
+            return books_df[name].to_numpy(dtype=object)
+        return np.full(n_rows, default, dtype=object)
+
+    years = (pd.to_numeric(books_df['Year-Of-Publication'], errors='coerce').to_numpy(dtype=float)
+             if 'Year-Of-Publication' in books_df.columns else np.full(n_rows, np.nan))
+
+    finite_years = np.isfinite(years)
+
+    fragments = []
+    for isbn, title, author, year, finite_year, publisher, image_url in zip(
+        column('ISBN', ''),
+        column('Book-Title', 'Unknown Title'),
+        column('Book-Author', 'Unknown Author'),
+        years,
+        finite_years,
+        column('Publisher', None),
+        column('Image-URL-L', None),
+    ):
+        fragment = (
+            '{"ISBN":' + _json_value(isbn if isinstance(isbn, str) else str(isbn)) +
+            ',"Title":' + _json_value(title) +
+            ',"Author":' + _json_value(author) +
+            ',"Year":' + (str(int(year)) if finite_year else 'null') +
+            ',"Publisher":' + _json_value(publisher) +
+            ',"ImageURL":' + _json_value(image_url)
+        )
+        fragments.append(fragment.encode('utf-8'))
+
+    return fragments
+
+
+class BookJSONStore:
+    """
+    Pre-encoded JSON representation of the book metadata store.
+    Builds API responses by joining per-book fragments by ISBN instead of
+    converting DataFrame rows to dictionaries on every request.
+    """
+
+    @fit_stage('book_store')
+    def __init__(self, books_df):
+        """
+        Encode every book once.
+
+        Parameters:
+        -----------
+        books_df : pandas.DataFrame
+            DataFrame containing book information (usually books_processed)
+        """
+        books_df = books_df.drop_duplicates(subset=['ISBN'])
+        self.index = pd.Index(books_df['ISBN'].astype(str))
+        self.fragments = encode_book_fragments(books_df)
+
+    def __len__(self):
+        return len(self.fragments)
+
+    @timed_request_stage('serialization')
+    def render_isbns(self, isbns, ratings=None):
+        """
+        Render a JSON array of books for the given ISBNs.
+
+        Parameters:
+        -----------
+        isbns : sequence of str
+            ISBNs of the books to render, in response order
+        ratings : sequence of float, optional
+            Rating to report for each book; missing values are encoded as null
+
+        Returns:
+        --------
+        bytes
+            UTF-8 encoded JSON array
+        """
+        isbns = pd.Index(isbns).astype(str)
+        positions = self.index.get_indexer(isbns)
+        rating_parts = self._encode_ratings(ratings, len(isbns))
+
+        parts = []
+        for isbn, position, rating in zip(isbns, positions, rating_parts):
+            if position < 0:
+                fragment = encode_book_fragments(pd.DataFrame({'ISBN': [isbn]}))[0]
+            else:
+                fragment = self.fragments[position]
+            parts.append(fragment + rating)
+        return b'[' + b','.join(parts) + b']'
+
+    @timed_request_stage('serialization')
+    def render(self, df):
+        """
+        Render a DataFrame of recommended books as a JSON array.
+
+        Books are looked up in the store by ISBN; rows whose ISBN is not in the
+        store are encoded directly from the DataFrame. The "Rating" field is
+        taken from the rating_mean column when present.
+
+        Parameters:
+        -----------
+        df : pandas.DataFrame
+            DataFrame containing at least an ISBN column
+
+        Returns:
+        --------
+        bytes
+            UTF-8 encoded JSON array
+        """
+        if df.empty or 'ISBN' not in df.columns:
+            return b'[]'
+
+        isbns = pd.Index(df['ISBN']).astype(str)
+        positions = self.index.get_indexer(isbns)
+        ratings = df['rating_mean'].to_numpy() if 'rating_mean' in df.columns else None
+        rating_parts = self._encode_ratings(ratings, len(df))
+
+        missing = np.flatnonzero(positions < 0)
+        missing_fragments = dict(zip(missing, encode_book_fragments(df.iloc[missing]))) if len(missing) else {}
+
+        parts = []
+        for row, (position, rating) in enumerate(zip(positions, rating_parts)):
+            fragment = missing_fragments[row] if position < 0 else self.fragments[position]
+            parts.append(fragment + rating)
+        return b'[' + b','.join(parts) + b']'
+
+    @staticmethod
+    def _encode_ratings(ratings, n_rows):
+        """Encode the closing "Rating" field of each response object (null unless finite)."""
+        if ratings is None:
+            return [b',"Rating":null}'] * n_rows
+        ratings = pd.to_numeric(pd.Series(ratings), errors='coerce').to_numpy(dtype=float)
+        return [
+            b',"Rating":' + repr(float(rating)).encode() + b'}' if finite else b',"Rating":null}'
+            for rating, finite in zip(ratings, np.isfinite(ratings))
+        ]
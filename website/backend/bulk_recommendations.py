@@ -0,0 +1,230 @@
+"""
+Offline bulk recommendation generator.
+
+Loads a fitted model bundle, partitions all users (for user-based, item-based
+and hybrid collaborative filtering) and all ISBNs (for content-based
+filtering) across a process pool, scores each partition with the batched
+recommender methods and writes the top-N lists to a directory of
+memory-mappable NumPy arrays:
+
+    <output>/manifest.json        methods, top_n and model metadata
+    <output>/items.npy            ISBN vocabulary (fixed-width strings)
+    <output>/<method>/keys.npy    sorted query keys (user IDs, or item positions for content)
+    <output>/<method>/items.npy   int32 [n_keys, top_n] positions into items.npy, -1 padded
+    <output>/<method>/scores.npy  float32 [n_keys, top_n] scores, NaN padded
+
+Example:
+    python bulk_recommendations.py --bundle models.pkl --output recommendations --workers 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Make the recommendation modules importable when run from the backend directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from model_manager import build_model_bundle, load_bundle, save_bundle
+
+# Recommendation methods and the kind of key they are queried by
+METHODS = {
+    'user': 'user',
+    'item': 'user',
+    'hybrid': 'user',
+    'content': 'isbn',
+}
+
+# Bundle and ISBN vocabulary of the current worker process
+_worker_bundle = None
+_worker_vocabulary = None
+
+
+def _init_worker(bundle_path):
+    """Load the model bundle once per worker process."""
+    global _worker_bundle, _worker_vocabulary
+    _worker_bundle = load_bundle(bundle_path)
+    _worker_vocabulary = _worker_bundle.book_store.index
+
+
+def score_partition(bundle, vocabulary, method, queries, top_n):
+    """
+    Score one partition of queries with the batched recommender methods.
+
+    Parameters:
+    -----------
+    bundle : ModelBundle
+        Fitted models
+    vocabulary : pandas.Index
+        ISBN vocabulary the output positions refer to
+    method : str
+        One of METHODS
+    queries : list
+        User IDs or ISBNs to score
+    top_n : int
+        Number of recommendations per query
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        (items, scores) arrays of shape (len(queries), top_n)
+    """
+    if method == 'user':
+        results = bundle.collaborative_recommender.batch_user_based_recommendations(queries, n=top_n)
+    elif method == 'item':
+        results = bundle.collaborative_recommender.batch_item_based_recommendations(queries, n=top_n)
+    elif method == 'hybrid':
+        results = bundle.collaborative_recommender.batch_hybrid_recommendations(queries, n=top_n)
+    elif method == 'content':
+        results = bundle.content_recommender.get_recommendations_batch(queries, n=top_n)
+    else:
+        raise ValueError(f"Unknown method: {method}")
+
+    items = np.full((len(queries), top_n), -1, dtype=np.int32)
+    scores = np.full((len(queries), top_n), np.nan, dtype=np.float32)
+    for row, query in enumerate(queries):
+        recommendations = results[query]
+        count = len(recommendations)
+        items[row, :count] = vocabulary.get_indexer(recommendations.index)
+        scores[row, :count] = recommendations.values
+    return items, scores
+
+
+def _score_partition_in_worker(method, queries, top_n):
+    return score_partition(_worker_bundle, _worker_vocabulary, method, queries, top_n)
+
+
+def method_queries(bundle, method):
+    """Return every query (user ID or ISBN) a method can produce recommendations for."""
+    if METHODS[method] == 'user':
+        return list(bundle.collaborative_recommender.user_item_matrix.index)
+    return list(pd.unique(bundle.content_recommender.indices.index))
+
+
+def write_method(output_dir, method, keys, items, scores):
+    """Write one method's table, sorted by key, as .npy files."""
+    order = np.argsort(keys, kind='stable')
+    method_dir = os.path.join(output_dir, method)
+    os.makedirs(method_dir, exist_ok=True)
+    np.save(os.path.join(method_dir, 'keys.npy'), keys[order])
+    np.save(os.path.join(method_dir, 'items.npy'), items[order])
+    np.save(os.path.join(method_dir, 'scores.npy'), scores[order])
+
+
+def generate(bundle_path, output_dir, methods=tuple(METHODS), top_n=50, workers=None, chunk_size=256):
+    """
+    Generate top-N recommendations for every user/ISBN and write them to output_dir.
+
+    Parameters:
+    -----------
+    bundle_path : str
+        Path to a model bundle saved by model_manager.save_bundle
+    output_dir : str
+        Directory to write the recommendation tables to
+    methods : iterable of str
+        Methods to generate (subset of METHODS)
+    top_n : int
+        Number of recommendations per query
+    workers : int, optional
+        Number of worker processes (defaults to the number of CPUs)
+    chunk_size : int
+        Number of queries per partition
+
+    Returns:
+    --------
+    dict
+        The manifest written to output_dir
+    """
+    workers = workers or os.cpu_count() or 1
+    bundle = load_bundle(bundle_path)
+    vocabulary = bundle.book_store.index
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'items.npy'), vocabulary.to_numpy(dtype=str))
+
+    manifest = {
+        'top_n': top_n,
+        'model_built_at': bundle.built_at,
+        'created_at': time.time(),
+        'methods': {},
+    }
+    # Keep the tables of other methods generated earlier from the same models
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous.get('model_built_at') == bundle.built_at and previous.get('top_n') == top_n:
+            manifest['methods'].update(previous.get('methods', {}))
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(bundle_path,)) as pool:
+        for method in methods:
+            started = time.time()
+            queries = method_queries(bundle, method)
+            partitions = [queries[i:i + chunk_size] for i in range(0, len(queries), chunk_size)]
+            futures = [pool.submit(_score_partition_in_worker, method, partition, top_n)
+                       for partition in partitions]
+
+            results = [future.result() for future in futures]
+            items = np.concatenate([r[0] for r in results]) if results else np.empty((0, top_n), np.int32)
+            scores = np.concatenate([r[1] for r in results]) if results else np.empty((0, top_n), np.float32)
+
+            if METHODS[method] == 'user':
+                keys = np.asarray(queries, dtype=np.int64)
+            else:
+                # Content queries are keyed by their position in the ISBN vocabulary
+                keys = vocabulary.get_indexer(queries).astype(np.int64)
+
+            write_method(output_dir, method, keys, items, scores)
+            elapsed = time.time() - started
+            manifest['methods'][method] = {'key': METHODS[method], 'rows': len(queries), 'seconds': elapsed}
+            print(f"Generated {method} recommendations for {len(queries)} queries in {elapsed:.1f}s")
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute top-N recommendations for all users and books")
+    parser.add_argument('--bundle', help="Model bundle to load (built from the CSV files when missing)")
+    parser.add_argument('--books', default='Books.csv', help="Path to Books.csv (when building a bundle)")
+    parser.add_argument('--ratings', default='Ratings.csv', help="Path to Ratings.csv (when building a bundle)")
+    parser.add_argument('--users', default='Users.csv', help="Path to Users.csv (when building a bundle)")
+    parser.add_argument('--output', required=True, help="Output directory")
+    parser.add_argument('--methods', default=','.join(METHODS), help="Comma-separated methods to generate")
+    parser.add_argument('--top-n', type=int, default=50, help="Recommendations per query")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Queries per partition")
+    args = parser.parse_args(argv)
+
+    methods = [method.strip() for method in args.methods.split(',') if method.strip()]
+    unknown = set(methods) - set(METHODS)
+    if unknown:
+        parser.error(f"Unknown methods: {', '.join(sorted(unknown))}")
+
+    bundle_path = args.bundle
+    temporary = False
+    if not bundle_path or not os.path.exists(bundle_path):
+        print("Building model bundle from CSV files...")
+        bundle = build_model_bundle(args.books, args.ratings, args.users)
+        if not bundle_path:
+            fd, bundle_path = tempfile.mkstemp(suffix='.bundle')
+            os.close(fd)
+            temporary = True
+        save_bundle(bundle, bundle_path)
+        del bundle
+
+    try:
+        generate(bundle_path, args.output, methods=methods, top_n=args.top_n,
+                 workers=args.workers, chunk_size=args.chunk_size)
+    finally:
+        if temporary:
+            os.remove(bundle_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical computations: callers asking for a key
+    that is already being computed wait for that computation and share its
+    result instead of starting their own.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        """
+        Await fn(*args, **kwargs), sharing it with concurrent calls for the same key.
+
+        The computation runs as its own task, so a caller that goes away
+        (e.g. a disconnected client) does not cancel it for the others.
+
+        Parameters:
+        -----------
+        key : hashable
+            Identity of the computation
+        fn : coroutine function
+            Computation to run when no call for key is in flight
+
+        Returns:
+        --------
+        object
+            Result of the (possibly shared) computation
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        """Number of computations started and of callers that joined one in flight."""
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
+
+
+class MicroBatcher:
+    """
+    Collects items submitted within a short window and processes them with
+    one batch call, so that concurrent queries share a single vectorised
+    computation.
+    """
+
+    def __init__(self, run_batch, window=0.002, max_batch=64):
+        """
+        Initialize the micro-batcher.
+
+        Parameters:
+        -----------
+        run_batch : coroutine function
+            Called with a list of items; returns a list of results in the same order
+        window : float
+            Seconds to wait for more items after the first one arrives
+        max_batch : int
+            Batch size that triggers an immediate flush
+        """
+        self.run_batch = run_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        """Add an item to the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending):
+        self.batches += 1
+        self.items += len(pending)
+        try:
+            results = await self.run_batch([item for item, _ in pending])
+        except asyncio.CancelledError:
+            for _, future in pending:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            # Callers may have gone away while the batch was running
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        """Number of batches run and mean batch size."""
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch_size': self.items / self.batches if self.batches else None,
+        }
@@ -0,0 +1,188 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class ExecutorOverloaded(Exception):
+    """Raised when an endpoint's wait queue is full."""
+
+    def __init__(self, endpoint):
+        super().__init__(f"Too many pending requests for {endpoint}")
+        self.endpoint = endpoint
+
+
+def _parse_limits(value):
+    """Parse an "endpoint=limit,endpoint=limit" setting into a dictionary."""
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, limit = item.split('=', 1)
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+class _EndpointLimiter:
+    """Concurrency limit with a bounded number of waiters for one endpoint."""
+
+    def __init__(self, endpoint, max_concurrency, max_queue):
+        self.endpoint = endpoint
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+
+    async def __aenter__(self):
+        if self.semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise ExecutorOverloaded(self.endpoint)
+            self.waiting += 1
+            try:
+                await self.semaphore.acquire()
+            finally:
+                self.waiting -= 1
+        else:
+            await self.semaphore.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.semaphore.release()
+
+
+class ExecutorLayer:
+    """
+    Runs blocking recommendation work off the asyncio event loop.
+
+    Work is dispatched to one of three lanes:
+    - "thread": a shared thread pool, for pandas/NumPy/SciPy work that
+      releases the GIL
+    - "process": a process pool forked from the serving worker, for
+      pure-Python work that would otherwise hold the GIL; children inherit
+      the loaded models copy-on-write, so the pool is recreated after every
+      model load
+    - background: a dedicated thread for model fits, so a long fit never
+      occupies the request threads
+
+    Every endpoint has its own concurrency limit and a bounded wait queue;
+    requests beyond that are rejected with ExecutorOverloaded.
+    """
+
+    def __init__(self, thread_workers=None, process_workers=0, max_concurrency=4,
+                 max_queue=64, endpoint_limits=None, process_endpoints=()):
+        """
+        Initialize the executor layer.
+
+        Parameters:
+        -----------
+        thread_workers : int, optional
+            Size of the request thread pool (defaults to min(32, cpu_count + 4))
+        process_workers : int
+            Size of the request process pool; 0 disables the process lane and
+            process work runs on the thread pool instead
+        max_concurrency : int
+            Default number of concurrently executing requests per endpoint
+        max_queue : int
+            Number of requests per endpoint allowed to wait for a free slot
+        endpoint_limits : dict, optional
+            Per-endpoint overrides of max_concurrency
+        process_endpoints : iterable of str
+            Endpoints whose work runs on the process lane
+        """
+        self.thread_workers = thread_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.process_workers = process_workers
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.endpoint_limits = dict(endpoint_limits or {})
+        self.process_endpoints = set(process_endpoints)
+
+        self._threads = ThreadPoolExecutor(self.thread_workers, thread_name_prefix='bookbud-request')
+        self._background = ThreadPoolExecutor(1, thread_name_prefix='bookbud-background')
+        self._processes = None
+        self._limiters = {}
+
+    @classmethod
+    def from_env(cls):
+        """
+        Create an executor layer configured from environment variables:
+        BOOKBUD_THREAD_WORKERS, BOOKBUD_PROCESS_WORKERS, BOOKBUD_MAX_CONCURRENCY,
+        BOOKBUD_MAX_QUEUE, BOOKBUD_ENDPOINT_LIMITS ("endpoint=limit,...") and
+        BOOKBUD_PROCESS_ENDPOINTS ("endpoint,...").
+        """
+        process_endpoints = os.environ.get('BOOKBUD_PROCESS_ENDPOINTS', 'collaborative-filtering')
+        return cls(
+            thread_workers=int(os.environ.get('BOOKBUD_THREAD_WORKERS', 0)) or None,
+            process_workers=int(os.environ.get('BOOKBUD_PROCESS_WORKERS', 0)),
+            max_concurrency=int(os.environ.get('BOOKBUD_MAX_CONCURRENCY', 4)),
+            max_queue=int(os.environ.get('BOOKBUD_MAX_QUEUE', 64)),
+            endpoint_limits=_parse_limits(os.environ.get('BOOKBUD_ENDPOINT_LIMITS')),
+            process_endpoints=[name.strip() for name in process_endpoints.split(',') if name.strip()],
+        )
+
+    def _limiter(self, endpoint):
+        # Created lazily so the semaphore belongs to the serving event loop
+        limiter = self._limiters.get(endpoint)
+        if limiter is None:
+            limit = self.endpoint_limits.get(endpoint, self.max_concurrency)
+            limiter = self._limiters[endpoint] = _EndpointLimiter(endpoint, limit, self.max_queue)
+        return limiter
+
+    async def run(self, endpoint, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) for an endpoint on its configured lane.
+
+        Functions sent to the process lane must be picklable by reference
+        (module-level) and take picklable arguments.
+
+        Raises:
+        -------
+        ExecutorOverloaded
+            If the endpoint already has max_queue requests waiting
+        """
+        loop = asyncio.get_running_loop()
+        async with self._limiter(endpoint):
+            if endpoint in self.process_endpoints and self._processes is not None:
+                return await loop.run_in_executor(self._processes, functools.partial(fn, *args, **kwargs))
+            # Carry the request's context (e.g. its profiling flag) into the worker thread
+            call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+            return await loop.run_in_executor(self._threads, call)
+
+    async def run_thread(self, fn, *args, **kwargs):
+        """
+        Run short blocking I/O, such as disk cache reads, on the request thread
+        pool without an endpoint limit.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._threads, functools.partial(fn, *args, **kwargs))
+
+    async def run_background(self, fn, *args, **kwargs):
+        """Run a long job, such as a model fit, on the dedicated background thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._background, functools.partial(fn, *args, **kwargs))
+
+    def reset_process_pool(self):
+        """
+        (Re)create the process pool so that its workers fork from the current
+        state of the serving process (call after the models are loaded).
+        """
+        if self.process_workers <= 0:
+            return
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            print("Process lane requires the fork start method; using threads instead")
+            return
+        old_pool = self._processes
+        self._processes = ProcessPoolExecutor(self.process_workers,
+                                              mp_context=multiprocessing.get_context('fork'))
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+
+    def stats(self):
+        """Return the current number of waiting requests per endpoint."""
+        return {name: limiter.waiting for name, limiter in self._limiters.items()}
+
+    def shutdown(self):
+        """Shut down all pools without waiting for running work."""
+        self._threads.shutdown(wait=False)
+        self._background.shutdown(wait=False)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False)
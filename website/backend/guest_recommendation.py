@@ -1,9 +1,11 @@
 import pandas as pd
 import numpy as np
 from typing import List, Dict
-from sklearn.metrics.pairwise import cosine_similarity
 from scipy.sparse import csr_matrix
 
+from precision import float_dtype
+from similarity import normalize_rows
+
 class GuestRecommendationEngine:
     """
     Engine for generating recommendations based on guest ratings.
@@ -28,19 +30,21 @@ class GuestRecommendationEngine:
         self.books_df = books_df
         self.users_df = users_df
         
-        # Create a pivot table of user ratings for faster similarity calculation
-        pivot_df = self.ratings_df.pivot(
-            index='User-ID',
-            columns='ISBN',
-            values='Book-Rating'
-        ).fillna(0)
-        
-        # Convert to sparse matrix for efficiency
-        self.user_item_matrix = csr_matrix(pivot_df.values)
-        self.user_id_map = {i: user_id for i, user_id in enumerate(pivot_df.index)}
-        self.isbn_map = {i: isbn for i, isbn in enumerate(pivot_df.columns)}
-        self.isbn_to_idx = {isbn: i for i, isbn in enumerate(pivot_df.columns)}
-        self.n_users, self.n_items = self.user_item_matrix.shape
+        # Build the sparse user-item rating matrix directly (no dense pivot),
+        # with users and books in sorted order
+        user_codes, user_ids = pd.factorize(self.ratings_df['User-ID'], sort=True)
+        isbn_codes, isbns = pd.factorize(self.ratings_df['ISBN'], sort=True)
+        user_item_matrix = csr_matrix(
+            (self.ratings_df['Book-Rating'].to_numpy(dtype=float_dtype()), (user_codes, isbn_codes)),
+            shape=(len(user_ids), len(isbns))
+        )
+        
+        # Store the rows L2-normalised once, so each guest query is one sparse dot product
+        self.user_vectors = normalize_rows(user_item_matrix)
+        self.user_id_map = {i: user_id for i, user_id in enumerate(user_ids)}
+        self.isbn_map = {i: isbn for i, isbn in enumerate(isbns)}
+        self.isbn_to_idx = {isbn: i for i, isbn in enumerate(isbns)}
+        self.n_users, self.n_items = self.user_vectors.shape
     
     def find_similar_users(self, guest_ratings: Dict[str, int], k: int = 10) -> List[int]:
         """
@@ -74,10 +78,12 @@ class GuestRecommendationEngine:
         if valid_ratings_count == 0:
             return [] # Guest rated books not in our dataset
             
-        guest_vector = csr_matrix((guest_data, (guest_row_indices, guest_col_indices)), shape=(1, self.n_items))
+        guest_vector = normalize_rows(csr_matrix(
+            (guest_data, (guest_row_indices, guest_col_indices)), shape=(1, self.n_items), dtype=self.user_vectors.dtype
+        ))
         
         # Calculate cosine similarity between guest and all users (vectorized)
-        similarities = cosine_similarity(guest_vector, self.user_item_matrix)[0] # Get the first (and only) row
+        similarities = (self.user_vectors @ guest_vector.T).toarray().ravel()
         
         # Get indices of top k similar users (excluding the guest itself if they were somehow in the matrix)
         # Argsort returns indices that would sort the array in ascending order
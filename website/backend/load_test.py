@@ -0,0 +1,416 @@
+"""
+Load-testing harness for the Book Bud API.
+
+Starts the API locally on synthetic (or given) data, waits for the models to
+be ready, then replays a weighted traffic mix at a fixed concurrency over
+keep-alive connections and reports throughput, p50/p95/p99 latency per
+endpoint and the server's resident memory. Runs entirely offline.
+
+By default the server runs on a thread of this process (so its RSS includes
+the load generator); --server process runs it in a separate process instead.
+
+Example:
+    python load_test.py --ratings 100000 --concurrency 16 --requests 5000
+    python load_test.py --data /path/to/csvs --mix popular=1,content=4,cf=4 --duration 60 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+# Make the recommendation modules importable when run from the backend directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Relative frequency of each kind of request when --mix is not given
+DEFAULT_MIX = {'popular': 3, 'search': 1, 'content': 3, 'cf': 2, 'guest': 1}
+
+
+def rss_bytes(pid=None):
+    """Resident set size of a process in bytes (None if unavailable)."""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _server_environment(data_dir):
+    return {
+        'BOOKBUD_DATA_DIR': data_dir,
+        # Fit in the server process so startup does not depend on spawning a build process
+        'BOOKBUD_BUILD_IN_PROCESS': os.environ.get('BOOKBUD_BUILD_IN_PROCESS', '0'),
+    }
+
+
+def _serve(port, environment):
+    """Entry point of the --server process child."""
+    os.environ.update(environment)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import uvicorn
+    uvicorn.run("app:app", host="127.0.0.1", port=port, log_level="warning")
+
+
+class LocalServer:
+    """The API served on a local port, on a thread of this process or in a child process."""
+
+    def __init__(self, data_dir, mode='thread'):
+        self.port = _free_port()
+        self.mode = mode
+        self.environment = _server_environment(data_dir)
+        self._server = None
+        self._thread = None
+        self._process = None
+
+    @property
+    def pid(self):
+        return self._process.pid if self._process is not None else os.getpid()
+
+    def start(self):
+        if self.mode == 'process':
+            context = multiprocessing.get_context('spawn')
+            self._process = context.Process(target=_serve, args=(self.port, self.environment), daemon=True)
+            self._process.start()
+            return self
+
+        os.environ.update(self.environment)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import uvicorn
+        config = uvicorn.Config("app:app", host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=30)
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join(timeout=30)
+
+
+class Connection:
+    """Minimal keep-alive HTTP/1.1 client connection (stdlib only)."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None):
+        """Send a request and return (status, body bytes)."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        headers = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        if body is not None:
+            headers += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        self.writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + (body or b""))
+        try:
+            return await self._read_response()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            body = b"".join(chunks)
+        else:
+            body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def parse_mix(value):
+    """Parse "kind=weight,..." into a dictionary of traffic weights."""
+    mix = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise ValueError(f"Unknown request kind: {kind} (expected one of {', '.join(DEFAULT_MIX)})")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def build_traffic(data_dir, mix, n_requests, seed=0):
+    """
+    Build a deterministic request sequence following the traffic mix.
+
+    Queries concentrate on the most rated books and most active users, as
+    real traffic does.
+
+    Returns:
+    --------
+    list of tuple
+        (kind, method, path, body) for each request
+    """
+    rng = np.random.default_rng(seed)
+    ratings = pd.read_csv(os.path.join(data_dir, 'Ratings.csv'), encoding='latin-1',
+                          on_bad_lines='skip', low_memory=False)
+    books = pd.read_csv(os.path.join(data_dir, 'Books.csv'), encoding='latin-1',
+                        on_bad_lines='skip', low_memory=False)
+    ratings['ISBN'] = ratings['ISBN'].astype(str)
+    explicit = ratings[ratings['Book-Rating'] > 0]
+
+    isbns = explicit['ISBN'].value_counts().index[:1000].to_numpy()
+    # Users the collaborative model keeps: 10+ ratings of books with 5+ ratings
+    book_counts = explicit['ISBN'].value_counts()
+    users = explicit[explicit['ISBN'].isin(book_counts[book_counts >= 5].index)]['User-ID'].value_counts()
+    users = users[users >= 10].index[:1000].to_numpy()
+    titles = books[books['ISBN'].astype(str).isin(isbns[:200])]['Book-Title'].astype(str)
+    words = pd.Series(' '.join(titles).split())
+    words = words[words.str.len() >= 4].unique()
+
+    def popular(n):
+        # Zipf-like preference for the first (most popular) entries
+        weights = 1.0 / np.arange(1, n + 1)
+        return rng.choice(n, p=weights / weights.sum())
+
+    def make(kind):
+        if kind == 'popular':
+            criteria = rng.choice(['popularity_score', 'rating_count', 'rating_mean'])
+            return 'GET', f"/popular-books?limit=10&criteria={criteria}", None
+        if kind == 'search':
+            word = words[popular(len(words))] if len(words) else 'book'
+            return 'GET', f"/search-books?query={urllib.parse.quote(str(word).lower())}&limit=20", None
+        if kind == 'content':
+            return 'GET', f"/content-based?isbn={urllib.parse.quote(isbns[popular(len(isbns))])}&limit=10", None
+        if kind == 'cf':
+            method = rng.choice(['user', 'item', 'hybrid'])
+            user_id = users[popular(len(users))] if len(users) else 1
+            return 'GET', f"/collaborative-filtering?user_id={user_id}&method={method}&limit=10", None
+        chosen = rng.choice(isbns[:200], size=rng.integers(3, 6), replace=False)
+        body = {'ratings': [{'isbn': str(isbn), 'rating': int(rng.integers(6, 11))} for isbn in chosen], 'limit': 10}
+        return 'POST', "/guest-recommendations", json.dumps(body).encode()
+
+    kinds = list(mix)
+    weights = np.array([mix[kind] for kind in kinds], dtype=float)
+    sequence = rng.choice(len(kinds), n_requests, p=weights / weights.sum())
+    return [(kinds[i],) + make(kinds[i]) for i in sequence]
+
+
+async def wait_until_ready(port, timeout):
+    """Poll /status until the models are loaded."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = Connection('127.0.0.1', port)
+        try:
+            status, body = await connection.request('GET', '/status')
+            if status == 200 and json.loads(body).get('models_initialized'):
+                return True
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            connection.close()
+        await asyncio.sleep(0.5)
+    return False
+
+
+async def replay(port, traffic, concurrency, duration=None):
+    """
+    Replay traffic with a fixed number of concurrent connections.
+
+    Returns:
+    --------
+    tuple
+        (list of (kind, status, seconds) samples, elapsed seconds)
+    """
+    samples = []
+    position = 0
+    started = time.perf_counter()
+
+    def next_request():
+        nonlocal position
+        if duration is not None and time.perf_counter() - started > duration:
+            return None
+        if position >= len(traffic):
+            if duration is None:
+                return None
+            position = 0
+        request = traffic[position]
+        position += 1
+        return request
+
+    async def worker():
+        connection = Connection('127.0.0.1', port)
+        try:
+            while True:
+                request = next_request()
+                if request is None:
+                    return
+                kind, method, path, body = request
+                sent = time.perf_counter()
+                try:
+                    status, _ = await connection.request(method, path, body)
+                except (OSError, asyncio.IncompleteReadError):
+                    status = 0
+                samples.append((kind, status, time.perf_counter() - sent))
+        finally:
+            connection.close()
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return samples, time.perf_counter() - started
+
+
+async def sample_memory(pid, peak, stop):
+    """Track the peak RSS of pid until stop is set."""
+    while not stop.is_set():
+        rss = rss_bytes(pid)
+        if rss is not None:
+            peak[0] = max(peak[0], rss)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.25)
+        except asyncio.TimeoutError:
+            pass
+
+
+def summarize(samples, elapsed):
+    """Throughput and latency percentiles, overall and per request kind."""
+    def stats(rows):
+        seconds = np.array([row[2] for row in rows])
+        errors = sum(1 for row in rows if not 200 <= row[1] < 400)
+        return {
+            'requests': len(rows),
+            'errors': errors,
+            'rps': len(rows) / elapsed if elapsed else None,
+            'p50_ms': float(np.percentile(seconds, 50) * 1000),
+            'p95_ms': float(np.percentile(seconds, 95) * 1000),
+            'p99_ms': float(np.percentile(seconds, 99) * 1000),
+            'max_ms': float(seconds.max() * 1000),
+        }
+
+    summary = {'overall': stats(samples), 'endpoints': {}}
+    for kind in sorted({row[0] for row in samples}):
+        summary['endpoints'][kind] = stats([row for row in samples if row[0] == kind])
+    return summary
+
+
+def print_report(summary, memory):
+    print(f"\n{'endpoint':10s} {'requests':>9s} {'errors':>7s} {'rps':>9s} "
+          f"{'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'max ms':>9s}")
+    rows = list(summary['endpoints'].items()) + [('overall', summary['overall'])]
+    for kind, stats in rows:
+        print(f"{kind:10s} {stats['requests']:9d} {stats['errors']:7d} {stats['rps']:9.1f} "
+              f"{stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f} {stats['max_ms']:9.2f}")
+    mb = lambda value: f"{value / 2 ** 20:.0f} MB" if value else "n/a"
+    print(f"\nServer RSS: {mb(memory['ready_rss_bytes'])} when ready, {mb(memory['peak_rss_bytes'])} peak")
+
+
+async def run_load_test(server, traffic, args):
+    print("Waiting for the models to load...")
+    startup = time.perf_counter()
+    if not await wait_until_ready(server.port, args.startup_timeout):
+        raise RuntimeError(f"Server was not ready after {args.startup_timeout}s")
+    startup = time.perf_counter() - startup
+    print(f"Server ready in {startup:.1f}s")
+
+    if args.warmup:
+        await replay(server.port, traffic[:args.warmup], args.concurrency)
+
+    memory = {'ready_rss_bytes': rss_bytes(server.pid)}
+    peak = [memory['ready_rss_bytes'] or 0]
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(sample_memory(server.pid, peak, stop))
+    samples, elapsed = await replay(server.port, traffic, args.concurrency, args.duration)
+    stop.set()
+    await sampler
+    memory['peak_rss_bytes'] = peak[0] or None
+    return samples, elapsed, startup, memory
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the Book Bud API on a local server")
+    parser.add_argument('--data', help="Directory with Books.csv, Ratings.csv and Users.csv "
+                                       "(default: generate a synthetic dataset)")
+    parser.add_argument('--ratings', type=int, default=100000, help="Synthetic ratings to generate")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the data generator and traffic")
+    parser.add_argument('--mix', default=','.join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                        help="Traffic weights, e.g. popular=3,search=1,content=3,cf=2,guest=1")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent connections")
+    parser.add_argument('--requests', type=int, default=2000, help="Requests to send (cycled with --duration)")
+    parser.add_argument('--duration', type=float, default=None, help="Run for this many seconds instead")
+    parser.add_argument('--warmup', type=int, default=100, help="Unmeasured requests sent first")
+    parser.add_argument('--server', choices=['thread', 'process'], default='thread',
+                        help="Run the server on a thread of this process or in a child process")
+    parser.add_argument('--startup-timeout', type=float, default=600, help="Seconds to wait for the models")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data
+        if not data_dir:
+            from synthetic_data import generate_dataset, write_dataset
+            print(f"Generating a synthetic dataset with {args.ratings} ratings...")
+            write_dataset(tmp, *generate_dataset(args.ratings, seed=args.seed))
+            data_dir = tmp
+
+        traffic = build_traffic(data_dir, mix, max(args.requests, args.warmup), seed=args.seed)
+        server = LocalServer(os.path.abspath(data_dir), mode=args.server).start()
+        try:
+            samples, elapsed, startup, memory = asyncio.run(run_load_test(server, traffic, args))
+        finally:
+            server.stop()
+
+    summary = summarize(samples, elapsed)
+    print_report(summary, memory)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created_at': time.time(),
+                'config': vars(args),
+                'startup_seconds': startup,
+                'elapsed_seconds': elapsed,
+                'memory': memory,
+                'summary': summary,
+            }, f, indent=2)
+        print(f"Wrote results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
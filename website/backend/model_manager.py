@@ -0,0 +1,543 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import pickle
+import queue as queue_module
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, NamedTuple
+
+from instrumentation import collect_fit_stages, observe_fit_stages
+
+
+# Readiness stages, built and published in this order, and the models each brings online
+MODEL_STAGES = (
+    ('base', ('popularity_based', 'search', 'demographic')),
+    ('content', ('content_based',)),
+    ('collaborative', ('collaborative_filtering', 'hybrid', 'guest')),
+    ('implicit', ('implicit',)),
+)
+
+# Rough duration of each stage (seconds) on the full dataset, used for readiness
+# ETAs until a build has been timed
+DEFAULT_STAGE_SECONDS = {'base': 30.0, 'content': 60.0, 'collaborative': 90.0, 'implicit': 30.0}
+
+# Neighbours kept per user/book by the CF and content models (0 keeps the exact dense similarities)
+NEIGHBOURS = int(os.environ.get('BOOKBUD_NEIGHBOURS', 0)) or None
+# Similarity metrics of the CF model (see CollaborativeFilteringRecommender.USER_METRICS/ITEM_METRICS)
+USER_SIMILARITY = os.environ.get('BOOKBUD_USER_SIMILARITY', 'pearson')
+ITEM_SIMILARITY = os.environ.get('BOOKBUD_ITEM_SIMILARITY', 'cosine')
+# Shrinkage of CF similarities with few co-ratings, and the co-ratings a similar pair needs
+SHRINKAGE = float(os.environ.get('BOOKBUD_SHRINKAGE', 0))
+MIN_SUPPORT = int(os.environ.get('BOOKBUD_MIN_SUPPORT', 1))
+# Interaction weighting and neighbours per book of the implicit feedback model
+IMPLICIT_WEIGHTING = os.environ.get('BOOKBUD_IMPLICIT_WEIGHTING', 'bm25')
+IMPLICIT_NEIGHBOURS = int(os.environ.get('BOOKBUD_IMPLICIT_NEIGHBOURS', 50))
+
+
+class ModelBundle(NamedTuple):
+    """
+    Complete, immutable set of fitted models served together.
+    Request handlers read the current bundle once and use it for the whole
+    request, so they never see a mix of old and new models.
+
+    While the first bundle is built, partial bundles are published after each
+    readiness stage; their pending field names the models still loading.
+    """
+    preprocessor: Any
+    content_recommender: Any
+    collaborative_recommender: Any
+    popularity_recommender: Any
+    guest_recommender: Any
+    book_store: Any
+    built_at: float
+    version: int = 0
+    hybrid_recommender: Any = None
+    fit_stages: Any = None
+    pending: tuple = ()
+    stage_seconds: Any = None
+    implicit_recommender: Any = None
+    demographic_recommender: Any = None
+
+    def is_ready(self, model):
+        """Whether a model (as named in MODEL_STAGES) has been built."""
+        return model not in self.pending
+
+
+class ModelNotReady(Exception):
+    """Raised when a request needs a model that is still being built."""
+
+    def __init__(self, model, eta_seconds=None):
+        super().__init__(f"The {model} model is still loading")
+        self.model = model
+        self.eta_seconds = eta_seconds
+
+
+def _pending_after(stage):
+    """Models of the stages after the given one."""
+    names = [name for name, _ in MODEL_STAGES]
+    return tuple(model for _, models in MODEL_STAGES[names.index(stage) + 1:] for model in models)
+
+
+def build_model_bundle_stages(books_path, ratings_path, users_path):
+    """
+    Load the data and fit the models stage by stage (see MODEL_STAGES).
+
+    Parameters:
+    -----------
+    books_path, ratings_path, users_path : str
+        Paths to the dataset files
+
+    Yields:
+    -------
+    tuple
+        (stage name, ModelBundle) after each stage; models of later stages
+        are None and listed in the bundle's pending field, and the last
+        bundle is complete. fit_stages and stage_seconds accumulate.
+    """
+    # Imported here so that importing this module (and starting the API) does not
+    # load pandas and scikit-learn; they are needed only where models are fit
+    from data_preprocessing import DataPreprocessor
+    from content_based import ContentBasedRecommender
+    from collaborative_filtering import CollaborativeFilteringRecommender
+    from popularity_based import PopularityRecommender
+    from demographic_based import DemographicRecommender
+    from hybrid_recommender import HybridRecommender
+    from implicit_feedback import ImplicitFeedbackRecommender
+    from book_serialization import BookJSONStore
+
+    fit_stages = {}
+    stage_seconds = {}
+
+    def finish(stage, bundle, stages, started):
+        fit_stages.update(stages)
+        stage_seconds[stage] = time.time() - started
+        return stage, bundle._replace(built_at=time.time(), fit_stages=dict(fit_stages),
+                                      pending=_pending_after(stage), stage_seconds=dict(stage_seconds))
+
+    started = time.time()
+    with collect_fit_stages() as stages:
+        print("Loading and preprocessing data...")
+        preprocessor = DataPreprocessor(books_path, ratings_path, users_path)
+        preprocessor.load_data().clean_books_data().clean_ratings_data().clean_users_data().merge_data()
+
+        # Initialize popularity-based recommender
+        popularity_recommender = PopularityRecommender(preprocessor.ratings_processed, preprocessor.books_processed)
+        popularity_recommender.fit()
+
+        # Precompute segment popularity for new and anonymous users
+        demographic_recommender = DemographicRecommender(
+            preprocessor.ratings_processed, preprocessor.books_processed, preprocessor.users_processed
+        )
+        demographic_recommender.fit()
+
+        # Pre-encode book metadata for response serialisation
+        book_store = BookJSONStore(preprocessor.books_processed)
+    bundle = ModelBundle(
+        preprocessor=preprocessor,
+        content_recommender=None,
+        collaborative_recommender=None,
+        popularity_recommender=popularity_recommender,
+        guest_recommender=None,
+        book_store=book_store,
+        built_at=time.time(),
+        demographic_recommender=demographic_recommender,
+    )
+    yield finish('base', bundle, stages, started)
+
+    started = time.time()
+    with collect_fit_stages() as stages:
+        print("Initializing recommendation models...")
+        # Initialize content-based recommender
+        content_recommender = ContentBasedRecommender(preprocessor.books_processed)
+        content_recommender.fit(neighbours=NEIGHBOURS)
+    bundle = bundle._replace(content_recommender=content_recommender)
+    yield finish('content', bundle, stages, started)
+
+    started = time.time()
+    with collect_fit_stages() as stages:
+        # Initialize collaborative filtering recommender
+        collaborative_recommender = CollaborativeFilteringRecommender(
+            preprocessor.ratings_processed, preprocessor.books_processed
+        )
+        collaborative_recommender.fit(min_user_ratings=10, min_book_ratings=5, neighbours=NEIGHBOURS,
+                                      user_metric=USER_SIMILARITY, item_metric=ITEM_SIMILARITY,
+                                      shrinkage=SHRINKAGE, min_support=MIN_SUPPORT)
+
+        # Initialize the hybrid recommender over the shared item index
+        hybrid_recommender = HybridRecommender(
+            content_recommender, collaborative_recommender, popularity_recommender,
+            preprocessor.books_processed
+        )
+        hybrid_recommender.fit()
+
+        # Import and initialize the guest recommendation engine
+        try:
+            from guest_recommendation import GuestRecommendationEngine
+            guest_recommender = GuestRecommendationEngine(
+                preprocessor.ratings_processed,
+                preprocessor.books_processed,
+                preprocessor.users_processed
+            )
+            print("Guest recommendation engine initialized successfully!")
+        except Exception as e:
+            print(f"Error initializing guest recommendation engine: {e}")
+            guest_recommender = None
+    bundle = bundle._replace(collaborative_recommender=collaborative_recommender,
+                             hybrid_recommender=hybrid_recommender, guest_recommender=guest_recommender)
+    yield finish('collaborative', bundle, stages, started)
+
+    started = time.time()
+    with collect_fit_stages() as stages:
+        # Initialize the implicit feedback recommender on the full interaction log
+        implicit_recommender = ImplicitFeedbackRecommender(preprocessor.ratings_df, preprocessor.books_processed)
+        implicit_recommender.fit(weighting=IMPLICIT_WEIGHTING, neighbours=IMPLICIT_NEIGHBOURS)
+    bundle = bundle._replace(implicit_recommender=implicit_recommender)
+    yield finish('implicit', bundle, stages, started)
+
+
+def build_model_bundle(books_path, ratings_path, users_path):
+    """
+    Load the data and fit every recommendation model, recording how long
+    each fit stage took in the bundle's fit_stages.
+
+    Parameters:
+    -----------
+    books_path : str
+        Path to the Books.csv file
+    ratings_path : str
+        Path to the Ratings.csv file
+    users_path : str
+        Path to the Users.csv file
+
+    Returns:
+    --------
+    ModelBundle
+        Fitted models (version 0 until published by a ModelManager)
+    """
+    bundle = None
+    for _, bundle in build_model_bundle_stages(books_path, ratings_path, users_path):
+        pass
+    return bundle
+
+
+def save_bundle(bundle, path):
+    """Pickle a model bundle to disk, replacing any existing file atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(bundle, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def load_bundle(path):
+    """Load a model bundle pickled by save_bundle."""
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_stage_seconds(stage_seconds, bundle_path):
+    """Save the stage durations of a build to "<bundle_path>.stages.json"."""
+    path = f"{bundle_path}.stages.json"
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(stage_seconds, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def load_stage_seconds(bundle_path):
+    """Stage durations saved by save_stage_seconds ({} if none were saved)."""
+    try:
+        with open(f"{bundle_path}.stages.json") as f:
+            return {stage: float(seconds) for stage, seconds in json.load(f).items()}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def build_and_save_bundle(books_path, ratings_path, users_path, path, queue, save_stages=False):
+    """
+    Build a model bundle and save it to path (entry point of the build process).
+
+    Sends ('stage', stage, bundle path) on queue for every saved bundle, and
+    ('error', message, None) if building fails. With save_stages, the partial
+    bundle of each readiness stage is saved to "<path>.<stage>" as well.
+    """
+    try:
+        for stage, bundle in build_model_bundle_stages(books_path, ratings_path, users_path):
+            if not bundle.pending:
+                queue.put(('stage', stage, save_bundle(bundle, path)))
+            elif save_stages:
+                queue.put(('stage', stage, save_bundle(bundle, f"{path}.{stage}")))
+    except Exception as e:
+        queue.put(('error', str(e), None))
+
+
+class ModelManager:
+    """
+    Owns the model bundle served by the API.
+
+    New bundles are built in a separate process (or loaded from disk) and
+    published with a single reference assignment, so a rebuild never blocks
+    or slows down in-flight requests.
+    """
+
+    def __init__(self, books_path, ratings_path, users_path, bundle_path=None,
+                 build_in_process=True, run_background=None):
+        """
+        Initialize the model manager.
+
+        Parameters:
+        -----------
+        books_path, ratings_path, users_path : str
+            Paths to the dataset files
+        bundle_path : str, optional
+            File used to persist built bundles; an existing file is loaded at
+            startup instead of rebuilding
+        build_in_process : bool
+            Whether to fit models in a child process; otherwise they are fit
+            on the background executor of the serving process
+        run_background : coroutine function, optional
+            Runs a blocking callable off the event loop, e.g.
+            ExecutorLayer.run_background (defaults to the loop's executor)
+        """
+        self.books_path = books_path
+        self.ratings_path = ratings_path
+        self.users_path = users_path
+        self.bundle_path = bundle_path
+        self.build_in_process = build_in_process
+        self._run_background = run_background or self._run_in_default_executor
+        self._bundle = None
+        self._version = 0
+        self._listeners = []
+        self._refresh_lock = None
+        self.last_error = None
+        # Progress of the staged build of the first bundle, and the latest known duration of each stage
+        self._progress = None
+        self._stage_history = dict(DEFAULT_STAGE_SECONDS)
+        if bundle_path:
+            self._stage_history.update(load_stage_seconds(bundle_path))
+
+    @classmethod
+    def from_env(cls, books_path, ratings_path, users_path, run_background=None):
+        """
+        Create a model manager configured from environment variables:
+        BOOKBUD_MODEL_BUNDLE (bundle file) and BOOKBUD_BUILD_IN_PROCESS ("0" to
+        fit in the serving process).
+        """
+        return cls(
+            books_path, ratings_path, users_path,
+            bundle_path=os.environ.get('BOOKBUD_MODEL_BUNDLE') or None,
+            build_in_process=os.environ.get('BOOKBUD_BUILD_IN_PROCESS', '1') != '0',
+            run_background=run_background,
+        )
+
+    @staticmethod
+    async def _run_in_default_executor(fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    @property
+    def current(self):
+        """The currently published ModelBundle, or None before the first load."""
+        return self._bundle
+
+    def add_listener(self, callback):
+        """Register callback(bundle), called after every bundle swap."""
+        self._listeners.append(callback)
+
+    def publish(self, bundle):
+        """Publish a bundle, replacing the current one in a single assignment."""
+        self._version += 1
+        bundle = bundle._replace(version=self._version)
+        self._bundle = bundle
+        for callback in self._listeners:
+            callback(bundle)
+        return bundle
+
+    def _build_in_child(self, on_stage=None):
+        """Fit the models in a fresh process and return the complete bundle."""
+        path = self.bundle_path
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.bundle')
+            os.close(fd)
+        context = multiprocessing.get_context('spawn')
+        messages = context.Queue()
+        process = context.Process(target=build_and_save_bundle, args=(
+            self.books_path, self.ratings_path, self.users_path, path, messages, on_stage is not None))
+        process.start()
+        try:
+            while True:
+                try:
+                    kind, stage, stage_path = messages.get(timeout=1)
+                except queue_module.Empty:
+                    if not process.is_alive():
+                        raise RuntimeError(f"Model build process exited with code {process.exitcode}")
+                    continue
+                if kind == 'error':
+                    raise RuntimeError(stage)
+                try:
+                    bundle = load_bundle(stage_path)
+                finally:
+                    if stage_path != self.bundle_path:
+                        os.remove(stage_path)
+                if not bundle.pending:
+                    return bundle
+                on_stage(stage, bundle)
+        finally:
+            process.join()
+
+    def _build(self, on_stage=None):
+        """
+        Build a bundle (blocking), in a child process when configured.
+
+        on_stage(stage, bundle) is called with the partial bundle of each
+        readiness stage before the complete bundle is returned. With a
+        bundle_path, the stage durations are saved next to it for the ETAs
+        of the next start.
+        """
+        if self.build_in_process:
+            bundle = self._build_in_child(on_stage)
+        else:
+            for stage, bundle in build_model_bundle_stages(self.books_path, self.ratings_path, self.users_path):
+                if bundle.pending:
+                    if on_stage is not None:
+                        on_stage(stage, bundle)
+                    continue
+                if self.bundle_path:
+                    save_bundle(bundle, self.bundle_path)
+                break
+        if self.bundle_path and bundle.stage_seconds:
+            save_stage_seconds(bundle.stage_seconds, self.bundle_path)
+        return bundle
+
+    def _publish_stage(self, stage, bundle):
+        """Publish a partial bundle unless a complete bundle is already served."""
+        self._progress['completed'][stage] = time.time()
+        if bundle.stage_seconds and stage in bundle.stage_seconds:
+            self._stage_history[stage] = bundle.stage_seconds[stage]
+        if self._bundle is not None and not self._bundle.pending:
+            return
+        bundle = self.publish(bundle)
+        print(f"Published partial model bundle after the {stage} stage "
+              f"(still loading: {', '.join(bundle.pending)})")
+
+    def readiness(self):
+        """
+        Readiness of each model and the estimated seconds until it is ready.
+
+        Estimates use the latest timed duration of each stage (from this
+        build, the previous one or the durations saved next to bundle_path),
+        falling back to DEFAULT_STAGE_SECONDS.
+
+        Returns:
+        --------
+        dict
+            state ('loading', 'partial' or 'ready'), build start time and, per
+            model, whether it is ready, when it became ready and its ETA
+        """
+        bundle = self._bundle
+        progress = self._progress
+        now = time.time()
+        state = 'loading' if bundle is None else ('partial' if bundle.pending else 'ready')
+
+        models = {}
+        eta = 0.0
+        stage_started = None
+        if progress is not None:
+            stage_started = max(progress['completed'].values(), default=progress['started_at'])
+        for stage, stage_models in MODEL_STAGES:
+            ready = bundle is not None and all(bundle.is_ready(model) for model in stage_models)
+            ready_at = progress['completed'].get(stage) if progress is not None else None
+            if ready:
+                stage_eta = 0.0
+            elif eta is None or progress is None or stage not in self._stage_history:
+                eta = stage_eta = None
+            else:
+                # Time left of the stage being built, plus the full duration of the ones after it
+                elapsed = now - stage_started if stage_started is not None else 0.0
+                eta += max(self._stage_history[stage] - elapsed, 0.0)
+                stage_started = None
+                stage_eta = eta
+            for model in stage_models:
+                models[model] = {'ready': ready, 'ready_at': ready_at, 'eta_seconds': stage_eta}
+
+        return {
+            'state': state,
+            'build_started_at': progress['started_at'] if progress is not None else None,
+            'models': models,
+        }
+
+    def eta(self, model):
+        """Estimated seconds until a model is ready (None if unknown)."""
+        return self.readiness()['models'].get(model, {}).get('eta_seconds')
+
+    async def refresh(self, from_disk=False):
+        """
+        Build (or load) a new bundle off the event loop and publish it.
+
+        While no complete bundle is served, the partial bundle of each
+        readiness stage is published as soon as it is built, so cheap models
+        serve requests while the expensive ones are still fitting.
+
+        Parameters:
+        -----------
+        from_disk : bool
+            Load bundle_path instead of building, if that file exists
+
+        Returns:
+        --------
+        ModelBundle or None
+            The published bundle, or None if building failed (the previous
+            bundle keeps serving)
+        """
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            started = time.time()
+            try:
+                if from_disk and self.bundle_path and os.path.exists(self.bundle_path):
+                    print(f"Loading model bundle from {self.bundle_path}...")
+                    bundle = await self._run_background(load_bundle, self.bundle_path)
+                else:
+                    print("Building model bundle...")
+                    on_stage = None
+                    if self._bundle is None or self._bundle.pending:
+                        loop = asyncio.get_running_loop()
+                        self._progress = {'started_at': started, 'completed': {}}
+                        on_stage = lambda stage, partial: loop.call_soon_threadsafe(
+                            self._publish_stage, stage, partial)
+                    bundle = await self._run_background(self._build, on_stage)
+                    observe_fit_stages(bundle.fit_stages)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Error building model bundle: {e}")
+                return None
+
+            self.last_error = None
+            if bundle.stage_seconds:
+                self._stage_history.update(bundle.stage_seconds)
+            if self._progress is not None:
+                self._progress['completed'][MODEL_STAGES[-1][0]] = time.time()
+            bundle = self.publish(bundle)
+            print(f"Published model bundle version {bundle.version} in {time.time() - started:.1f}s")
+            return bundle
+
+    async def run_periodic(self, interval):
+        """Rebuild the bundle every interval seconds (run as a background task)."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh()
@@ -0,0 +1,144 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+
+class RecommendationStore:
+    """
+    Read-only, memory-mapped table of precomputed top-N recommendations,
+    as written by bulk_recommendations.py.
+    Collaborative filtering methods are keyed by user ID, content-based
+    methods by ISBN.
+    """
+
+    def __init__(self, directory):
+        """
+        Open a recommendation store.
+
+        Parameters:
+        -----------
+        directory : str
+            Output directory of bulk_recommendations.py
+        """
+        self.directory = directory
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.top_n = self.manifest['top_n']
+        self.model_built_at = self.manifest.get('model_built_at')
+
+        self.vocabulary = np.load(os.path.join(directory, 'items.npy'), mmap_mode='r')
+        self._isbn_positions = None
+
+        self.tables = {}
+        for method, info in self.manifest['methods'].items():
+            method_dir = os.path.join(directory, method)
+            self.tables[method] = {
+                'key': info['key'],
+                'keys': np.load(os.path.join(method_dir, 'keys.npy'), mmap_mode='r'),
+                'items': np.load(os.path.join(method_dir, 'items.npy'), mmap_mode='r'),
+                'scores': np.load(os.path.join(method_dir, 'scores.npy'), mmap_mode='r'),
+            }
+
+        self.hits = {method: 0 for method in self.tables}
+        self.misses = {method: 0 for method in self.tables}
+        self.lookup_seconds = {method: 0.0 for method in self.tables}
+        self.live_seconds = {method: 0.0 for method in self.tables}
+
+    @classmethod
+    def from_env(cls):
+        """Open the store named by BOOKBUD_RECOMMENDATION_STORE, or return None."""
+        directory = os.environ.get('BOOKBUD_RECOMMENDATION_STORE')
+        if not directory:
+            return None
+        try:
+            store = cls(directory)
+            print(f"Loaded recommendation store from {directory} ({', '.join(store.tables)})")
+            return store
+        except Exception as e:
+            print(f"Error loading recommendation store from {directory}: {e}")
+            return None
+
+    def matches(self, bundle):
+        """Whether the store was generated from the given model bundle."""
+        return bundle is not None and self.model_built_at == bundle.built_at
+
+    def _row(self, table, key):
+        """Find the row of a key in a method table, or -1."""
+        if table['key'] == 'isbn':
+            if self._isbn_positions is None:
+                self._isbn_positions = pd.Index(np.asarray(self.vocabulary))
+            position = self._isbn_positions.get_indexer([key])[0]
+            if position < 0:
+                return -1
+            key = position
+        keys = table['keys']
+        row = np.searchsorted(keys, key)
+        if row < len(keys) and keys[row] == key:
+            return row
+        return -1
+
+    def lookup(self, method, key, n):
+        """
+        Look up the precomputed recommendations of a user or book.
+
+        Parameters:
+        -----------
+        method : str
+            Recommendation method (e.g. 'user', 'item', 'content', 'hybrid')
+        key : int or str
+            User ID, or ISBN for content-based methods
+        n : int
+            Number of recommendations wanted
+
+        Returns:
+        --------
+        numpy.ndarray or None
+            ISBNs of the top n recommendations, or None on a miss (unknown
+            method or key, n larger than the stored top-N, or fewer than n
+            stored recommendations, e.g. a padded row of a user the model could
+            not score, so that the live path and its fallbacks serve it)
+        """
+        started = time.perf_counter()
+        table = self.tables.get(method)
+        result = None
+        if table is not None and n <= self.top_n:
+            try:
+                row = self._row(table, key)
+            except (TypeError, ValueError):
+                row = -1
+            if row >= 0:
+                items = np.asarray(table['items'][row, :n])
+                items = items[items >= 0]
+                if len(items) == n:
+                    result = np.asarray(self.vocabulary[items])
+
+        if table is not None:
+            self.lookup_seconds[method] += time.perf_counter() - started
+            if result is None:
+                self.misses[method] += 1
+            else:
+                self.hits[method] += 1
+        return result
+
+    def record_live(self, method, seconds):
+        """Record the latency of a live computation made after a miss."""
+        if method in self.live_seconds:
+            self.live_seconds[method] += seconds
+
+    def stats(self):
+        """Hit rate and mean latencies per method."""
+        stats = {}
+        for method in self.tables:
+            hits, misses = self.hits[method], self.misses[method]
+            lookups = hits + misses
+            stats[method] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / lookups if lookups else None,
+                'mean_lookup_ms': 1000 * self.lookup_seconds[method] / lookups if lookups else None,
+                'mean_live_ms': 1000 * self.live_seconds[method] / misses if misses else None,
+            }
+        return stats
@@ -0,0 +1,281 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class CachedResponse:
+    """Pre-encoded response body together with its entity tag."""
+
+    __slots__ = ('body', 'etag')
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+    def matches(self, if_none_match):
+        """Check whether an If-None-Match header value matches this response."""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        # Weak comparison, as required for If-None-Match
+        return any(tag.removeprefix('W/') == self.etag for tag in candidates)
+
+
+class DiskCache:
+    """
+    Shared on-disk tier of the response cache, so that several server
+    processes pointed at the same directory reuse each other's responses.
+    Each entry is one file named by the hash of its key; its modification
+    time is used for expiry.
+    """
+
+    # Number of writes between scans that enforce max_bytes
+    PRUNE_INTERVAL = 64
+
+    def __init__(self, directory, ttl=None, max_bytes=None):
+        """
+        Initialize the disk tier.
+
+        Parameters:
+        -----------
+        directory : str
+            Directory holding the cache files (created if missing)
+        ttl : float, optional
+            Seconds an entry stays valid
+        max_bytes : int, optional
+            Approximate size limit; the oldest files are removed first
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.blake2b(repr(key).encode('utf-8'), digest_size=20).hexdigest())
+
+    def get(self, key):
+        """Return the cached body for a key, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - os.stat(path).st_mtime > self.ttl:
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key, body):
+        """Store a body for a key, replacing the file atomically."""
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Error writing response cache entry: {e}")
+            return
+        self._writes += 1
+        if self._writes % self.PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as files:
+            for entry in files:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def prune(self):
+        """Remove expired entries and the oldest ones beyond max_bytes."""
+        now = time.time()
+        entries = sorted(self._entries(), reverse=True)
+        total = 0
+        for mtime, size, path in entries:
+            total += size
+            expired = self.ttl is not None and now - mtime > self.ttl
+            if expired or (self.max_bytes is not None and total > self.max_bytes):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class ResponseCache:
+    """
+    Cache of encoded responses for endpoints whose payload only depends on
+    their parameters and the currently loaded models.
+    Entries are keyed by endpoint and parameters, expire after a TTL, are
+    evicted least recently used first when the entry or byte limit is
+    reached, and are dropped from memory on model reload. An optional disk
+    tier is consulted on in-memory misses; its entries of older models are
+    never looked up again (the parameters include the model's build time)
+    and leave it through the TTL and size limit.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=None, disk_cache=None, run_blocking=None):
+        """
+        Initialize the response cache.
+
+        Parameters:
+        -----------
+        max_entries : int
+            Maximum number of responses to keep in memory
+        max_bytes : int, optional
+            Maximum total size of the in-memory response bodies
+        ttl : float, optional
+            Seconds a response stays valid (no expiry when None)
+        disk_cache : DiskCache, optional
+            Shared second tier consulted on in-memory misses
+        run_blocking : coroutine function, optional
+            Runs the disk tier's file I/O off the event loop, e.g.
+            ExecutorLayer.run_thread (defaults to the loop's executor)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_cache = disk_cache
+        self._run_blocking = run_blocking or self._run_in_default_executor
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls, run_blocking=None):
+        """
+        Create a response cache configured from environment variables:
+        BOOKBUD_CACHE_MAX_ENTRIES, BOOKBUD_CACHE_MAX_BYTES, BOOKBUD_CACHE_TTL
+        (seconds, 0 for no expiry), BOOKBUD_CACHE_DIR (enables the disk tier)
+        and BOOKBUD_CACHE_DISK_MAX_BYTES.
+        """
+        ttl = float(os.environ.get('BOOKBUD_CACHE_TTL', 0)) or None
+        disk_cache = None
+        directory = os.environ.get('BOOKBUD_CACHE_DIR')
+        if directory:
+            disk_max_bytes = int(os.environ.get('BOOKBUD_CACHE_DISK_MAX_BYTES', 256 * 1024 * 1024)) or None
+            disk_cache = DiskCache(directory, ttl=ttl, max_bytes=disk_max_bytes)
+        return cls(
+            max_entries=int(os.environ.get('BOOKBUD_CACHE_MAX_ENTRIES', 1024)),
+            max_bytes=int(os.environ.get('BOOKBUD_CACHE_MAX_BYTES', 64 * 1024 * 1024)) or None,
+            ttl=ttl,
+            disk_cache=disk_cache,
+            run_blocking=run_blocking,
+        )
+
+    @staticmethod
+    async def _run_in_default_executor(fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    @staticmethod
+    def _key(endpoint, params):
+        return (endpoint, tuple(sorted(params.items())))
+
+    def _store(self, key, cached):
+        """Insert an entry into the memory tier and evict down to the limits (lock held)."""
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous[0].body)
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (cached, expires_at)
+        self._bytes += len(cached.body)
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.body)
+            self.evictions += 1
+
+    async def get_async(self, endpoint, params):
+        """
+        Return the cached response for an endpoint call, or None on a miss.
+        The disk tier, if any, is read off the event loop.
+
+        Parameters:
+        -----------
+        endpoint : str
+            Name of the endpoint
+        params : dict
+            Parameters the response depends on
+        """
+        key = self._key(endpoint, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                cached, expires_at = entry
+                if expires_at is None or time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return cached
+                del self._entries[key]
+                self._bytes -= len(cached.body)
+                self.expirations += 1
+
+        body = await self._run_blocking(self.disk_cache.get, key) if self.disk_cache is not None else None
+        with self._lock:
+            if body is None:
+                self.misses += 1
+                return None
+            cached = CachedResponse(body)
+            self._store(key, cached)
+            self.disk_hits += 1
+        return cached
+
+    async def put_async(self, endpoint, params, body):
+        """
+        Store an encoded response body for an endpoint call. The disk tier,
+        if any, is written off the event loop.
+
+        Returns:
+        --------
+        CachedResponse
+            Cached response body and entity tag
+        """
+        key = self._key(endpoint, params)
+        cached = CachedResponse(body)
+        with self._lock:
+            self._store(key, cached)
+        if self.disk_cache is not None:
+            await self._run_blocking(self.disk_cache.put, key, body)
+        return cached
+
+    def invalidate(self):
+        """
+        Drop all in-memory responses (called whenever the models are reloaded).
+        The disk tier is left alone: other processes may still serve the old
+        models from it, and its stale entries expire on their own.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else None,
+            }
+
+    def __len__(self):
+        return len(self._entries)